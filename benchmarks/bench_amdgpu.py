@@ -0,0 +1,56 @@
+"""
+Compare the AMD GPU reader's kept open inputs with discovering and opening the files on every
+readout, on a fake /sys/class/drm tree. Reader checks are in tests/test_amdgpu.py.
+
+Usage, from the repo directory:
+    python -m benchmarks.bench_amdgpu [--cards 4] [--iterations 2000]
+"""
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+from tests.fake_sysfs import build_amdgpu_tree
+from monitor.amdgpu import AmdGpuReader
+
+
+def read_every_time(root: str) -> dict[str, int]:
+    """what a reader without an index does, glob and open every input on each readout"""
+    values = {}
+    for path in glob.glob(os.path.join(root, "card*", "device", "hwmon", "hwmon*", "*_input")) + \
+            glob.glob(os.path.join(root, "card*", "device", "gpu_busy_percent")):
+        with open(path) as fp:
+            values[path] = int(fp.read())
+    return values
+
+
+def bench(func, iterations: int) -> float:
+    """mean seconds per call"""
+    func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        build_amdgpu_tree(root, args.cards)
+        reader = AmdGpuReader(root)
+        reader_time = bench(reader.read, args.iterations)
+        naive_time = bench(lambda: read_every_time(root), args.iterations)
+        reader.close()
+
+    print(f"{args.cards} amdgpu cards, {args.iterations} iterations")
+    print(f"open every time: {naive_time * 1e6:8.1f} us/readout")
+    print(f"kept open:       {reader_time * 1e6:8.1f} us/readout")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare psutil and the direct hwmon reader on a fake sysfs tree.
+
+Usage, from the repo directory:
+    python -m benchmarks.bench_hwmon [--chips 40] [--temps 8] [--fans 4] [--iterations 200]
+
+psutil has the hwmon path hardcoded, so its glob calls are redirected to the fake tree.
+"""
+
+import argparse
+import tempfile
+import time
+import types
+import psutil
+from psutil import _pslinux
+from tests.fake_sysfs import build_hwmon_tree
+from monitor.hwmon import HwmonReader
+from monitor.sensors_api import sensors_from_entries, readings_to_sensors
+
+
+def redirect_psutil(root: str) -> None:
+    real_glob = _pslinux.glob.glob
+
+    def fake_glob(pattern: str) -> list:
+        if pattern.startswith("/sys/class/hwmon"):
+            return real_glob(pattern.replace("/sys/class/hwmon", root, 1))
+        return []  # coretemp platform devices, thermal zones
+
+    _pslinux.glob = types.SimpleNamespace(glob=fake_glob)
+
+
+def bench(func, iterations: int) -> float:
+    """mean seconds per call"""
+    func()  # warm up, hwmon reader scans here
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chips", type=int, default=40)
+    parser.add_argument("--temps", type=int, default=8)
+    parser.add_argument("--fans", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        inputs = build_hwmon_tree(root, args.chips, args.temps, args.fans)
+        redirect_psutil(root)
+        reader = HwmonReader(root)
+
+        def psutil_path():
+            sensors_from_entries(psutil.sensors_temperatures(), "°C", "")
+            sensors_from_entries(psutil.sensors_fans(), "RPM", "fan")
+
+        def hwmon_path():
+            readings_to_sensors(reader.temperature_readings())
+            readings_to_sensors(reader.fan_readings())
+
+        psutil_names = list(sensors_from_entries(psutil.sensors_temperatures(), "°C", ""))
+        hwmon_names = list(readings_to_sensors(reader.temperature_readings()))
+        if psutil_names != hwmon_names:
+            print("warning: sensor names differ between backends")
+
+        psutil_time = bench(psutil_path, args.iterations)
+        hwmon_time = bench(hwmon_path, args.iterations)
+        reader.close()
+
+    print(f"{inputs} hwmon inputs, {args.iterations} iterations")
+    print(f"psutil: {psutil_time * 1000:8.3f} ms/readout")
+    print(f"hwmon:  {hwmon_time * 1000:8.3f} ms/readout")
+    print(f"speedup: {psutil_time / hwmon_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compare incremental md sysfs reads with parsing /proc/mdstat on every readout, on a fake md
+tree of a recorded mdstat fixture. Parser and reader checks are in tests/test_mdstat.py.
+
+Usage, from the repo directory:
+    python -m benchmarks.bench_mdstat [--iterations 2000]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from tests.fake_sysfs import build_md_tree, MDSTAT_FIXTURES_DIR
+from monitor.mdstat import MdstatReader
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(MDSTAT_FIXTURES_DIR, name)) as fp:
+        return fp.read()
+
+
+def bench(func, iterations: int) -> float:
+    """mean seconds per call"""
+    func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        mdstat_path = os.path.join(root, "mdstat")
+        shutil.copyfile(os.path.join(MDSTAT_FIXTURES_DIR, "mixed.txt"), mdstat_path)
+        sysfs_root = os.path.join(root, "block")
+        arrays = build_md_tree(sysfs_root, read_fixture("mixed.txt"))
+
+        reader = MdstatReader(mdstat_path, sysfs_root)
+        mdstat_reader = MdstatReader(mdstat_path, os.path.join(root, "missing"))
+        sysfs_time = bench(reader.readings, args.iterations)
+        mdstat_time = bench(mdstat_reader.readings, args.iterations)
+        reader.close()
+        mdstat_reader.close()
+
+    print(f"{arrays} md arrays, {args.iterations} iterations")
+    print(f"mdstat parse: {mdstat_time * 1e6:8.1f} us/readout")
+    print(f"md sysfs:     {sysfs_time * 1e6:8.1f} us/readout")
+
+
+if __name__ == "__main__":
+    main()
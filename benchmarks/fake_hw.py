@@ -0,0 +1,165 @@
+"""Deterministic fake psutil and pynvml providers for benchmarks."""
+
+import math
+import time
+from collections import namedtuple
+
+shwtemp = namedtuple("shwtemp", ["label", "current", "high", "critical"])
+sfan = namedtuple("sfan", ["label", "current"])
+scputimes = namedtuple("scputimes", ["user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal",
+                                     "guest", "guest_nice"])
+svmem = namedtuple("svmem", ["total", "available", "percent", "used", "free"])
+sswap = namedtuple("sswap", ["total", "used", "free", "percent"])
+sdiskio = namedtuple("sdiskio", ["read_bytes", "write_bytes"])
+snetio = namedtuple("snetio", ["bytes_sent", "bytes_recv"])
+MEMORY_TOTAL = 64 * 1024 ** 3
+UPTIME = 36 * 3600
+
+
+def disk_names(disks: int) -> list[str]:
+    return [f"sd{chr(ord('a') + i)}" for i in range(disks)]
+
+
+def nic_names(nics: int) -> list[str]:
+    return ["lo"] + [f"eth{i}" for i in range(nics)]
+
+
+class FakePsutil:
+    """psutil stand in with a fixed set of hwmon chips and system counters, readings drift on every call"""
+    def __init__(self, chips: int, temps_per_chip: int, fans_per_chip: int,
+                 cores: int = 4, disks: int = 1, nics: int = 1) -> None:
+        self.temp_layout = [(f"chip{chip_i}", [f"Core {i}" if i % 2 else "" for i in range(temps_per_chip)])
+                            for chip_i in range(chips)]
+        self.fan_layout = [(f"chip{chip_i}", [f"fan{i}" if i % 2 else "" for i in range(fans_per_chip)])
+                           for chip_i in range(chips) if fans_per_chip]
+        self.cores = cores
+        # whole disks with a partition each, psutil reports both
+        self.disks = [name + part for name in disk_names(disks) for part in ("", "1")]
+        self.nics = nic_names(nics)
+        self.booted_at = time.time() - UPTIME
+        self.calls = 0
+
+    def sensors_temperatures(self) -> dict:
+        self.calls += 1
+        return {chip: [shwtemp(label, round(50 + 20 * math.sin(self.calls / 10 + i), 1), 80.0, 100.0)
+                       for i, label in enumerate(labels)]
+                for chip, labels in self.temp_layout}
+
+    def sensors_fans(self) -> dict:
+        self.calls += 1
+        return {chip: [sfan(label, 1200 + (self.calls * 7 + i * 13) % 400) for i, label in enumerate(labels)]
+                for chip, labels in self.fan_layout}
+
+    def cpu_times(self, percpu: bool = False):
+        self.calls += 1
+        times = [scputimes(self.calls * (3 + core % 5), self.calls, self.calls * 2, self.calls * (10 - core % 5),
+                           self.calls % 3, 0.0, 0.0, 0.0, 0.0, 0.0)
+                 for core in range(self.cores)]
+        return times if percpu else scputimes(*(sum(column) for column in zip(*times)))
+
+    def getloadavg(self) -> tuple[float, float, float]:
+        return 1.0 + self.calls % 7 / 10, 1.25, 1.5
+
+    def virtual_memory(self):
+        available = MEMORY_TOTAL // 2 + (self.calls % 100) * 1024 ** 2
+        return svmem(MEMORY_TOTAL, available, round(100 * (1 - available / MEMORY_TOTAL), 1),
+                     MEMORY_TOTAL - available, available)
+
+    def swap_memory(self):
+        return sswap(8 * 1024 ** 3, 1024 ** 3, 7 * 1024 ** 3, 12.5)
+
+    def disk_io_counters(self, perdisk: bool = False) -> dict:
+        self.calls += 1
+        return {name: sdiskio(self.calls * (i + 1) * 4096, self.calls * (i + 2) * 4096)
+                for i, name in enumerate(self.disks)}
+
+    def net_io_counters(self, pernic: bool = False) -> dict:
+        self.calls += 1
+        return {name: snetio(self.calls * (i + 1) * 1500, self.calls * (i + 3) * 1500)
+                for i, name in enumerate(self.nics)}
+
+    def boot_time(self) -> float:
+        return self.booted_at
+
+    def pids(self) -> list[int]:
+        return list(range(1, 300))
+
+
+class FakeNvml:
+    """pynvml stand in, gpus=0 behaves like a host without the NVidia driver"""
+    NVML_TEMPERATURE_GPU = 0
+    NVML_ERROR_NOT_SUPPORTED = 3
+    NVML_ERROR_LIBRARY_NOT_FOUND = 12
+
+    class NVMLError(Exception):
+        def __init__(self, value: int) -> None:
+            super().__init__(value)
+            self.value = value
+
+    def __init__(self, gpus: int, fans_per_gpu: int) -> None:
+        self.gpus = gpus
+        self.fans_per_gpu = fans_per_gpu
+        self.calls = 0
+
+    def nvmlInit(self) -> None:
+        if self.gpus == 0:
+            raise self.NVMLError(self.NVML_ERROR_LIBRARY_NOT_FOUND)
+
+    def nvmlShutdown(self) -> None:
+        pass
+
+    def nvmlDeviceGetCount(self) -> int:
+        return self.gpus
+
+    def nvmlDeviceGetHandleByIndex(self, i: int) -> int:
+        return i
+
+    def nvmlDeviceGetName(self, handle: int) -> str:
+        return f"NVIDIA Fake GPU {handle}"
+
+    def nvmlDeviceGetNumFans(self, handle: int) -> int:
+        return self.fans_per_gpu
+
+    def nvmlDeviceGetTemperature(self, handle: int, sensor: int) -> int:
+        self.calls += 1
+        return 40 + (self.calls + handle) % 30
+
+    def nvmlDeviceGetFanSpeed_v2(self, handle: int, fan: int) -> int:
+        return 30 + (self.calls + fan) % 50
+
+
+class Scenario:
+    def __init__(self, name: str, chips: int, temps_per_chip: int, fans_per_chip: int,
+                 gpus: int, fans_per_gpu: int, rules: int, amd_gpus: int = 0, mdstat: str = "",
+                 cores: int = 4, disks: int = 1, nics: int = 1) -> None:
+        self.name = name
+        self.chips = chips
+        self.temps_per_chip = temps_per_chip
+        self.fans_per_chip = fans_per_chip
+        self.gpus = gpus
+        self.fans_per_gpu = fans_per_gpu
+        self.rules = rules
+        self.amd_gpus = amd_gpus
+        self.mdstat = mdstat  # fixture in tests/fixtures/mdstat, empty for a host without md arrays
+        self.cores = cores
+        self.disks = disks
+        self.nics = nics
+
+    def psutil(self) -> FakePsutil:
+        return FakePsutil(self.chips, self.temps_per_chip, self.fans_per_chip, self.cores, self.disks, self.nics)
+
+    def nvml(self) -> FakeNvml:
+        return FakeNvml(self.gpus, self.fans_per_gpu)
+
+
+SCENARIOS = {
+    # 10 hwmon inputs, no GPU, no md arrays
+    "laptop": Scenario("laptop", chips=2, temps_per_chip=4, fans_per_chip=1, gpus=0, fans_per_gpu=0, rules=4,
+                       cores=8, disks=1, nics=1),
+    # 500 hwmon inputs, 8 NVidia GPUs with 3 fans each, 2 AMD GPUs, 4 md arrays
+    "dense": Scenario("dense", chips=50, temps_per_chip=8, fans_per_chip=2, gpus=8, fans_per_gpu=3, rules=20,
+                      amd_gpus=2, mdstat="mixed.txt", cores=64, disks=12, nics=4),
+    # dense node watched by a large rule set
+    "rules": Scenario("rules", chips=50, temps_per_chip=8, fans_per_chip=2, gpus=8, fans_per_gpu=3, rules=500,
+                      amd_gpus=2, mdstat="mixed.txt", cores=64, disks=12, nics=4),
+}
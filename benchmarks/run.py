@@ -0,0 +1,218 @@
+"""
+Benchmark the sensor collection, rendering and watch paths on fake hardware.
+
+Usage, from the repo directory:
+    python -m benchmarks.run [--scenario laptop dense rules] [--iterations 200]
+    python -m benchmarks.run --save-baseline
+
+Reports per call latency percentiles and allocation peak for each hot path. When a baseline
+is stored (benchmarks/baseline.json, or --baseline), the run fails if a median latency or
+allocation peak regresses past the tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks.fake_hw import SCENARIOS, Scenario, disk_names
+from tests.fake_sysfs import build_amdgpu_tree, build_md_tree, MDSTAT_FIXTURES_DIR
+from monitor import sensors_api, sensor_watch, system_stats
+from monitor.amdgpu import AmdGpuReader
+from monitor.bot_utils import config, SENSOR_BACKEND_PSUTIL
+from monitor.mdstat import MdstatReader
+from monitor.sensor_history import SensorHistory
+from monitor.sensor_sampler import sensor_sampler
+from monitor.sensor_watch import ConfigEntry, Action, Condition, sensor_action_config, on_check_sensors
+from monitor.readout import get_sensors_text
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+TOLERANCE_DEFAULT = 0.25
+ALLOC_ITERATIONS = 20
+
+
+class FakeBot:
+    async def send_message(self, **kwargs) -> None:
+        pass
+
+
+class FakeContext:
+    bot = FakeBot()
+
+
+def install(scenario: Scenario, root: str) -> None:
+    """
+    point every sensor source at the scenario fake hardware, sysfs and procfs trees are built
+    under root, and reset shared state; a new source needs its fake here too
+    """
+    config.sensor_backend = SENSOR_BACKEND_PSUTIL
+    config.sensor_watch_threshold = 3
+    sensors_api.psutil = system_stats.psutil = scenario.psutil()
+    sensors_api.nvidia_collector.shutdown()
+    sensors_api.nvidia_collector = sensors_api.NvidiaCollector(scenario.nvml())
+
+    drm_root = os.path.join(root, "drm")
+    block_root = os.path.join(root, "block")
+    mdstat_path = os.path.join(root, "mdstat")
+    os.makedirs(drm_root)
+    if scenario.amd_gpus:
+        build_amdgpu_tree(drm_root, scenario.amd_gpus)
+    sensors_api.amdgpu_reader.close()
+    sensors_api.amdgpu_reader = AmdGpuReader(drm_root)
+
+    for disk in disk_names(scenario.disks):
+        os.makedirs(os.path.join(block_root, disk))
+    if scenario.mdstat:
+        shutil.copyfile(os.path.join(MDSTAT_FIXTURES_DIR, scenario.mdstat), mdstat_path)
+    else:
+        with open(mdstat_path, "w") as fp:
+            fp.write("Personalities : \nunused devices: <none>\n")
+    with open(mdstat_path) as fp:
+        build_md_tree(block_root, fp.read())
+    sensors_api.mdstat_reader.close()
+    sensors_api.mdstat_reader = MdstatReader(mdstat_path, block_root)
+    sensors_api.system_collector = system_stats.SystemCollector(block_root)
+    sensor_sampler.snapshot = None
+    sensor_watch.sensor_history = SensorHistory()
+
+    names = list(sensors_api.get_all_sensors())
+    sensor_action_config.configEntries = {}
+    for i in range(min(scenario.rules, len(names))):
+        condition = Condition(i % 3)
+        value = "20:90" if condition == Condition.ExclusiveRange else ("20" if condition == Condition.More else "90")
+        sensor_action_config.configEntries[names[i]] = ConfigEntry(names[i], Action.Notify, condition, value)
+    sensor_action_config.compile()
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def measure(func, iterations: int, is_async: bool = False) -> dict[str, float]:
+    loop = asyncio.new_event_loop()
+
+    def call():
+        return loop.run_until_complete(func()) if is_async else func()
+
+    async def timed_async() -> list[float]:
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            await func()
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    try:
+        call()  # warm up caches and lazy initialization
+        if is_async:
+            samples = loop.run_until_complete(timed_async())
+        else:
+            samples = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                func()
+                samples.append(time.perf_counter() - start)
+
+        peaks = []
+        tracemalloc.start()
+        for _ in range(ALLOC_ITERATIONS):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            call()
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+    finally:
+        loop.close()
+
+    samples.sort()
+    return {
+        "p50_us": percentile(samples, 0.5) * 1e6,
+        "p90_us": percentile(samples, 0.9) * 1e6,
+        "p99_us": percentile(samples, 0.99) * 1e6,
+        "alloc_kib": statistics.median(peaks) / 1024
+    }
+
+
+def run_scenario(scenario: Scenario, iterations: int, root: str) -> dict[str, dict[str, float]]:
+    install(scenario, root)
+    snapshot = asyncio.run(sensor_sampler.sample())
+
+    async def sample():
+        await sensor_sampler.sample()
+
+    async def watch():
+        await on_check_sensors(FakeContext())
+
+    def renderers():
+        sensors_api.temperatures_to_str(snapshot.temperatures)
+        sensors_api.fans_to_str(snapshot.fans)
+        sensors_api.gpu_temps_to_str(snapshot.gpu_temps)
+        sensors_api.gpu_fans_to_str(snapshot.gpu_fans)
+        sensors_api.gpu_stats_to_str(snapshot.gpu_stats)
+
+    results = {
+        "get_all_sensors": measure(sensors_api.get_all_sensors, iterations),
+        "sampler_sample": measure(sample, iterations, is_async=True),
+        "renderers": measure(renderers, iterations),
+        "readout_text": measure(lambda: get_sensors_text(snapshot), iterations),
+    }
+    # watch against a fresh snapshot on every call, as the watch job sees it
+    config.sensor_sample_max_age = 0
+    results["on_check_sensors"] = measure(watch, iterations, is_async=True)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for scenario, benches in results.items():
+        for bench, metrics in benches.items():
+            base = baseline.get(scenario, {}).get(bench)
+            if not base:
+                continue
+            for metric in ("p50_us", "alloc_kib"):
+                if base[metric] > 0 and metrics[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(f"{scenario}/{bench} {metric}: {metrics[metric]:.1f} > baseline {base[metric]:.1f}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE_DEFAULT, help="allowed relative regression")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenario:
+        with tempfile.TemporaryDirectory(prefix=f"monitor-bench-{name}-") as root:
+            results[name] = run_scenario(SCENARIOS[name], args.iterations, root)
+        for bench, metrics in results[name].items():
+            print(f"{name:8s} {bench:18s} p50 {metrics['p50_us']:10.1f}us  p90 {metrics['p90_us']:10.1f}us  "
+                  f"p99 {metrics['p99_us']:10.1f}us  alloc {metrics['alloc_kib']:9.1f}KiB")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as fp:
+            json.dump(results, fp, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline stored, run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline) as fp:
+        regressions = compare(results, json.load(fp), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,13 @@
+import time
+STARTED_AT = time.perf_counter()  # before the imports below, they are part of the startup breakdown
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
-    AIORateLimiter,
-    ExtBot
+    ExtBot,
+    CallbackContext
 )
-from telegram import Bot, request
+from telegram import Bot
 import asyncio
 import os.path
 from monitor.bot_handlers import (
@@ -14,38 +16,89 @@ from monitor.bot_handlers import (
     reboot_cmd,
     refresh_button,
     toggle_refresh_button,
+    page_button,
     reboot_button,
     shutdown_cmd,
     shutdown_button,
     help_cmd,
+    history_cmd,
+    stats_cmd,
+    top_cmd,
+    hosts_cmd,
+    on_log_stats,
     error_handler
 )
 import monitor.bot_utils as utils
 from monitor.sensor_watch import sensor_action_config, on_check_sensors, SENSOR_WATCH_JOB_NAME
-import requests
+from monitor.sensor_sampler import sensor_sampler, on_sample_sensors, SENSOR_SAMPLER_JOB_NAME
+from monitor.watch_scheduler import on_watch_tick
+from monitor.sensors_api import nvidia_collector, amdgpu_reader, hwmon_reader, mdstat_reader
+from monitor.metrics_exporter import metrics_exporter
+from monitor.hub import snapshot_hub, on_check_hosts, HUB_WATCH_JOB_NAME
+from monitor.history_log import history_log
+from monitor.instrumentation import loop_lag_probe
+from monitor.telegram_instrumentation import InstrumentedRequest, InstrumentedRateLimiter
+import secrets
 import signal
 
+startup_phases: list[tuple[str, float]] = []
+
+
+def mark_startup(phase: str) -> None:
+    """end of a startup phase, it lasted since the end of the previous one"""
+    startup_phases.append((phase, time.perf_counter()))
+
+
+def get_startup_text() -> str:
+    durations = []
+    previous = STARTED_AT
+    for phase, end in startup_phases:
+        durations.append(f"{phase} {end - previous:.2f}s")
+        previous = end
+    return f"Startup took {previous - STARTED_AT:.2f}s: " + ", ".join(durations)
+
 
 def initialize_bot_config() -> None:
     utils.config.load_config(os.path.join(utils.DATA_PATH, utils.CONFIG_FILE_NAME))
     sensor_action_config.load_config()
+    if utils.config.history_retention:
+        history_log.open(utils.config.history_dir)
+
+
+def init_http_request() -> InstrumentedRequest:
+    return InstrumentedRequest(http_version="1.1", connection_pool_size=8, read_timeout=30, write_timeout=30)
 
 
-def init_http_request() -> request.HTTPXRequest:
-    return request.HTTPXRequest(http_version="1.1", connection_pool_size=8, read_timeout=30, write_timeout=30)
+async def notify_all_users(bot: Bot, text: str) -> None:
+    """send text to all users concurrently over the bot's connection pool, within LIFECYCLE_NOTIFY_TIMEOUT"""
+    if not utils.config.is_user_specified():
+        return
+    user_ids = list(utils.config.user_id_set)
+    try:
+        results = await asyncio.wait_for(asyncio.gather(*(bot.send_message(chat_id=user_id, text=text) for user_id in user_ids),
+                                                        return_exceptions=True),
+                                         utils.LIFECYCLE_NOTIFY_TIMEOUT)
+    except asyncio.TimeoutError:
+        utils.logger.warning(f"\"{text}\" was not delivered to all users in {utils.LIFECYCLE_NOTIFY_TIMEOUT}s")
+        return
+    for user_id, res in zip(user_ids, results):
+        if isinstance(res, Exception):
+            utils.logger.error(f"Failed to send \"{text}\" to user: {user_id} - {res}")
 
 
 async def init_bot_settings() -> ExtBot:
-    bot = ExtBot(utils.config.token, request=init_http_request(),
-              get_updates_request=init_http_request(), rate_limiter=AIORateLimiter())
+    bot = ExtBot(utils.config.token, base_url=utils.config.api_base_url, request=init_http_request(),
+              get_updates_request=init_http_request(), rate_limiter=InstrumentedRateLimiter())
     cmds = [("print_sensors", "Display current system info"),
             ("reboot_host", "Reboot with configured delay"),
             ("shutdown_host", "Shutdown with configured delay"),
+            ("history", "Sensor readings over a time window"),
+            ("hosts", "Hosts reporting to the hub"),
+            ("top", "Busiest processes"),
+            ("stats", "Bot latency stats"),
             ("help", "Get command usage help")]
-    await bot.set_my_commands(commands=cmds, language_code="en")
-    if utils.config.is_user_specified():
-        for user_id in utils.config.user_id_set:
-            await bot.send_message(chat_id=user_id, text="System monitor online")
+    await asyncio.gather(bot.set_my_commands(commands=cmds, language_code="en"),
+                         notify_all_users(bot, "System monitor online"))
     return bot
 
 
@@ -58,40 +111,132 @@ def create_bot() -> Bot:
     return task.result()
 
 def finalize_bot() -> None:
-    if utils.config.is_user_specified():
-        for user_id in utils.config.user_id_set:
-            msg ="System monitor offline"
-            payload = {
-                'chat_id': user_id,
-                'text': msg,
-                'parse_mode': 'HTML'
-            }
-            requests.post("https://api.telegram.org/bot{token}/sendMessage".format(token=utils.config.token),
-                                data=payload).content
+    sensor_sampler.shutdown()
+    nvidia_collector.shutdown()
+    amdgpu_reader.close()
+    hwmon_reader.close()
+    mdstat_reader.close()
+    history_log.close()
+
+
+async def on_application_start(application: Application) -> None:
+    loop_lag_probe.start()
+    await metrics_exporter.start()
+    await snapshot_hub.start()
+    mark_startup("application")
+    utils.logger.info(get_startup_text())
+
+
+async def on_application_stopping(application: Application) -> None:
+    """users are told while the loop and the bot's connections are still up"""
+    await notify_all_users(application.bot, "System monitor offline")
+
+
+async def on_application_stop(application: Application) -> None:
+    await snapshot_hub.stop()
+    await metrics_exporter.stop()
+    await loop_lag_probe.stop()
+
+
+async def on_compact_history(context: CallbackContext) -> None:
+    await asyncio.get_running_loop().run_in_executor(None, history_log.compact)
+
+
+async def start_updater(application: Application) -> None:
+    """receive updates by webhook if configured, falls back to long polling if the webhook can't be set up"""
+    if utils.config.update_mode == utils.UPDATE_MODE_WEBHOOK:
+        if not utils.config.webhook_url:
+            utils.logger.error("UPDATE_MODE is webhook but WEBHOOK_URL is not set, using polling")
+        else:
+            try:
+                await application.updater.start_webhook(listen=utils.config.webhook_listen,
+                                                        port=utils.config.webhook_port,
+                                                        url_path=utils.config.webhook_path,
+                                                        webhook_url=utils.config.webhook_url,
+                                                        secret_token=utils.config.webhook_secret or secrets.token_urlsafe(32))
+                return
+            except Exception as e:
+                utils.logger.error(f"Failed to set up webhook - {e}, falling back to polling")
+
+    await application.updater.start_polling()
+
+
+async def serve_updates(application: Application) -> None:
+    """run_polling and run_webhook of the application in one, the update source is chosen once the application
+    is initialized so that a webhook fallback doesn't run the application hooks twice"""
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, stopped.set)
+
+    try:
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await start_updater(application)
+        await application.start()
+        await stopped.wait()
+    finally:
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_updates(application: Application) -> None:
+    asyncio.run(serve_updates(application))
 
 
 def run_application() -> None:
 
-    application = Application.builder().bot(create_bot()).build()
+    bot = create_bot()
+    mark_startup("bot setup")
+    application = (Application.builder().bot(bot)
+                   .post_init(on_application_start)
+                   .post_stop(on_application_stopping)
+                   .post_shutdown(on_application_stop)
+                   .build())
 
     application.add_handler(CommandHandler("start", start_cmd))
     application.add_handler(CommandHandler("print_sensors", print_readouts_cmd))
     application.add_handler(CommandHandler("reboot_host", reboot_cmd))
     application.add_handler(CommandHandler("shutdown_host", shutdown_cmd))
+    application.add_handler(CommandHandler("history", history_cmd))
+    application.add_handler(CommandHandler("stats", stats_cmd))
+    application.add_handler(CommandHandler("top", top_cmd))
+    application.add_handler(CommandHandler("hosts", hosts_cmd))
     application.add_handler(CommandHandler("help", help_cmd))
     application.add_handler(CallbackQueryHandler(refresh_button, pattern=f"^{utils.QUERY_PATTERN_REFRESH}*"))
     application.add_handler(CallbackQueryHandler(toggle_refresh_button, pattern=f"^{utils.QUERY_PATTERN_TOGGLE_REFRESH}*"))
+    application.add_handler(CallbackQueryHandler(page_button, pattern=f"^{utils.QUERY_PATTERN_PAGE}*"))
     application.add_handler(CallbackQueryHandler(reboot_button, pattern=f"^{utils.QUERY_PATTERN_CONFIRM_REBOOT}*"))
     application.add_handler(CallbackQueryHandler(shutdown_button, pattern=f"^{utils.QUERY_PATTERN_CONFIRM_SHUTDOWN}*"))
 
     application.add_error_handler(error_handler)
-    application.job_queue.run_repeating(on_check_sensors, utils.config.sensor_watch_time, name=SENSOR_WATCH_JOB_NAME)
+    if utils.config.watch_schedule == utils.WATCH_SCHEDULE_ADAPTIVE:
+        application.job_queue.run_once(on_watch_tick, 0, name=SENSOR_WATCH_JOB_NAME)
+    else:
+        application.job_queue.run_repeating(on_sample_sensors, utils.config.sensor_sample_time, first=0, name=SENSOR_SAMPLER_JOB_NAME)
+        application.job_queue.run_repeating(on_check_sensors, utils.config.sensor_watch_time, name=SENSOR_WATCH_JOB_NAME)
+    if utils.config.hub_listen:
+        application.job_queue.run_repeating(on_check_hosts, utils.config.sensor_watch_time, name=HUB_WATCH_JOB_NAME)
+    if history_log.enabled:
+        application.job_queue.run_repeating(on_compact_history, utils.HISTORY_COMPACT_INTERVAL, first=60, name=utils.HISTORY_COMPACT_JOB_NAME)
+    if utils.config.stats_log_interval:
+        application.job_queue.run_repeating(on_log_stats, utils.config.stats_log_interval, name=utils.STATS_LOG_JOB_NAME)
 
-    application.run_polling(stop_signals=[signal.SIGINT, signal.SIGTERM])
+    run_updates(application)
 
 
 def main() -> None:
+    mark_startup("imports")
     initialize_bot_config()
+    mark_startup("config")
 
     run_application()
 
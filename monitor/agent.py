@@ -0,0 +1,131 @@
+"""
+Snapshot agent.
+
+Collects sensors with the same sampler as the bot and pushes compact binary snapshots to
+a hub bot process, no Telegram token is needed on the monitored host.
+
+Usage, from the repo directory:
+    python -m monitor.agent HUB_ADDRESS [--name HOST] [--interval 1] [--backend psutil|hwmon]
+
+HUB_ADDRESS is host:port or unix:/path/to/socket, the hub secret is read from the
+MONITOR_HUB_SECRET environment variable or --secret. The agent reconnects with backoff
+when the hub goes away and resends its topology on every connection.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import time
+from array import array
+from typing import Optional
+from monitor.bot_utils import config, logger, SENSOR_BACKEND_PSUTIL, SENSOR_BACKEND_HWMON
+from monitor.sensor_sampler import SensorSnapshot, sensor_sampler
+from monitor.sensors_api import nvidia_collector, amdgpu_reader, hwmon_reader, mdstat_reader
+from monitor.snapshot_protocol import (
+    Topology,
+    encode_hello,
+    encode_topology,
+    encode_sample,
+    parse_address
+)
+
+RECONNECT_DELAY_MIN = 1.0
+RECONNECT_DELAY_MAX = 30.0
+SECRET_ENV = "MONITOR_HUB_SECRET"
+
+
+def get_topology(snapshot: SensorSnapshot) -> tuple[tuple, Topology]:
+    """(identity to detect changes, topology description) of the snapshot groups"""
+    infos = snapshot.registry.infos
+    key = tuple(snapshot.groups.items())
+    topology = [(group, [(infos[sensor_id].key, infos[sensor_id].name, infos[sensor_id].label,
+                          infos[sensor_id].units, infos[sensor_id].integral) for sensor_id in ids])
+                for group, ids in snapshot.groups.items()]
+    return key, topology
+
+
+def encode_snapshot(snapshot: SensorSnapshot) -> bytes:
+    packed = snapshot.values
+    values = array('d', (packed[sensor_id] for ids in snapshot.groups.values() for sensor_id in ids))
+    fresh_mask = 0
+    for group_i, group in enumerate(snapshot.groups):
+        if group in snapshot.fresh_groups:
+            fresh_mask |= 1 << group_i
+    return encode_sample(snapshot.timestamp, snapshot.stale, fresh_mask, values)
+
+
+class SnapshotAgent:
+    def __init__(self, address: str, host: str, secret: str, interval: float) -> None:
+        self.address = address
+        self.host = host
+        self.secret = secret
+        self.interval = interval
+        self.topology_key: Optional[tuple] = None
+
+    async def connect(self) -> asyncio.StreamWriter:
+        path, host, port = parse_address(self.address)
+        if path:
+            _, writer = await asyncio.open_unix_connection(path)
+        else:
+            _, writer = await asyncio.open_connection(host, port)
+        writer.write(encode_hello(self.host, self.secret))
+        self.topology_key = None  # a new connection starts with the topology
+        return writer
+
+    async def push(self, writer: asyncio.StreamWriter) -> None:
+        while True:
+            snapshot = await sensor_sampler.sample()
+            key, topology = get_topology(snapshot)
+            if key != self.topology_key:
+                writer.write(encode_topology(topology))
+                self.topology_key = key
+            writer.write(encode_snapshot(snapshot))
+            await writer.drain()
+            await asyncio.sleep(self.interval)
+
+    async def run(self) -> None:
+        delay = RECONNECT_DELAY_MIN
+        while True:
+            started = time.monotonic()
+            writer = None
+            try:
+                writer = await self.connect()
+                logger.info(f"Agent {self.host} connected to hub {self.address}")
+                await self.push(writer)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if time.monotonic() - started > RECONNECT_DELAY_MAX:
+                    delay = RECONNECT_DELAY_MIN  # the connection worked, it is not a hub that keeps rejecting us
+                logger.warning(f"Agent {self.host} lost hub {self.address} - {e}, reconnecting in {delay:.0f}s")
+            finally:
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("address", help="hub address, host:port or unix:/path")
+    parser.add_argument("--name", default=socket.gethostname(), help="host name reported to the hub")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between snapshots")
+    parser.add_argument("--secret", default=os.environ.get(SECRET_ENV, ""))
+    parser.add_argument("--backend", choices=[SENSOR_BACKEND_PSUTIL, SENSOR_BACKEND_HWMON], default=SENSOR_BACKEND_PSUTIL)
+    args = parser.parse_args()
+
+    config.sensor_backend = args.backend
+    agent = SnapshotAgent(args.address, args.name, args.secret, args.interval)
+    try:
+        asyncio.run(agent.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sensor_sampler.shutdown()
+        nvidia_collector.shutdown()
+        amdgpu_reader.close()
+        hwmon_reader.close()
+        mdstat_reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+AMD GPU reader.
+
+amdgpu cards are discovered under /sys/class/drm/card*/device, their hwmon inputs (edge,
+junction and memory temperatures, fan speed and PWM, power draw) and gpu_busy_percent are
+indexed once and kept open, every readout re-reads them with os.pread like HwmonReader.
+Cards are rescanned when the set of drm entries changes or after the configured rescan
+interval.
+
+Readings go to the same groups as NVidia ones: temperatures to GPU temperatures, fan PWM
+as percent to GPU fans, power (W), busy (%) and fan speed (RPM) to GPU stats.
+"""
+
+import glob
+import os
+import re
+import threading
+import time
+from typing import Optional
+from monitor.bot_utils import logger, config
+from monitor.sensor_registry import Readings, sensor_registry
+
+DRM_ROOT = "/sys/class/drm"
+DRIVER_NAME = "amdgpu"
+READ_SIZE = 32
+CARD_NAME = re.compile(r"^card\d+$")  # connectors are card0-DP-1 etc.
+PWM_MAX = 255
+TEMPERATURE_LABELS = ("edge", "junction", "mem")  # temp1..3 on current cards, used when a label file is missing
+
+
+class AmdGpuInput:
+    __slots__ = ("path", "scale", "integral", "fd", "sensor_id")
+
+    def __init__(self, path: str, scale: float, integral: bool, sensor_id: int) -> None:
+        self.path = path
+        self.scale = scale
+        self.integral = integral
+        self.fd = -1
+        self.sensor_id = sensor_id
+
+    def open(self) -> bool:
+        try:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            self.fd = -1
+        return self.fd >= 0
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def read(self):
+        """current value, None if the card has no reading right now (powered down, reset)"""
+        try:
+            raw = int(os.pread(self.fd, READ_SIZE, 0))
+        except (OSError, ValueError):
+            return None
+        return round(raw / self.scale) if self.integral else round(raw / self.scale, 1)
+
+
+def _read_text(path: str) -> str:
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except (OSError, ValueError):
+        return ""
+
+
+class AmdGpuReader:
+    def __init__(self, root: str = DRM_ROOT) -> None:
+        self.root = root
+        self.temperatures: list[AmdGpuInput] = []
+        self.fans: list[AmdGpuInput] = []
+        self.stats: list[AmdGpuInput] = []
+        self.cards: list[str] = []
+        self.entries: frozenset = frozenset()
+        self.scanned = False
+        self.scanned_at = 0.0
+        self._lock = threading.Lock()
+
+    def _list_entries(self) -> frozenset:
+        try:
+            return frozenset(os.listdir(self.root))
+        except OSError:
+            return frozenset()
+
+    def _get_hwmon_dir(self, device: str) -> str:
+        """hwmon directory of the card, empty if the card is not driven by amdgpu"""
+        for hwmon_dir in sorted(glob.glob(os.path.join(device, "hwmon", "hwmon*"))):
+            if _read_text(os.path.join(hwmon_dir, "name")) == DRIVER_NAME:
+                return hwmon_dir
+        return ""
+
+    def _add(self, inputs: list[AmdGpuInput], path: str, scale: float, integral: bool,
+             name: str, label: str, units: str, key: Optional[str] = None) -> None:
+        if not os.path.exists(path):
+            return
+        hw_input = AmdGpuInput(path, scale, integral, sensor_registry.intern(name, label, units, key, integral))
+        if hw_input.open():
+            inputs.append(hw_input)
+
+    def _scan_card(self, card: str, device: str, hwmon_dir: str) -> None:
+        name = f"{DRIVER_NAME} {card}"
+        for path in sorted(glob.glob(os.path.join(hwmon_dir, "temp*_input")),
+                           key=lambda path: int(re.sub(r"\D", "", os.path.basename(path)))):
+            base = path[:-len("_input")]
+            index = int(os.path.basename(base)[4:])
+            label = _read_text(base + "_label")
+            if not label:
+                label = TEMPERATURE_LABELS[index - 1] if index <= len(TEMPERATURE_LABELS) else f"temp{index}"
+            # labels repeat across cards, the card is part of the label shown without chip headers
+            self._add(self.temperatures, path, 1000.0, True, name, f"{name} {label}", "°C", f"{name}.{label}".lower())
+        for path in sorted(glob.glob(os.path.join(hwmon_dir, "pwm[0-9]"))):
+            fan = "fan" + os.path.basename(path)[3:]
+            self._add(self.fans, path, PWM_MAX / 100, True, name, fan, "%")
+        for path in sorted(glob.glob(os.path.join(hwmon_dir, "fan[0-9]_input"))):
+            fan = os.path.basename(path)[:-len("_input")]
+            self._add(self.stats, path, 1, True, name, f"{fan} speed", "RPM")
+        power = os.path.join(hwmon_dir, "power1_average")
+        if not os.path.exists(power):
+            power = os.path.join(hwmon_dir, "power1_input")
+        self._add(self.stats, power, 1e6, False, name, "power", "W")
+        self._add(self.stats, os.path.join(device, "gpu_busy_percent"), 1, True, name, "busy", "%")
+
+    def scan(self) -> None:
+        """(re)build the index of amdgpu inputs and open their files"""
+        previous = self.cards
+        was_scanned = self.scanned
+        self._close()
+        self.entries = self._list_entries()
+        self.cards = []
+        for card in sorted(self.entries, key=lambda card: int(card[4:]) if CARD_NAME.match(card) else -1):
+            if not CARD_NAME.match(card):
+                continue
+            device = os.path.join(self.root, card, "device")
+            hwmon_dir = self._get_hwmon_dir(device)
+            if hwmon_dir:
+                self.cards.append(card)
+                self._scan_card(card, device, hwmon_dir)
+        self.scanned = True
+        self.scanned_at = time.monotonic()
+        if was_scanned and self.cards != previous:
+            logger.info(f"AMD GPUs changed: {previous} -> {self.cards}")
+
+    def _check_topology(self) -> None:
+        """rescan if never scanned, drm devices came or went, or the rescan interval passed"""
+        if (not self.scanned
+                or time.monotonic() - self.scanned_at >= config.topology_rescan_interval
+                or self._list_entries() != self.entries):
+            self.scan()
+
+    def _close(self) -> None:
+        for hw_input in self.temperatures + self.fans + self.stats:
+            hw_input.close()
+        self.temperatures = []
+        self.fans = []
+        self.stats = []
+        self.scanned = False
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    @staticmethod
+    def _read_readings(inputs: list[AmdGpuInput]) -> Readings:
+        ids = []
+        values = []
+        for hw_input in inputs:
+            value = hw_input.read()
+            if value is not None:
+                ids.append(hw_input.sensor_id)
+                values.append(value)
+        return tuple(ids), values
+
+    def read(self) -> tuple[Readings, Readings, Readings]:
+        """temperatures, fans and stats of all amdgpu cards in one pass"""
+        with self._lock:
+            self._check_topology()
+            return (self._read_readings(self.temperatures),
+                    self._read_readings(self.fans),
+                    self._read_readings(self.stats))
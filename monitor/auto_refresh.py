@@ -0,0 +1,136 @@
+"""
+Auto refresh of readout messages.
+
+Every readout with auto refresh enabled is a subscription keyed by (chat, message). One
+repeating job serves all of them: it samples once and renders each shown host page once per tick, then edits the
+subscribed messages concurrently. A chat that hits Telegram flood control is backed off on
+its own, subscriptions of deleted messages are dropped.
+"""
+
+import asyncio
+import time
+from typing import Optional
+from telegram import Message
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from telegram.ext import CallbackContext, JobQueue
+from monitor.bot_utils import config, logger, AUTO_REFRESH_JOB_NAME
+from monitor.readout import (
+    get_readout_snapshot,
+    render_readout,
+    get_fingerprint,
+    update_render_state,
+    forget_render_state
+)
+
+BACKOFF_MAX_SECONDS = 300
+MESSAGE_GONE_ERRORS = ("message to edit not found", "message can't be edited", "chat not found")
+
+
+class ChatBackoff:
+    __slots__ = ("until", "delay")
+
+    def __init__(self) -> None:
+        self.until = 0.0
+        self.delay = 0.0
+
+
+class Subscription:
+    __slots__ = ("message", "page", "host")
+
+    def __init__(self, message: Message, page: int, host: Optional[str] = None) -> None:
+        self.message = message
+        self.page = page
+        self.host = host  # remote host of a hub readout
+
+
+class RefreshRegistry:
+    def __init__(self) -> None:
+        self.subscriptions: dict[tuple[int, int], Subscription] = {}
+        self.backoffs: dict[int, ChatBackoff] = {}
+
+    def __len__(self) -> int:
+        return len(self.subscriptions)
+
+    def toggle(self, message: Message, job_queue: JobQueue, page: int = 0, host: Optional[str] = None) -> bool:
+        """enable or disable auto refresh for message, True if enabled"""
+        key = (message.chat_id, message.message_id)
+        if key in self.subscriptions:
+            self.remove(message)
+            return False
+
+        self.subscriptions[key] = Subscription(message, page, host)
+        if not job_queue.get_jobs_by_name(AUTO_REFRESH_JOB_NAME):
+            job_queue.run_repeating(on_auto_refresh, config.update_period_seconds, name=AUTO_REFRESH_JOB_NAME)
+        return True
+
+    def set_page(self, message: Message, page: int) -> bool:
+        """switch page shown by a subscribed message, True if message is subscribed"""
+        subscription = self.subscriptions.get((message.chat_id, message.message_id))
+        if subscription is None:
+            return False
+        subscription.page = page
+        return True
+
+    def remove(self, message: Message) -> None:
+        self.subscriptions.pop((message.chat_id, message.message_id), None)
+        if not any(chat_id == message.chat_id for chat_id, _ in self.subscriptions):
+            self.backoffs.pop(message.chat_id, None)
+
+    def is_backed_off(self, chat_id: int, now: float) -> bool:
+        backoff = self.backoffs.get(chat_id)
+        return backoff is not None and backoff.until > now
+
+    def back_off(self, chat_id: int, retry_after: float) -> None:
+        """wait at least retry_after, doubling the wait while the chat keeps hitting flood control"""
+        backoff = self.backoffs.setdefault(chat_id, ChatBackoff())
+        backoff.delay = min(max(retry_after, backoff.delay * 2), BACKOFF_MAX_SECONDS)
+        backoff.until = time.monotonic() + backoff.delay
+        logger.warning(f"Auto refresh for chat: {chat_id} is backed off for {backoff.delay}s")
+
+    def handle_result(self, message: Message, res) -> None:
+        if res is None:
+            self.backoffs.pop(message.chat_id, None)
+            return
+
+        forget_render_state(message)  # edit didn't happen, retry on next tick
+        if isinstance(res, RetryAfter):
+            self.back_off(message.chat_id, res.retry_after)
+        elif isinstance(res, Forbidden) or (isinstance(res, BadRequest) and any(
+                err in res.message.lower() for err in MESSAGE_GONE_ERRORS)):
+            logger.info(f"Auto refresh message: {message.message_id} in chat: {message.chat_id} is gone, unsubscribing")
+            self.remove(message)
+        elif isinstance(res, Exception):
+            logger.error(f"Failed to auto refresh message: {message.message_id} in chat: {message.chat_id} - {res}")
+
+    async def refresh(self) -> None:
+        subscriptions = list(self.subscriptions.values())
+        snapshots = {host: await get_readout_snapshot(host) for host in {subscription.host for subscription in subscriptions}}
+        now = time.monotonic()
+        due = [subscription for subscription in subscriptions
+               if snapshots[subscription.host] is not None
+               and not self.is_backed_off(subscription.message.chat_id, now)
+               and update_render_state(subscription.message, get_fingerprint(snapshots[subscription.host], True,
+                                                                             subscription.page, subscription.host))]
+        if not due:
+            return
+
+        # every page is rendered once no matter how many messages show it
+        pages = {(host, page): render_readout(snapshots[host], True, page, host)
+                 for host, page in {(subscription.host, subscription.page) for subscription in due}}
+        results = await asyncio.gather(*(subscription.message.edit_text(text=pages[subscription.host, subscription.page][0],
+                                                                        reply_markup=pages[subscription.host, subscription.page][1],
+                                                                        parse_mode=ParseMode.HTML)
+                                         for subscription in due), return_exceptions=True)
+        for subscription, res in zip(due, results):
+            self.handle_result(subscription.message, res if isinstance(res, BaseException) else None)
+
+
+async def on_auto_refresh(context: CallbackContext):
+    if len(refresh_registry) == 0:
+        context.job.schedule_removal()
+        return
+    await refresh_registry.refresh()
+
+
+refresh_registry = RefreshRegistry()
@@ -5,80 +5,40 @@ from telegram import (
 )
 from telegram.error import TelegramError
 from telegram.ext import CallbackContext, ContextTypes
-from telegram.constants import ParseMode
+from telegram.constants import ParseMode, MessageLimit
 from monitor.bot_utils import (
     user_restricted,
+    admin_restricted,
     log_cmd,
     answer_query,
     logger,
-    config
+    config,
+    parse_duration,
+    DURATION_UNITS
 )
 from monitor.bot_utils import (
     SOURCE_WEB_LINK,
-    QUERY_PATTERN_REFRESH,
-    QUERY_PATTERN_TOGGLE_REFRESH,
     QUERY_PATTERN_CONFIRM_REBOOT,
     QUERY_PATTERN_CONFIRM_SHUTDOWN,
-    AUTO_REFRESH_JOB_NAME
+    HISTORY_WINDOW_DEFAULT,
+    TOP_PROCESSES_MAX
 )
-from monitor.sensors_api import (
-    get_sensors_fan_speeds,
-    get_sensors_temperatures,
-    temperatures_to_str,
-    fans_to_str,
-    get_gpu_temps,
-    gpu_temps_to_str,
-    get_gpu_fans,
-    gpu_fans_to_str
+from monitor.history_log import get_history_stats
+from monitor.hub import snapshot_hub
+from monitor.sensors_api import get_top_processes
+from monitor.readout import (
+    render_readout,
+    get_fingerprint,
+    get_query_target,
+    get_readout_snapshot,
+    update_render_state,
+    edit_readout
 )
+from monitor.auto_refresh import refresh_registry
+from monitor.instrumentation import stats
+import asyncio
 import os
-from datetime import datetime
-
-
-def get_header_text(print_refresh_rate: bool = False) -> str:
-    dt = datetime.now().strftime("%d/%m/%y %H:%M:%S")
-    if print_refresh_rate:
-        return f"<i>Auto update is enabled, refresh rate: {config.update_period_seconds}s</i>" + "\n<b>" + dt + "</b>\n"
-    else:
-        return "<b>" + dt + "</b>\n"
-    
-
-def get_sensors_text() -> str:
-    fans = get_sensors_fan_speeds()
-    temps = get_sensors_temperatures()
-    gpu_temps = get_gpu_temps()
-    gpu_str = gpu_temps_to_str(gpu_temps)
-    gpu_fans = get_gpu_fans()
-    gpu_fans_str = gpu_fans_to_str(gpu_fans)
-
-    res_str = temperatures_to_str(temps)
-    if gpu_str:
-        res_str += '\n' + gpu_str
-    res_str += '\n\n' + fans_to_str(fans)
-    if gpu_fans_str:
-        res_str += '\n' + gpu_fans_str
-
-    return res_str
-
-
-def get_info_text(print_refresh_rate: bool = False) -> str:
-    return get_header_text(print_refresh_rate) + get_sensors_text()
-
-
-def get_refresh_markup() -> InlineKeyboardMarkup:
-    keyboard = [[InlineKeyboardButton(text="Refresh", callback_data=QUERY_PATTERN_REFRESH)],
-                [InlineKeyboardButton(text="Toggle auto refresh", callback_data=QUERY_PATTERN_TOGGLE_REFRESH)]]
-    return InlineKeyboardMarkup(keyboard)
-
-
-async def on_auto_refresh(context: CallbackContext):
-    reply = get_info_text(True)
-    try:
-        await context.job.data.edit_text(text=reply, reply_markup=get_refresh_markup(), parse_mode=ParseMode.HTML)
-    except TelegramError:  # message was deleted
-        context.job.schedule_removal()
-        reply = get_info_text(False)
-        await context.job.data.edit_text(text=reply, reply_markup=get_refresh_markup(), parse_mode=ParseMode.HTML)
+import html
 
 
 @user_restricted
@@ -91,10 +51,16 @@ async def start_cmd(update: Update, context: CallbackContext) -> None:
 
 @user_restricted
 async def print_readouts_cmd(update: Update, context: CallbackContext) -> None:
-    """Query configured sensor and system info."""
-    reply = get_info_text()
+    """Query configured sensor and system info, of a host reporting to the hub if given."""
+    host = context.args[0] if context.args else None
+    snapshot = await get_readout_snapshot(host)
+    if snapshot is None:
+        await update.message.reply_html(f"No snapshot from host <b>{html.escape(host)}</b>, see /hosts")
+        return
+    reply, markup = render_readout(snapshot, host=host)
 
-    await update.message.reply_html(text=reply, reply_markup=get_refresh_markup())
+    message = await update.message.reply_html(text=reply, reply_markup=markup)
+    update_render_state(message, get_fingerprint(snapshot, False, host=host))
 
 
 @user_restricted
@@ -110,11 +76,24 @@ async def refresh_button(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     context.application.create_task(answer_query(query), update=update)
     
-    reply = get_info_text()
+    page, host = get_query_target(query.data)
+    try:
+        await edit_readout(update.effective_message, page=page, host=host)
+    except TelegramError as e:  # message may be deleted or too old to edit
+        logger.debug(f"Failed to refresh readout message - {e}")
+
+
+@user_restricted
+async def page_button(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    context.application.create_task(answer_query(query), update=update)
+
+    page, host = get_query_target(query.data)
+    auto_refresh = refresh_registry.set_page(update.effective_message, page)
     try:
-        await update.effective_message.edit_text(text=reply, reply_markup=get_refresh_markup(), parse_mode=ParseMode.HTML)
-    except TelegramError:  # causes error when message has not changed, ignore
-        pass
+        await edit_readout(update.effective_message, auto_refresh, page, host)
+    except TelegramError as e:  # message may be deleted or too old to edit
+        logger.debug(f"Failed to switch readout page - {e}")
 
 @user_restricted
 async def reboot_button(update: Update, context: CallbackContext) -> None:
@@ -163,17 +142,98 @@ async def toggle_refresh_button(update: Update, context: CallbackContext) -> Non
     query = update.callback_query
     context.application.create_task(answer_query(query), update=update)
 
-    reply = get_info_text()
+    page, host = get_query_target(query.data)
+    enabled = refresh_registry.toggle(update.effective_message, context.job_queue, page, host)
     try:
-        await update.effective_message.edit_text(text=reply, reply_markup=get_refresh_markup(), parse_mode=ParseMode.HTML)
-    except TelegramError:  # causes error when message has not changed, ignore
-        pass
+        await edit_readout(update.effective_message, enabled, page, host)
+    except TelegramError as e:  # message may be deleted or too old to edit
+        logger.debug(f"Failed to refresh readout message - {e}")
 
-    job = context.job_queue.get_jobs_by_name(AUTO_REFRESH_JOB_NAME)
-    if len(job) != 0:
-        job[0].schedule_removal()
-    else:
-        context.job_queue.run_repeating(on_auto_refresh, config.update_period_seconds, data=update.effective_message, name=AUTO_REFRESH_JOB_NAME)
+
+@user_restricted
+async def history_cmd(update: Update, context: CallbackContext) -> None:
+    """Sensor min/avg/max/last over a time window: /history <sensor> [window]"""
+    if not context.args:
+        await update.message.reply_html("Usage: /history &lt;sensor&gt; [window], e.g. /history coretemp.core 0 1h")
+        return
+
+    # sensor names may contain spaces, a trailing argument with a time unit is the window
+    window_str = HISTORY_WINDOW_DEFAULT
+    args = context.args
+    if len(args) > 1 and args[-1][-1:].lower() in DURATION_UNITS:
+        try:
+            parse_duration(args[-1])
+            window_str = args[-1]
+            args = args[:-1]
+        except ValueError:
+            pass
+    name = " ".join(args).lower()
+    window = parse_duration(window_str)
+
+    history_stats = await get_history_stats(name, window)
+    if history_stats is None:
+        await update.message.reply_html(f"No history for sensor <b>{html.escape(name)}</b>")
+        return
+
+    reply = (f"<b>{html.escape(name)}</b> over last {window_str}:\n"
+             f"       min <b>{history_stats.min:.1f}</b>{history_stats.units}\n"
+             f"       avg <b>{history_stats.avg:.1f}</b>{history_stats.units}\n"
+             f"       max <b>{history_stats.max:.1f}</b>{history_stats.units}\n"
+             f"       last <b>{history_stats.last}</b>{history_stats.units}")
+    await update.message.reply_html(reply)
+
+
+@user_restricted
+async def hosts_cmd(update: Update, context: CallbackContext) -> None:
+    """Hosts reporting to the hub with their state"""
+    if not snapshot_hub.hosts:
+        await update.message.reply_html("No hosts reported to the hub" if config.hub_listen else "Hub is not enabled, set HUB_LISTEN")
+        return
+
+    lines = []
+    for name, host in sorted(snapshot_hub.hosts.items()):
+        state = "stale" if host.is_stale() else "online"
+        if not host.is_connected():
+            state += ", disconnected"
+        seen = f"last snapshot {format_duration(host.snapshot.age())} ago" if host.snapshot else "no snapshot"
+        lines.append(f"<b>{html.escape(name)}</b> - {state}, {seen}, {host.size} sensors")
+    await update.message.reply_html("\n".join(lines) + "\n\nShow readouts with /print_sensors &lt;host&gt;")
+
+
+@user_restricted
+async def top_cmd(update: Update, context: CallbackContext) -> None:
+    """Busiest processes by CPU since the previous call: /top [count]"""
+    count = int(context.args[0]) if context.args and context.args[0].isdigit() else config.top_processes
+    count = min(max(count, 1), TOP_PROCESSES_MAX)
+    processes = await asyncio.get_running_loop().run_in_executor(None, get_top_processes, count)
+    rows = [f"{pid:>7d} {cpu:6.1f} {rss / 1048576:8.1f} {name}" for pid, name, cpu, rss in processes]
+    text = "\n".join([f"{'pid':>7s} {'cpu %':>6s} {'rss MiB':>8s} name"] + rows)
+    await update.message.reply_html(f"<pre>{html.escape(text)}</pre>")
+
+
+def format_duration(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+def get_stats_text() -> str:
+    rows = [f"{name:32s} {count:7d} {format_duration(p50):>9s} {format_duration(p99):>9s} {format_duration(max_time):>9s}"
+            for name, count, p50, p99, max_time in stats.summary()]
+    header = f"{'name':32s} {'count':>7s} {'p50':>9s} {'p99':>9s} {'max':>9s}"
+    return f"uptime {stats.uptime() / 3600:.1f}h\n" + "\n".join([header] + rows)
+
+
+@admin_restricted
+async def stats_cmd(update: Update, context: CallbackContext) -> None:
+    """Collector, handler, job, Telegram request and event loop latencies"""
+    text = get_stats_text()
+    if len(text) > MessageLimit.MAX_TEXT_LENGTH - 16:
+        text = text[:MessageLimit.MAX_TEXT_LENGTH - 20] + "\n..."
+    await update.message.reply_html(f"<pre>{html.escape(text)}</pre>")
+
+
+async def on_log_stats(context: CallbackContext) -> None:
+    logger.info("stats: " + "; ".join(f"{name} n={count} p50={format_duration(p50)} p99={format_duration(p99)}"
+                                      for name, count, p50, p99, _ in stats.summary()))
 
 
 @user_restricted
@@ -181,9 +241,13 @@ async def help_cmd(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
     log_cmd(user, "help_cmd")
     help_msg = ("Bot usage: select from the menu or type commands to interact with the bot. List of commands:\n\n"
-                "<u>print_sensors</u> - display current sensor readouts on host machine\n\n"
+                "<u>print_sensors</u> [host] - display current sensor readouts on host machine, or on a host reporting to the hub\n\n"
                 "<u>reboot_host</u> - attempt to execute reboot on host machine (root access required, default 1 minute)\n\n"
                 "<u>shutdown_host</u> - attempt to shutdown host machine (root access required, default 1 minute)\n\n"
+                "<u>history</u> &lt;sensor&gt; [window] - min/avg/max/last readings of a sensor, window like 10m, 6h, 7d (default 1h)\n\n"
+                "<u>hosts</u> - hosts reporting to the hub and their state\n\n"
+                "<u>top</u> [count] - busiest processes by CPU usage since the previous call\n\n"
+                "<u>stats</u> - bot latency stats: sensor collectors, commands, jobs, Telegram requests, event loop lag\n\n"
                 f"Take a look at source code for additional info, or to try it out yourself at <a href='{SOURCE_WEB_LINK}'>GitHub</a>")
     await update.message.reply_html(help_msg, disable_web_page_preview=True)
 
@@ -1,8 +1,11 @@
 import logging
 import os
 import configparser
+from urllib.parse import urlparse
+import time
 from functools import wraps
 from typing import Callable
+from monitor.instrumentation import stats
 
 
 CONFIG_FILE_NAME = "config"
@@ -12,6 +15,8 @@ QUERY_PATTERN_REFRESH = "c_re"
 QUERY_PATTERN_TOGGLE_REFRESH = "c_toggle_re"
 QUERY_PATTERN_CONFIRM_REBOOT = "c_call_reboot"
 QUERY_PATTERN_CONFIRM_SHUTDOWN = "c_call_shut"
+QUERY_PATTERN_PAGE = "c_page"
+QUERY_DATA_SEPARATOR = ":"
 SOURCE_WEB_LINK = "https://github.com/Helther/server-mon-bot.git"
 REBOOT_CMD_DELAY_DEFAULT = 1
 SHUTDOWN_CMD_DELAY_DEFAULT = 1
@@ -19,6 +24,39 @@ REFRESH_RATE_DEFAULT = 5
 AUTO_REFRESH_JOB_NAME = "auto_refresh_job"
 SENSOR_WATCH_REFRESH_RATE_DEFAULT = 5
 SENSOR_WATCH_THRESHOLD_DEFAULT = 1
+HISTORY_WINDOW_DEFAULT = "1h"
+REFRESH_RESOLUTION_DEFAULT = 1.0
+REFRESH_FORCE_INTERVAL_DEFAULT = 60
+SENSOR_SAMPLE_RATE_DEFAULT = 1
+SENSOR_SAMPLE_MAX_AGE_DEFAULT = 2
+API_BASE_URL_DEFAULT = "https://api.telegram.org/bot"
+SENSOR_BACKEND_PSUTIL = "psutil"
+SENSOR_BACKEND_HWMON = "hwmon"
+SENSOR_READ_TIMEOUT_DEFAULT = 2.0
+SENSOR_READ_TIMEOUT_SUFFIX = "_read_timeout"
+TOPOLOGY_RESCAN_INTERVAL_DEFAULT = 300
+METRICS_ADDRESS_DEFAULT = "127.0.0.1"
+STATS_LOG_INTERVAL_DEFAULT = 3600
+STATS_LOG_JOB_NAME = "stats_log_job"
+UPDATE_MODE_POLLING = "polling"
+UPDATE_MODE_WEBHOOK = "webhook"
+WEBHOOK_LISTEN_DEFAULT = "127.0.0.1"
+WEBHOOK_PORT_DEFAULT = 8443
+WEBHOOK_SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+HISTORY_DIR_DEFAULT = os.path.join(DATA_PATH, "history")
+HISTORY_RETENTION_DEFAULT = "30d"
+HISTORY_RAW_RETENTION_DEFAULT = "1d"
+HISTORY_COMPACT_JOB_NAME = "history_compact_job"
+HISTORY_COMPACT_INTERVAL = 3600
+HUB_HOST_TIMEOUT_DEFAULT = 10
+SENSOR_STATS_WINDOW_DEFAULT = 300
+WATCH_SCHEDULE_FIXED = "fixed"
+WATCH_SCHEDULE_ADAPTIVE = "adaptive"
+WATCH_INTERVAL_MIN_DEFAULT = 1
+WATCH_INTERVAL_MAX_DEFAULT = 30
+TOP_PROCESSES_DEFAULT = 10
+TOP_PROCESSES_MAX = 50  # fits one message
+LIFECYCLE_NOTIFY_TIMEOUT = 5  # online and offline notices to all users, shutdown is not held up longer
 
 # Enable logging
 logging.basicConfig(
@@ -31,12 +69,40 @@ logger.setLevel(logging.DEBUG)
 class Config(object):
     def __init__(self) -> None:
         self.token = ""
+        self.api_base_url = API_BASE_URL_DEFAULT
         self.user_id_set: set = set()
         self.reboot_time_minutes = 0
         self.update_period_seconds = 0
         self.shutdown_time_minutes = 0
         self.sensor_watch_time = 0
         self.sensor_watch_threshold = 0
+        self.sensor_sample_time = 0
+        self.sensor_sample_max_age = 0
+        self.sensor_read_timeouts: dict[str, float] = {}
+        self.sensor_backend = SENSOR_BACKEND_PSUTIL
+        self.topology_rescan_interval = TOPOLOGY_RESCAN_INTERVAL_DEFAULT
+        self.metrics_address = METRICS_ADDRESS_DEFAULT
+        self.metrics_port = 0
+        self.stats_log_interval = STATS_LOG_INTERVAL_DEFAULT
+        self.update_mode = UPDATE_MODE_POLLING
+        self.webhook_url = ""
+        self.webhook_path = ""
+        self.webhook_listen = WEBHOOK_LISTEN_DEFAULT
+        self.webhook_port = WEBHOOK_PORT_DEFAULT
+        self.webhook_secret = ""
+        self.history_dir = HISTORY_DIR_DEFAULT
+        self.history_retention = 0
+        self.history_raw_retention = 0
+        self.sensor_stats_window = SENSOR_STATS_WINDOW_DEFAULT
+        self.watch_schedule = WATCH_SCHEDULE_FIXED
+        self.watch_interval_min = WATCH_INTERVAL_MIN_DEFAULT
+        self.watch_interval_max = WATCH_INTERVAL_MAX_DEFAULT
+        self.hub_listen = ""
+        self.hub_secret = ""
+        self.hub_host_timeout = HUB_HOST_TIMEOUT_DEFAULT
+        self.top_processes = TOP_PROCESSES_DEFAULT
+        self.refresh_resolution = REFRESH_RESOLUTION_DEFAULT
+        self.refresh_force_interval = REFRESH_FORCE_INTERVAL_DEFAULT
 
     def is_user_specified(self) -> bool:
         return len(self.user_id_set) != 0
@@ -47,6 +113,7 @@ class Config(object):
             config.read_file(config_file)
             config_section_name = "Main"
             self.token = config[config_section_name]["TOKEN"]  # if config invalid then terminate
+            self.api_base_url = config[config_section_name].get("API_BASE_URL", API_BASE_URL_DEFAULT)
             user_id_str = config[config_section_name].get("USER_ID", None)
             if user_id_str:
                 user_id_str = user_id_str.replace(" ", "")
@@ -69,10 +136,90 @@ class Config(object):
             self.sensor_watch_threshold = int(config[config_section_name].get("SENSOR_WATCH_THRESHOLD", SENSOR_WATCH_THRESHOLD_DEFAULT))
             if self.sensor_watch_threshold <= 0:
                 self.sensor_watch_threshold = SENSOR_WATCH_THRESHOLD_DEFAULT
+            self.sensor_sample_time = int(config[config_section_name].get("SENSOR_SAMPLE_RATE", SENSOR_SAMPLE_RATE_DEFAULT))
+            if self.sensor_sample_time <= 0:
+                self.sensor_sample_time = SENSOR_SAMPLE_RATE_DEFAULT
+            self.sensor_sample_max_age = int(config[config_section_name].get("SENSOR_SAMPLE_MAX_AGE", SENSOR_SAMPLE_MAX_AGE_DEFAULT))
+            if self.sensor_sample_max_age < 0:
+                self.sensor_sample_max_age = SENSOR_SAMPLE_MAX_AGE_DEFAULT
+            self.refresh_resolution = float(config[config_section_name].get("REFRESH_RESOLUTION", REFRESH_RESOLUTION_DEFAULT))
+            if self.refresh_resolution < 0:
+                self.refresh_resolution = REFRESH_RESOLUTION_DEFAULT
+            self.refresh_force_interval = int(config[config_section_name].get("REFRESH_FORCE_INTERVAL", REFRESH_FORCE_INTERVAL_DEFAULT))
+            if self.refresh_force_interval <= 0:
+                self.refresh_force_interval = REFRESH_FORCE_INTERVAL_DEFAULT
+            self.sensor_backend = config[config_section_name].get("SENSOR_BACKEND", SENSOR_BACKEND_PSUTIL).lower()
+            if self.sensor_backend not in (SENSOR_BACKEND_PSUTIL, SENSOR_BACKEND_HWMON):
+                self.sensor_backend = SENSOR_BACKEND_PSUTIL
+            self.topology_rescan_interval = int(config[config_section_name].get("TOPOLOGY_RESCAN_INTERVAL", TOPOLOGY_RESCAN_INTERVAL_DEFAULT))
+            if self.topology_rescan_interval <= 0:
+                self.topology_rescan_interval = TOPOLOGY_RESCAN_INTERVAL_DEFAULT
+            self.metrics_address = config[config_section_name].get("METRICS_ADDRESS", METRICS_ADDRESS_DEFAULT)
+            self.metrics_port = int(config[config_section_name].get("METRICS_PORT", 0))
+            if not 0 <= self.metrics_port <= 65535:
+                self.metrics_port = 0
+            self.stats_log_interval = int(config[config_section_name].get("STATS_LOG_INTERVAL", STATS_LOG_INTERVAL_DEFAULT))
+            if self.stats_log_interval < 0:
+                self.stats_log_interval = STATS_LOG_INTERVAL_DEFAULT
+            self.update_mode = config[config_section_name].get("UPDATE_MODE", UPDATE_MODE_POLLING).lower()
+            if self.update_mode not in (UPDATE_MODE_POLLING, UPDATE_MODE_WEBHOOK):
+                self.update_mode = UPDATE_MODE_POLLING
+            self.webhook_url = config[config_section_name].get("WEBHOOK_URL", "")
+            self.webhook_path = config[config_section_name].get("WEBHOOK_PATH", urlparse(self.webhook_url).path).strip("/")
+            self.webhook_listen = config[config_section_name].get("WEBHOOK_LISTEN", WEBHOOK_LISTEN_DEFAULT)
+            self.webhook_port = int(config[config_section_name].get("WEBHOOK_PORT", WEBHOOK_PORT_DEFAULT))
+            if not 0 < self.webhook_port <= 65535:
+                self.webhook_port = WEBHOOK_PORT_DEFAULT
+            self.webhook_secret = config[config_section_name].get("WEBHOOK_SECRET", "")
+            self.history_dir = config[config_section_name].get("HISTORY_DIR", HISTORY_DIR_DEFAULT)
+            history_retention = config[config_section_name].get("HISTORY_RETENTION", HISTORY_RETENTION_DEFAULT)
+            self.history_retention = 0 if history_retention.strip() == "0" else parse_duration(history_retention)
+            self.history_raw_retention = parse_duration(config[config_section_name].get("HISTORY_RAW_RETENTION", HISTORY_RAW_RETENTION_DEFAULT))
+            self.sensor_stats_window = parse_duration(config[config_section_name].get("SENSOR_STATS_WINDOW", str(SENSOR_STATS_WINDOW_DEFAULT)))
+            self.watch_schedule = config[config_section_name].get("WATCH_SCHEDULE", WATCH_SCHEDULE_FIXED).lower()
+            if self.watch_schedule not in (WATCH_SCHEDULE_FIXED, WATCH_SCHEDULE_ADAPTIVE):
+                self.watch_schedule = WATCH_SCHEDULE_FIXED
+            self.watch_interval_min = float(config[config_section_name].get("WATCH_INTERVAL_MIN", WATCH_INTERVAL_MIN_DEFAULT))
+            if self.watch_interval_min <= 0:
+                self.watch_interval_min = WATCH_INTERVAL_MIN_DEFAULT
+            self.watch_interval_max = float(config[config_section_name].get("WATCH_INTERVAL_MAX", WATCH_INTERVAL_MAX_DEFAULT))
+            if self.watch_interval_max < self.watch_interval_min:
+                self.watch_interval_max = max(WATCH_INTERVAL_MAX_DEFAULT, self.watch_interval_min)
+            self.hub_listen = config[config_section_name].get("HUB_LISTEN", "")
+            self.hub_secret = config[config_section_name].get("HUB_SECRET", "")
+            self.hub_host_timeout = int(config[config_section_name].get("HUB_HOST_TIMEOUT", HUB_HOST_TIMEOUT_DEFAULT))
+            if self.hub_host_timeout <= 0:
+                self.hub_host_timeout = HUB_HOST_TIMEOUT_DEFAULT
+            self.top_processes = int(config[config_section_name].get("TOP_PROCESSES", TOP_PROCESSES_DEFAULT))
+            if self.top_processes <= 0:
+                self.top_processes = TOP_PROCESSES_DEFAULT
+            for key, value in config[config_section_name].items():
+                if key.endswith(SENSOR_READ_TIMEOUT_SUFFIX):
+                    timeout = float(value)
+                    if timeout > 0:
+                        self.sensor_read_timeouts[key[:-len(SENSOR_READ_TIMEOUT_SUFFIX)]] = timeout
+
+    def get_read_timeout(self, source: str) -> float:
+        return self.sensor_read_timeouts.get(source, SENSOR_READ_TIMEOUT_DEFAULT)
 
 config = Config()
 
 
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(text: str) -> int:
+    """seconds from strings like 90, 30s, 10m, 6h, 7d"""
+    text = text.strip().lower()
+    if text and text[-1] in DURATION_UNITS:
+        seconds = int(text[:-1]) * DURATION_UNITS[text[-1]]
+    else:
+        seconds = int(text)
+    if seconds <= 0:
+        raise ValueError("duration must be positive")
+    return seconds
+
+
 def log_cmd(user, name: str) -> None:
     logger.info(f"user: {user.full_name} with id: {user.id} called: {name}")
 
@@ -91,9 +238,26 @@ def user_restricted(func: Callable):
             return  # quit function
 
         log_cmd(user, func.__name__)
-        return await func(update, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await func(update, *args, **kwargs)
+        finally:
+            stats.observe(f"handler.{func.__name__}", time.perf_counter() - start)
     return inner
 
 
+def admin_restricted(func: Callable):
+    """Restrict usage of func to configured users, unavailable if the bot is public"""
+    @wraps(func)
+    async def inner(update, *args, **kwargs):
+        if not config.is_user_specified():
+            logger.debug(f"Call of admin only {func.__name__} on a public bot by user: {update.effective_user.full_name}")
+            if update.effective_message:
+                await update.effective_message.reply_html("This command is available only when USER_ID is configured")
+            return
+        return await func(update, *args, **kwargs)
+    return user_restricted(inner)
+
+
 async def answer_query(query) -> None:
     await query.answer()
@@ -0,0 +1,392 @@
+"""
+Persistent sensor history log.
+
+Watched snapshots are appended to fixed size binary records in segment files under the
+history directory, so history survives restarts. A segment header maps record columns to
+sensors (config name, chip, label, units), a record is a float64 timestamp followed by
+float32 columns, NaN for a sensor without a fresh reading.
+
+    header: MAGIC, struct HEADER (fields, sensor count, resolution, header size),
+            per sensor: integral flag and length prefixed key, name, label, units
+    record: timestamp, then fields values per sensor (raw: value, compacted: avg, min, max)
+
+A new segment is started on launch, every SEGMENT_SECONDS and when a new sensor appears,
+so a segment is never rewritten while it is written. Segments are read through mmap,
+values are read in place. A sparse index of every SPARSE_INDEX_STEP-th record timestamp
+locates the first record of a time range with a bisect. Raw segments older than the raw
+retention are downsampled to COMPACT_RESOLUTION buckets in the background and segments
+past the retention are deleted.
+"""
+
+import asyncio
+import bisect
+import glob
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from typing import Optional
+from monitor.bot_utils import config, logger
+from monitor.sensor_history import HistoryStats, sensor_history
+from monitor.sensor_registry import SensorRegistry
+
+MAGIC = b"MONHLOG1"
+HEADER = struct.Struct("<IIdI")  # fields per sensor, sensor count, resolution, header size
+SENSOR_HEADER = struct.Struct("<B")  # integral flag
+STRING_SIZE = struct.Struct("<H")
+TIMESTAMP = struct.Struct("<d")
+VALUE = struct.Struct("<f")
+SEGMENT_SUFFIX = ".hlog"
+SEGMENT_SECONDS = 3600
+SPARSE_INDEX_STEP = 64
+COMPACT_RESOLUTION = 60
+FIELDS_RAW = 1
+FIELDS_COMPACTED = 3  # avg, min, max
+FLOAT32_DIGITS = 6  # significant digits a float32 column keeps
+
+
+class SegmentSensor:
+    __slots__ = ("key", "name", "label", "units", "integral")
+
+    def __init__(self, key: str, name: str, label: str, units: str, integral: bool) -> None:
+        self.key = key
+        self.name = name
+        self.label = label
+        self.units = units
+        self.integral = integral
+
+
+def encode_header(fields: int, resolution: float, sensors: list[SegmentSensor]) -> bytes:
+    table = bytearray()
+    for sensor in sensors:
+        table += SENSOR_HEADER.pack(sensor.integral)
+        for text in (sensor.key, sensor.name, sensor.label, sensor.units):
+            encoded = text.encode()
+            table += STRING_SIZE.pack(len(encoded)) + encoded
+    header_size = len(MAGIC) + HEADER.size + len(table)
+    header_size += -header_size % 8  # keep records 8 byte aligned
+    header = MAGIC + HEADER.pack(fields, len(sensors), resolution, header_size) + table
+    return header.ljust(header_size, b"\0")
+
+
+class HistorySegment:
+    """read side of a segment file, mapped read only and remapped when it has grown"""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.sensors: list[SegmentSensor] = []
+        self.columns: dict[str, int] = {}
+        self.map: Optional[mmap.mmap] = None
+        self.mapped_size = 0
+        self.count = 0
+        self.sparse_index: list[float] = []
+        with open(path, "rb") as fp:
+            self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mapped_size = len(self.map)
+        self._parse_header()
+        self._index()
+
+    def _parse_header(self) -> None:
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a history segment")
+        self.fields, sensor_count, self.resolution, self.header_size = HEADER.unpack_from(self.map, len(MAGIC))
+        offset = len(MAGIC) + HEADER.size
+        for _ in range(sensor_count):
+            integral, = SENSOR_HEADER.unpack_from(self.map, offset)
+            offset += SENSOR_HEADER.size
+            texts = []
+            for _ in range(4):
+                size, = STRING_SIZE.unpack_from(self.map, offset)
+                offset += STRING_SIZE.size
+                texts.append(self.map[offset:offset + size].decode())
+                offset += size
+            self.sensors.append(SegmentSensor(*texts, bool(integral)))
+        self.columns = {sensor.key: column for column, sensor in enumerate(self.sensors)}
+        self.record_size = TIMESTAMP.size + VALUE.size * self.fields * sensor_count
+
+    def _index(self) -> None:
+        # a torn record at the end after a crash is ignored
+        self.count = (self.mapped_size - self.header_size) // self.record_size
+        for record_i in range(len(self.sparse_index) * SPARSE_INDEX_STEP, self.count, SPARSE_INDEX_STEP):
+            self.sparse_index.append(self.timestamp(record_i))
+
+    def refresh(self) -> None:
+        """pick up records appended since the segment was mapped"""
+        size = os.path.getsize(self.path)
+        if size > self.mapped_size:
+            with open(self.path, "rb") as fp:
+                self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mapped_size = len(self.map)
+            self._index()
+
+    def timestamp(self, record_i: int) -> float:
+        return TIMESTAMP.unpack_from(self.map, self.header_size + record_i * self.record_size)[0]
+
+    def start(self) -> float:
+        return self.timestamp(0) if self.count else math.inf
+
+    def end(self) -> float:
+        return self.timestamp(self.count - 1) if self.count else -math.inf
+
+    def find(self, since: float) -> int:
+        """index of the first record at or after since"""
+        block = max(0, bisect.bisect_right(self.sparse_index, since) - 1)
+        lo, hi = block * SPARSE_INDEX_STEP, min(self.count, (block + 1) * SPARSE_INDEX_STEP)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp(mid) < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def values(self, record_i: int) -> memoryview:
+        """float32 columns of a record, a view into the mapping"""
+        offset = self.header_size + record_i * self.record_size + TIMESTAMP.size
+        return memoryview(self.map)[offset:offset + self.record_size - TIMESTAMP.size].cast('f')
+
+    def column_stats(self, column: int, since: float, until: float) -> Optional[tuple[float, float, float, float, float, int]]:
+        """min, resolution weighted sum, weight, max, last and number of records in [since, until]"""
+        lo, hi, total, weight, last, num = math.inf, -math.inf, 0.0, 0.0, math.nan, 0
+        first = column * self.fields * VALUE.size + TIMESTAMP.size
+        offset = self.header_size + self.find(since) * self.record_size
+        end = self.header_size + self.count * self.record_size
+        while offset < end:
+            if TIMESTAMP.unpack_from(self.map, offset)[0] > until:
+                break
+            avg = VALUE.unpack_from(self.map, offset + first)[0]
+            if avg == avg:
+                if self.fields == FIELDS_COMPACTED:
+                    low = VALUE.unpack_from(self.map, offset + first + VALUE.size)[0]
+                    high = VALUE.unpack_from(self.map, offset + first + 2 * VALUE.size)[0]
+                else:
+                    low = high = avg
+                lo = min(lo, low)
+                hi = max(hi, high)
+                total += avg * self.resolution
+                weight += self.resolution
+                last = avg
+                num += 1
+            offset += self.record_size
+        if num == 0:
+            return None
+        return lo, total, weight, hi, last, num
+
+
+class SegmentWriter:
+    def __init__(self, path: str, start: float, fields: int, resolution: float, sensors: list[SegmentSensor]) -> None:
+        self.path = path
+        self.start = start
+        self.keys = {sensor.key for sensor in sensors}
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.write(self.fd, encode_header(fields, resolution, sensors))
+
+    def write(self, record: bytes) -> None:
+        os.write(self.fd, record)
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def segment_path(directory: str, timestamp: float) -> str:
+    return os.path.join(directory, f"{int(timestamp * 1000):015d}{SEGMENT_SUFFIX}")
+
+
+class HistoryLog:
+    def __init__(self) -> None:
+        self.directory = ""
+        self.segments: list[HistorySegment] = []
+        self.writer: Optional[SegmentWriter] = None
+        self.writer_segment: Optional[HistorySegment] = None
+        self.writer_ids: list[int] = []  # sensor id of each writer column
+        self.enabled = False
+        # snapshot topology the writer columns were resolved for: (index, [(column, sensor id)])
+        self._columns: tuple[Optional[dict], list[tuple[int, int]]] = (None, [])
+        self._column_count = 0
+        self._lock = threading.Lock()
+
+    def open(self, directory: str) -> None:
+        """map existing segments, new records go to a fresh segment"""
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        segments = []
+        for path in sorted(glob.glob(os.path.join(directory, f"*{SEGMENT_SUFFIX}"))):
+            try:
+                segment = HistorySegment(path)
+            except (OSError, ValueError, struct.error) as e:
+                logger.error(f"Skipping unreadable history segment {path} - {e}")
+                continue
+            if segment.count:
+                segments.append(segment)
+            else:  # interrupted right after it was started
+                os.remove(path)
+        self.segments = segments
+        self.enabled = True
+        logger.info(f"History log: {len(segments)} segments in {directory}")
+
+    def close(self) -> None:
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        self.enabled = False
+
+    def _start_segment(self, timestamp: float, registry: SensorRegistry, sensor_ids: list[int]) -> None:
+        if self.writer:
+            self.writer.close()
+        if self.writer_segment is not None:
+            self.writer_segment.refresh()
+        infos = [registry.infos[sensor_id] for sensor_id in sensor_ids]
+        sensors = [SegmentSensor(info.key, info.name, info.label, info.units, info.integral) for info in infos]
+        start = timestamp
+        path = segment_path(self.directory, timestamp)
+        while os.path.exists(path):
+            timestamp += 0.001
+            path = segment_path(self.directory, timestamp)
+        self.writer = SegmentWriter(path, start, FIELDS_RAW, config.sensor_watch_time, sensors)
+        self.writer_ids = sensor_ids
+        self.writer_segment = None
+        self._columns = (None, [])
+
+    def append(self, snapshot) -> None:
+        """append fresh readings of the snapshot as a raw record"""
+        if not self.enabled:
+            return
+        index = snapshot.sensors.index
+        if not index:
+            return
+        try:
+            if (self.writer is None or snapshot.timestamp - self.writer.start >= SEGMENT_SECONDS
+                    or not self.writer.keys.issuperset(index)):
+                known = self.writer_ids if self.writer else []
+                known_ids = set(known)
+                new_ids = [sensor_id for sensor_id in index.values() if sensor_id not in known_ids]
+                self._start_segment(snapshot.timestamp, snapshot.registry, known + new_ids)
+
+            if self._columns[0] is not index:
+                column_of = {sensor_id: column for column, sensor_id in enumerate(self.writer_ids)}
+                self._columns = (index, [(column_of[sensor_id], sensor_id) for sensor_id in index.values()])
+            values = array('f', [math.nan]) * len(self.writer_ids)
+            packed = snapshot.values
+            for column, sensor_id in self._columns[1]:
+                values[column] = packed[sensor_id]
+            self.writer.write(TIMESTAMP.pack(snapshot.timestamp) + values.tobytes())
+
+            if self.writer_segment is None:
+                self.writer_segment = HistorySegment(self.writer.path)
+                with self._lock:
+                    self.segments.append(self.writer_segment)
+        except OSError as e:
+            logger.error(f"Failed to append to history log, disabling it - {e}")
+            self.close()
+
+    def stats(self, key: str, since: float, until: float = math.inf) -> Optional[HistoryStats]:
+        with self._lock:
+            segments = list(self.segments)
+        writer_segment = self.writer_segment  # read off the event loop, the writer may roll meanwhile
+        if writer_segment is not None:
+            writer_segment.refresh()
+
+        lo, total, weight, hi, last, num, units = math.inf, 0.0, 0.0, -math.inf, math.nan, 0, ""
+        integral = False
+        for segment in segments:
+            column = segment.columns.get(key)
+            if column is None or segment.end() < since or segment.start() > until:
+                continue
+            res = segment.column_stats(column, since, until)
+            if res is None:
+                continue
+            lo, total, weight = min(lo, res[0]), total + res[1], weight + res[2]
+            hi, last, num = max(hi, res[3]), res[4], num + res[5]
+            units, integral = segment.sensors[column].units, segment.sensors[column].integral
+        if num == 0:
+            return None
+        # last is shown as is, drop the digits float32 made up: 45.3 not 45.29999923706055
+        last = int(last) if integral else float(f"{last:.{FLOAT32_DIGITS}g}")
+        return HistoryStats(lo, total / weight, hi, last, units, num)
+
+    def _compact_segment(self, segment: HistorySegment) -> HistorySegment:
+        """downsample a raw segment into a compacted one written next to it"""
+        columns = len(segment.sensors)
+        records = bytearray()
+        bucket, count = None, 0
+        avg = array('f')
+        low = array('f')
+        high = array('f')
+
+        def flush():
+            if bucket is not None:
+                values = array('f', [math.nan]) * (columns * FIELDS_COMPACTED)
+                values[0::3], values[1::3], values[2::3] = avg, low, high
+                records.extend(TIMESTAMP.pack(bucket) + values.tobytes())
+
+        for record_i in range(segment.count):
+            timestamp = segment.timestamp(record_i)
+            record_bucket = timestamp - timestamp % COMPACT_RESOLUTION
+            if record_bucket != bucket:
+                flush()
+                bucket = record_bucket
+                avg, low, high = (array('f', [math.nan]) * columns for _ in range(3))
+                counts = [0] * columns
+            for column, value in enumerate(segment.values(record_i)):
+                if value != value:
+                    continue
+                num = counts[column]
+                if num == 0:
+                    avg[column] = low[column] = high[column] = value
+                else:
+                    avg[column] += (value - avg[column]) / (num + 1)
+                    low[column] = min(low[column], value)
+                    high[column] = max(high[column], value)
+                counts[column] = num + 1
+        flush()
+
+        path = segment.path + ".tmp"
+        with open(path, "wb") as fp:
+            fp.write(encode_header(FIELDS_COMPACTED, COMPACT_RESOLUTION, segment.sensors))
+            fp.write(records)
+        os.replace(path, segment.path)
+        return HistorySegment(segment.path)
+
+    def compact(self, now: Optional[float] = None) -> None:
+        """downsample raw segments past the raw retention, delete segments past the retention"""
+        if not self.enabled:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            segments = list(self.segments)
+        for segment in segments:
+            if segment is self.writer_segment:
+                continue
+            replacement = segment
+            try:
+                if segment.end() < now - config.history_retention:
+                    os.remove(segment.path)
+                    replacement = None
+                elif segment.fields == FIELDS_RAW and segment.end() < now - config.history_raw_retention:
+                    replacement = self._compact_segment(segment)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to compact history segment {segment.path} - {e}")
+                continue
+            if replacement is not segment:
+                # replaced mappings are not closed here, a query may still read them, they go with the last reference
+                with self._lock:
+                    i = self.segments.index(segment)
+                    if replacement is None:
+                        del self.segments[i]
+                    else:
+                        self.segments[i] = replacement
+
+
+async def get_history_stats(name: str, window: float) -> Optional[HistoryStats]:
+    """stats from memory while it covers the window, from the history log otherwise, scanned in an executor"""
+    if not history_log.enabled or sensor_history.covers(window):
+        return sensor_history.stats(name, window)
+    res = await asyncio.get_running_loop().run_in_executor(None, history_log.stats, name, time.time() - window)
+    return res or sensor_history.stats(name, window)
+
+
+history_log = HistoryLog()
@@ -0,0 +1,233 @@
+"""
+Multi-host snapshot hub.
+
+Agents (python -m monitor.agent) on other hosts push binary snapshots to HUB_LISTEN, the hub
+keeps the latest snapshot of every host in its own sensor registry so readouts render from
+cache, and evaluates the sensor action rules per host. System actions of rules are never
+executed by the hub for remote hosts, their users are only notified.
+
+A host that disconnected or sent nothing for HUB_HOST_TIMEOUT seconds is reported stale,
+users are notified when a host goes stale and when it comes back.
+"""
+
+import asyncio
+import hmac
+import html
+import os
+import time
+from types import MappingProxyType
+from typing import Optional
+from telegram.ext import CallbackContext
+from monitor.bot_utils import config, logger
+from monitor.instrumentation import stats
+from monitor.sensor_registry import SensorRegistry, pack_values
+from monitor.sensor_sampler import SensorSnapshot
+from monitor.sensor_watch import RuleTable, Action, sensor_action_config, notify_users
+from monitor.snapshot_protocol import (
+    ProtocolError,
+    Topology,
+    FRAME_HELLO,
+    FRAME_TOPOLOGY,
+    FRAME_SAMPLE,
+    decode_hello,
+    decode_topology,
+    decode_sample,
+    read_frame,
+    parse_address
+)
+
+HUB_WATCH_JOB_NAME = "hub_watch_job"
+HELLO_TIMEOUT = 10
+HOST_NAME_MAX_SIZE = 32  # host is part of readout button callback data, limited to 64 bytes
+
+
+class HostState:
+    """latest snapshot of a remote host, sensor ids are kept across reconnects"""
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.registry = SensorRegistry()
+        self.groups: dict[str, tuple[int, ...]] = {}
+        self.size = 0
+        self.snapshot: Optional[SensorSnapshot] = None
+        self.connection: Optional[object] = None
+        self.last_seen = 0.0  # monotonic
+        self.reported_stale = False
+        self.rules: Optional[RuleTable] = None
+        self.checked_at = 0.0  # timestamp of the last snapshot evaluated by rules
+
+    def set_topology(self, topology: Topology) -> None:
+        self.groups = {group: tuple(self.registry.intern(name, label, units, key, integral)
+                                    for key, name, label, units, integral in sensors)
+                       for group, sensors in topology}
+        self.size = sum(len(ids) for ids in self.groups.values())
+
+    def add_sample(self, timestamp: float, stale: frozenset, fresh_mask: int, values) -> None:
+        if len(values) != self.size:
+            raise ProtocolError(f"sample of {len(values)} values does not match topology of {self.size} sensors")
+        packed = pack_values(len(self.registry))
+        value_i = 0
+        for ids in self.groups.values():
+            for sensor_id in ids:
+                packed[sensor_id] = values[value_i]
+                value_i += 1
+        self.snapshot = SensorSnapshot(timestamp=timestamp,
+                                       values=packed,
+                                       groups=MappingProxyType(self.groups),
+                                       stale=stale,
+                                       fresh_groups=tuple(group for group_i, group in enumerate(self.groups)
+                                                          if fresh_mask >> group_i & 1),
+                                       registry=self.registry)
+        self.last_seen = time.monotonic()
+
+    def is_connected(self) -> bool:
+        return self.connection is not None
+
+    def is_stale(self) -> bool:
+        return not self.is_connected() or time.monotonic() - self.last_seen > config.hub_host_timeout
+
+    def get_rules(self) -> RuleTable:
+        """per host rule states, rebuilt when the rule config changes"""
+        rules = sensor_action_config.rules
+        if self.rules is None or self.rules.entries is not rules.entries:
+            self.rules = RuleTable(rules.entries, bind=False)
+        return self.rules
+
+
+class SnapshotHub:
+    def __init__(self) -> None:
+        self.hosts: dict[str, HostState] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.socket_path: Optional[str] = None
+        self.connections: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    def get_snapshot(self, host: str) -> Optional[SensorSnapshot]:
+        state = self.hosts.get(host)
+        return state.snapshot if state is not None else None
+
+    def is_stale(self, host: str) -> bool:
+        state = self.hosts.get(host)
+        return state is None or state.is_stale()
+
+    async def _receive(self, connection: object, reader: asyncio.StreamReader) -> None:
+        payload = await asyncio.wait_for(read_frame(reader), HELLO_TIMEOUT)
+        if payload is None or payload[:1] != FRAME_HELLO:
+            raise ProtocolError("expected hello")
+        name, secret = decode_hello(payload)
+        if not hmac.compare_digest(secret.encode(), config.hub_secret.encode()):
+            raise ProtocolError(f"invalid secret from host {name}")
+        if not name or len(name.encode()) > HOST_NAME_MAX_SIZE:
+            raise ProtocolError(f"invalid host name {name!r}")
+
+        host = self.hosts.get(name)
+        if host is None:
+            host = self.hosts[name] = HostState(name)
+        host.connection = connection  # a reconnect takes over from a connection not yet noticed as closed
+        logger.info(f"Hub: host {name} connected")
+        while True:
+            payload = await read_frame(reader)
+            if payload is None or host.connection is not connection:
+                return
+            start = time.perf_counter()
+            kind = payload[:1]
+            if kind == FRAME_SAMPLE:
+                host.add_sample(*decode_sample(payload))
+            elif kind == FRAME_TOPOLOGY:
+                host.set_topology(decode_topology(payload))
+            else:
+                raise ProtocolError(f"unknown frame type {kind!r}")
+            stats.observe("hub.frame", time.perf_counter() - start)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = object()
+        self.connections[writer] = asyncio.current_task()
+        try:
+            await self._receive(connection, reader)
+        except (ProtocolError, UnicodeDecodeError, asyncio.TimeoutError) as e:
+            logger.warning(f"Hub: dropped agent connection - {e}")
+        except ConnectionError:
+            pass
+        except Exception as e:
+            logger.error(f"Hub: agent connection failed - {e}")
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+            for state in self.hosts.values():
+                if state.connection is connection:
+                    state.connection = None
+                    logger.info(f"Hub: host {state.name} disconnected")
+
+    async def start(self) -> None:
+        if not config.hub_listen:
+            return
+        try:
+            path, host, port = parse_address(config.hub_listen)
+            if path:
+                if os.path.exists(path):
+                    os.unlink(path)  # left over by an unclean exit
+                self.server = await asyncio.start_unix_server(self._handle, path)
+                self.socket_path = path
+            else:
+                self.server = await asyncio.start_server(self._handle, host, port)
+        except (OSError, ValueError) as e:
+            logger.error(f"Hub failed to listen on {config.hub_listen} - {e}")
+            return
+        if not config.hub_secret:
+            logger.warning("HUB_SECRET is not set, any agent that can reach the hub is accepted")
+        logger.info(f"Hub listening on {config.hub_listen}")
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            # agent connections are not closed with the server, let their handlers finish on end of stream
+            tasks = list(self.connections.values())
+            for writer in list(self.connections):
+                writer.close()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+        if self.socket_path is not None:
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+            self.socket_path = None
+
+    def check_hosts(self, threshold: int) -> list[str]:
+        """evaluate rules on new snapshots of every host, returns alerts including stale host changes"""
+        alerts = []
+        for host in self.hosts.values():
+            name = html.escape(host.name)
+            stale = host.is_stale()
+            if stale != host.reported_stale:
+                host.reported_stale = stale
+                alerts.append(f"Hub: host <b>{name}</b> is stale, no snapshot for {time.monotonic() - host.last_seen:.0f}s"
+                              if stale else f"Hub: host <b>{name}</b> is reporting again")
+            snapshot = host.snapshot
+            if stale or snapshot is None or snapshot.timestamp <= host.checked_at:
+                continue
+            host.checked_at = snapshot.timestamp
+
+            rules = host.get_rules()
+            for rule_i, value in rules.evaluate_rules(snapshot, threshold):
+                if not rules.fire(rule_i):
+                    continue
+                entry = rules.entries[rule_i]
+                if not entry.action & Action.Notify:
+                    logger.info(f"Hub: rule {entry.name} triggered on host {host.name}, system actions are local only")
+                    continue
+                alert = entry.get_alert_text(value, host.name)
+                if entry.action & (Action.Reboot | Action.Shutdown):
+                    alert += "\nSystem actions are not executed on remote hosts"
+                alerts.append(alert)
+        return alerts
+
+
+async def on_check_hosts(context: CallbackContext):
+    start = time.perf_counter()
+    try:
+        await notify_users(context.bot, snapshot_hub.check_hosts(config.sensor_watch_threshold))
+    finally:
+        stats.observe("job.hub_watch", time.perf_counter() - start)
+
+
+snapshot_hub = SnapshotHub()
@@ -0,0 +1,221 @@
+"""
+Direct hwmon sysfs reader.
+
+psutil rediscovers every /sys/class/hwmon directory, globs its files and opens/closes each
+of them on every call. HwmonReader scans the tree once into an index of inputs, keeps the
+input files open and re-reads them with os.pread on each readout. Discovery and ordering
+follow psutil so the resulting entries, and sensor names built from them, are the same.
+
+The index is the sensor topology: it is rebuilt only when the set of hwmon directories
+changes (hotplug, driver reload) or after the configured rescan interval. Fallback labels
+of unlabeled inputs are assigned once per input file and kept across rescans, so a chip
+appearing or disappearing does not rename the sensors of the others.
+"""
+
+import glob
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Optional
+from monitor.bot_utils import logger, config
+from monitor.sensor_registry import Readings, sensor_registry
+
+HWMON_ROOT = "/sys/class/hwmon"
+READ_SIZE = 32
+
+HwmonEntry = namedtuple("HwmonEntry", ["label", "current"])
+
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except (OSError, ValueError):
+        return None
+
+
+def _input_key(base: str) -> str:
+    """identity of an input that survives hwmonN renumbering, the device it belongs to"""
+    hwmon_dir = os.path.dirname(base)
+    device = os.path.join(hwmon_dir, "device")
+    if os.path.basename(hwmon_dir) == "device" or not os.path.exists(device):
+        return os.path.realpath(base)
+    return os.path.join(os.path.realpath(device), os.path.basename(base))
+
+
+class HwmonInput:
+    __slots__ = ("chip", "label", "path", "scale", "fd", "key", "sensor_id")
+
+    def __init__(self, chip: str, label: str, path: str, scale: float, key: str) -> None:
+        self.chip = chip
+        self.label = label
+        self.path = path
+        self.scale = scale
+        self.fd = -1
+        self.key = key
+        self.sensor_id = -1
+
+    def open(self) -> bool:
+        try:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            self.fd = -1
+        return self.fd >= 0
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def read(self):
+        """current value, None if the driver has no reading right now"""
+        try:
+            raw = int(os.pread(self.fd, READ_SIZE, 0))
+        except (OSError, ValueError):
+            return None
+        return raw / self.scale if self.scale != 1 else raw
+
+
+class HwmonReader:
+    def __init__(self, root: str = HWMON_ROOT) -> None:
+        self.root = root
+        self.temperatures: list[HwmonInput] = []
+        self.fans: list[HwmonInput] = []
+        self.scanned = False
+        self.scanned_at = 0.0
+        self.chip_dirs: frozenset = frozenset()
+        self.fallback_labels: dict[str, str] = {}  # input key: label assigned to an unlabeled input
+        self._lock = threading.RLock()
+
+    def _list_chip_dirs(self) -> frozenset:
+        try:
+            return frozenset(os.listdir(self.root))
+        except OSError:
+            return frozenset()
+
+    def _assign_labels(self, inputs: list[HwmonInput], fallback_suffix: str) -> None:
+        """
+        fallback labels count inputs of a chip in scan order like psutil does, an input keeps
+        its label for the life of the process, a new one takes the first free number
+        """
+        taken = set(self.fallback_labels.values())
+        counters: dict[str, int] = {}
+        for hw_input in inputs:
+            counter = counters.get(hw_input.chip, 0)
+            counters[hw_input.chip] = counter + 1
+            if hw_input.label:
+                continue
+            label = self.fallback_labels.get(hw_input.key)
+            if label is None:
+                label = hw_input.chip + f"_{fallback_suffix}{counter}"
+                while label in taken:
+                    counter += 1
+                    label = hw_input.chip + f"_{fallback_suffix}{counter}"
+                self.fallback_labels[hw_input.key] = label
+                taken.add(label)
+            hw_input.label = label
+
+    def _scan_inputs(self, prefix: str, scale: float, include_device: bool, units: str, fallback_suffix: str) -> list[HwmonInput]:
+        basenames = glob.glob(os.path.join(self.root, f"hwmon*/{prefix}*_*"))
+        if include_device or not basenames:
+            basenames.extend(glob.glob(os.path.join(self.root, f"hwmon*/device/{prefix}*_*")))
+        # same ordering as psutil, fallback labels depend on it
+        basenames = sorted(set(x.split('_')[0] for x in basenames))
+
+        inputs = []
+        for base in basenames:
+            chip = _read_text(os.path.join(os.path.dirname(base), "name"))
+            if chip is None:
+                continue
+            hw_input = HwmonInput(chip, _read_text(base + "_label") or "", base + "_input", scale, _input_key(base))
+            if hw_input.open():
+                inputs.append(hw_input)
+
+        # entries of chips sharing a name are grouped under it, as in the psutil dict
+        chip_order: dict[str, int] = {}
+        for hw_input in inputs:
+            chip_order.setdefault(hw_input.chip, len(chip_order))
+        inputs.sort(key=lambda hw_input: chip_order[hw_input.chip])
+        self._assign_labels(inputs, fallback_suffix)
+        for hw_input in inputs:
+            hw_input.sensor_id = sensor_registry.intern(hw_input.chip, hw_input.label, units, integral=scale == 1)
+        return inputs
+
+    def scan(self) -> None:
+        """(re)build the index of inputs and open their files"""
+        with self._lock:
+            previous = {(hw_input.chip, hw_input.label) for hw_input in self.temperatures + self.fans}
+            was_scanned = self.scanned
+            self._close()
+            self.chip_dirs = self._list_chip_dirs()
+            self.temperatures = self._scan_inputs("temp", 1000.0, True, "°C", "")
+            self.fans = self._scan_inputs("fan", 1, False, "RPM", "fan")
+            self.scanned = True
+            self.scanned_at = time.monotonic()
+
+            current = {(hw_input.chip, hw_input.label) for hw_input in self.temperatures + self.fans}
+            if was_scanned and current != previous:
+                added = ", ".join(f"{chip}.{label}" for chip, label in sorted(current - previous))
+                removed = ", ".join(f"{chip}.{label}" for chip, label in sorted(previous - current))
+                logger.info(f"hwmon topology changed, added: [{added}], removed: [{removed}]")
+
+    def _check_topology(self) -> None:
+        """rescan if never scanned, hwmon devices came or went, or the rescan interval passed"""
+        if (not self.scanned
+                or time.monotonic() - self.scanned_at >= config.topology_rescan_interval
+                or self._list_chip_dirs() != self.chip_dirs):
+            self.scan()
+
+    def _close(self) -> None:
+        for hw_input in self.temperatures + self.fans:
+            hw_input.close()
+        self.temperatures = []
+        self.fans = []
+        self.scanned = False
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    def _read(self, inputs: list[HwmonInput]) -> dict[str, list[HwmonEntry]]:
+        res: dict[str, list[HwmonEntry]] = {}
+        for hw_input in inputs:
+            value = hw_input.read()
+            if value is not None:
+                res.setdefault(hw_input.chip, []).append(HwmonEntry(hw_input.label, value))
+        return res
+
+    def _read_readings(self, inputs: list[HwmonInput]) -> Readings:
+        ids = []
+        values = []
+        for hw_input in inputs:
+            value = hw_input.read()
+            if value is not None:
+                ids.append(hw_input.sensor_id)
+                values.append(value)
+        return tuple(ids), values
+
+    def read_temperatures(self) -> dict[str, list[HwmonEntry]]:
+        """same structure as psutil.sensors_temperatures, without high/critical values"""
+        with self._lock:
+            self._check_topology()
+            return self._read(self.temperatures)
+
+    def read_fans(self) -> dict[str, list[HwmonEntry]]:
+        """same structure as psutil.sensors_fans"""
+        with self._lock:
+            self._check_topology()
+            return self._read(self.fans)
+
+    def temperature_readings(self) -> Readings:
+        """temperatures by sensor ids interned at scan time"""
+        with self._lock:
+            self._check_topology()
+            return self._read_readings(self.temperatures)
+
+    def fan_readings(self) -> Readings:
+        """fan speeds by sensor ids interned at scan time"""
+        with self._lock:
+            self._check_topology()
+            return self._read_readings(self.fans)
@@ -0,0 +1,116 @@
+"""
+Self-instrumentation.
+
+Low overhead latency histograms for sensor collectors, command handlers, jobs, Telegram
+requests, rate limiter waits and event loop lag. A histogram is a fixed set of exponential
+buckets, observing a sample is a bucket lookup and a few additions, quantiles are read
+from the buckets on demand for /stats and the periodic stats log line. Telegram requests are
+timed by the request and rate limiter classes of monitor.telegram_instrumentation, kept apart
+so that collectors and the agent don't import telegram.
+"""
+
+import asyncio
+import bisect
+import time
+from array import array
+from typing import Callable, Optional
+
+BUCKET_BOUNDS = tuple(0.0005 * 2 ** i for i in range(17))  # 0.5ms .. ~33s, plus an overflow bucket
+LOOP_LAG_PROBE_INTERVAL = 1.0
+
+
+class LatencyHistogram:
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.buckets = array('l', bytes(array('l').itemsize * (len(BUCKET_BOUNDS) + 1)))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """upper bound of the bucket holding the q quantile, capped by the largest sample"""
+        rank = q * self.count
+        seen = 0
+        for bucket_i, num in enumerate(self.buckets):
+            seen += num
+            if num and seen >= rank:
+                return min(BUCKET_BOUNDS[bucket_i], self.max) if bucket_i < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Instrumentation:
+    def __init__(self) -> None:
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self.last_ticks: dict[str, float] = {}
+        self.started_at = time.monotonic()
+
+    def observe(self, name: str, seconds: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, LatencyHistogram())
+        histogram.observe(seconds)
+
+    def tick(self, name: str, period: float) -> None:
+        """record how far a periodic job start drifted from its configured period"""
+        now = time.monotonic()
+        last = self.last_ticks.get(name)
+        self.last_ticks[name] = now
+        if last is not None:
+            self.observe(f"{name}.drift", abs(now - last - period))
+
+    def timed(self, name: str, func: Callable, *args):
+        """call func and observe its duration, for blocking calls run in worker threads"""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def summary(self) -> list[tuple[str, int, float, float, float]]:
+        """(name, count, p50, p99, max) of every histogram, sorted by name"""
+        return [(name, histogram.count, histogram.quantile(0.5), histogram.quantile(0.99), histogram.max)
+                for name, histogram in sorted(self.histograms.items())]
+
+
+class LoopLagProbe:
+    """sleeps for a fixed interval, oversleeping is time the event loop was busy elsewhere"""
+    def __init__(self, interval: float = LOOP_LAG_PROBE_INTERVAL) -> None:
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            stats.observe("event_loop.lag", max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+stats = Instrumentation()
+loop_lag_probe = LoopLagProbe()
@@ -0,0 +1,243 @@
+"""
+Linux software RAID (md) reader.
+
+/proc/mdstat is parsed into per array state once, then every readout only re-reads the cheap
+md sysfs attributes of each array (/sys/block/mdX/md/*) through kept open files. mdstat is
+parsed again only when array membership changes: an array or a member device comes or goes.
+Without md sysfs (e.g. in a container) mdstat is the only source and is parsed every readout.
+
+Sensors of each array, named after the array:
+    state          index of the md array_state in ARRAY_STATES
+    degraded       number of missing or failed member devices
+    sync action    index of the md sync_action in SYNC_ACTIONS
+    sync progress  percent of the running resync/recovery/check, 100 when idle
+    sync speed     K/s of the running sync, 0 when idle
+"""
+
+import os
+import re
+import threading
+from typing import Optional
+from monitor.bot_utils import logger
+from monitor.sensor_registry import Readings, sensor_registry
+
+MDSTAT_PATH = "/proc/mdstat"
+SYSFS_BLOCK_ROOT = "/sys/block"
+READ_SIZE = 64
+ARRAY_STATES = ("clear", "inactive", "suspended", "readonly", "read-auto", "clean", "active", "write-pending", "active-idle")
+SYNC_ACTIONS = ("idle", "resync", "recover", "check", "repair", "reshape", "frozen")
+LABEL_STATE = "state"
+LABEL_DEGRADED = "degraded"
+LABEL_SYNC_ACTION = "sync action"
+LABEL_SYNC_PROGRESS = "sync progress"
+LABEL_SYNC_SPEED = "sync speed"
+# sensor label: (md sysfs attribute, units, integral)
+ARRAY_SENSORS = {
+    LABEL_STATE: ("array_state", "", True),
+    LABEL_DEGRADED: ("degraded", "", True),
+    LABEL_SYNC_ACTION: ("sync_action", "", True),
+    LABEL_SYNC_PROGRESS: ("sync_completed", "%", False),
+    LABEL_SYNC_SPEED: ("sync_speed", "K/s", True)
+}
+
+ARRAY_LINE = re.compile(r"^(md\w+)\s*:\s*(active|inactive)(?:\s+\(([\w-]+)\))?\s*(.*)$")
+MEMBER = re.compile(r"^([\w-]+)\[\d+\](?:\((\w)\))?$")
+DISKS = re.compile(r"\[(\d+)/(\d+)\]")
+SYNC = re.compile(r"(resync|recovery|reshape|check|repair)\s*=\s*([\d.]+)%.*?(?:speed=(\d+)K/sec)?\s*$")
+SYNC_PENDING = re.compile(r"(resync|recovery|reshape|check|repair)\s*=\s*(DELAYED|PENDING)")
+MDSTAT_MODES = {"auto-read-only": "read-auto", "read-only": "readonly"}
+MDSTAT_SYNC_ACTIONS = {"resync": "resync", "recovery": "recover", "reshape": "reshape", "check": "check", "repair": "repair"}
+
+
+class MdstatArray:
+    """array state parsed from /proc/mdstat"""
+    __slots__ = ("name", "state", "level", "members", "failed", "raid_disks", "active_disks", "sync_action",
+                 "sync_progress", "sync_speed")
+
+    def __init__(self, name: str, state: str, level: str, members: list[str], failed: int) -> None:
+        self.name = name
+        self.state = state
+        self.level = level
+        self.members = members
+        self.failed = failed
+        self.raid_disks = 0
+        self.active_disks = 0
+        self.sync_action = "idle"
+        self.sync_progress = 100.0
+        self.sync_speed = 0
+
+    def values(self) -> dict[str, float]:
+        """sensor values by label"""
+        degraded = max(self.raid_disks - self.active_disks, 0) if self.raid_disks else self.failed
+        return {
+            LABEL_STATE: ARRAY_STATES.index(self.state),
+            LABEL_DEGRADED: degraded,
+            LABEL_SYNC_ACTION: SYNC_ACTIONS.index(self.sync_action),
+            LABEL_SYNC_PROGRESS: self.sync_progress,
+            LABEL_SYNC_SPEED: self.sync_speed
+        }
+
+
+def parse_mdstat(text: str) -> list[MdstatArray]:
+    """arrays in mdstat order"""
+    arrays = []
+    array = None
+    for line in text.splitlines():
+        match = ARRAY_LINE.match(line)
+        if match:
+            name, state, mode, rest = match.groups()
+            tokens = rest.split()
+            level = tokens.pop(0) if tokens and not MEMBER.match(tokens[0]) else ""
+            members = []
+            failed = 0
+            for token in tokens:
+                member = MEMBER.match(token)
+                if member:
+                    members.append(member.group(1))
+                    failed += member.group(2) == "F"
+            if state == "active":
+                state = MDSTAT_MODES.get(mode, "clean")
+            array = MdstatArray(name, state, level, members, failed)
+            arrays.append(array)
+            continue
+        if not line.startswith((" ", "\t")):  # end of the array block
+            array = None
+        if array is None:
+            continue
+
+        disks = DISKS.search(line)
+        if disks:
+            array.raid_disks, array.active_disks = int(disks.group(1)), int(disks.group(2))
+        sync = SYNC.search(line)
+        if sync:
+            array.sync_action = MDSTAT_SYNC_ACTIONS[sync.group(1)]
+            array.sync_progress = float(sync.group(2))
+            array.sync_speed = int(sync.group(3) or 0)
+        elif SYNC_PENDING.search(line):
+            array.sync_action = MDSTAT_SYNC_ACTIONS[SYNC_PENDING.search(line).group(1)]
+            array.sync_progress = 0.0
+    return arrays
+
+
+def parse_attribute(label: str, raw: str) -> Optional[float]:
+    """sensor value from md sysfs attribute text, None if unknown"""
+    raw = raw.strip()
+    if label == LABEL_STATE:
+        return ARRAY_STATES.index(raw) if raw in ARRAY_STATES else None
+    if label == LABEL_SYNC_ACTION:
+        return SYNC_ACTIONS.index(raw) if raw in SYNC_ACTIONS else None
+    if label == LABEL_SYNC_PROGRESS:
+        done, _, total = raw.partition("/")
+        if not total:  # none, delayed
+            return 100.0 if raw == "none" else 0.0
+        total = int(total)
+        return round(int(done) * 100.0 / total, 1) if total else 100.0
+    if label == LABEL_SYNC_SPEED:
+        return int(raw) if raw.isdigit() else 0
+    return int(raw) if raw.isdigit() else None
+
+
+class MdArrayHandle:
+    """kept open md sysfs attributes of an array, with the sensor id of each"""
+    __slots__ = ("name", "fds", "fallback")
+
+    def __init__(self, name: str, fds: list[tuple[str, int, int]], fallback: dict[str, float]) -> None:
+        self.name = name
+        self.fds = fds  # (label, fd or -1, sensor id)
+        self.fallback = fallback  # mdstat values of attributes sysfs doesn't have
+
+    def close(self) -> None:
+        for _, fd, _ in self.fds:
+            if fd >= 0:
+                os.close(fd)
+        self.fds = []
+
+
+class MdstatReader:
+    def __init__(self, mdstat_path: str = MDSTAT_PATH, sysfs_root: str = SYSFS_BLOCK_ROOT) -> None:
+        self.mdstat_path = mdstat_path
+        self.sysfs_root = sysfs_root
+        self.arrays: list[MdArrayHandle] = []
+        self.membership: Optional[tuple] = None
+        self.parse_count = 0
+        self._lock = threading.Lock()
+
+    def _md_dir(self, name: str) -> str:
+        return os.path.join(self.sysfs_root, name, "md")
+
+    def _get_membership(self) -> Optional[tuple]:
+        """md arrays with their member devices from sysfs, None if md sysfs is unavailable"""
+        try:
+            names = sorted(name for name in os.listdir(self.sysfs_root) if name.startswith("md"))
+        except OSError:
+            return None
+        if not names:
+            return None
+        membership = []
+        for name in names:
+            try:
+                members = tuple(sorted(entry for entry in os.listdir(self._md_dir(name)) if entry.startswith("dev-")))
+            except OSError:
+                members = ()
+            membership.append((name, members))
+        return tuple(membership)
+
+    def _read_mdstat(self) -> list[MdstatArray]:
+        try:
+            with open(self.mdstat_path) as fp:
+                text = fp.read()
+        except OSError:
+            return []
+        self.parse_count += 1
+        return parse_mdstat(text)
+
+    def _open_arrays(self, arrays: list[MdstatArray]) -> None:
+        previous = [handle.name for handle in self.arrays]
+        self._close()
+        for array in arrays:
+            fallback = array.values()
+            fds = []
+            for label, (attribute, units, integral) in ARRAY_SENSORS.items():
+                try:
+                    fd = os.open(os.path.join(self._md_dir(array.name), attribute), os.O_RDONLY)
+                except OSError:
+                    fd = -1
+                fds.append((label, fd, sensor_registry.intern(array.name, label, units, integral=integral)))
+            self.arrays.append(MdArrayHandle(array.name, fds, fallback))
+        current = [handle.name for handle in self.arrays]
+        if self.membership is not None and current != previous:
+            logger.info(f"md arrays changed: {previous} -> {current}")
+
+    def _close(self) -> None:
+        for handle in self.arrays:
+            handle.close()
+        self.arrays = []
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+            self.membership = None
+
+    def readings(self) -> Readings:
+        with self._lock:
+            membership = self._get_membership()
+            if membership is None or membership != self.membership:
+                # arrays or their devices changed, or mdstat is the only source
+                self._open_arrays(self._read_mdstat())
+                self.membership = membership
+
+            ids = []
+            values = []
+            for handle in self.arrays:
+                for label, fd, sensor_id in handle.fds:
+                    value = None
+                    if fd >= 0:
+                        try:
+                            value = parse_attribute(label, os.pread(fd, READ_SIZE, 0).decode())
+                        except (OSError, ValueError):
+                            value = None
+                    if value is None:
+                        value = handle.fallback[label]
+                    ids.append(sensor_id)
+                    values.append(value)
+            return tuple(ids), values
@@ -0,0 +1,157 @@
+"""
+OpenMetrics exporter.
+
+An optional HTTP endpoint served from the bot event loop, GET /metrics returns the latest
+sampled sensor readings and sensor action rule states in OpenMetrics text format. Scrapes
+never read hardware: the body is encoded from the shared snapshot once and reused until
+the next sample or a rule state change.
+"""
+
+import asyncio
+import math
+from typing import Optional
+from monitor.bot_utils import config, logger
+from monitor.sensor_sampler import (
+    sensor_sampler,
+    SensorSnapshot,
+    SENSOR_SOURCES,
+    GROUP_TEMPERATURES,
+    GROUP_FANS,
+    GROUP_GPU_TEMPS,
+    GROUP_GPU_FANS,
+    GROUP_GPU_STATS,
+    GROUP_RAID,
+    GROUP_SYSTEM
+)
+from monitor.sensor_watch import sensor_action_config, RuleTable
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+METRICS_PATH = "/metrics"
+REQUEST_TIMEOUT = 5
+MAX_HEADER_LINES = 100
+
+# snapshot group: (metric family, unit, help)
+SENSOR_FAMILIES = {
+    GROUP_TEMPERATURES: ("monitor_temperature_celsius", "celsius", "hwmon temperature reading"),
+    GROUP_FANS: ("monitor_fan_speed_rpm", "rpm", "hwmon fan speed reading"),
+    GROUP_GPU_TEMPS: ("monitor_gpu_temperature_celsius", "celsius", "GPU temperature reading"),
+    GROUP_GPU_FANS: ("monitor_gpu_fan_speed_percent", "percent", "GPU fan speed reading"),
+    GROUP_GPU_STATS: ("monitor_gpu_reading", "", "GPU power (W), busy (percent) and fan speed (RPM) by sensor"),
+    GROUP_RAID: ("monitor_raid_array", "", "md array state, degraded devices, sync action, progress and speed by sensor"),
+    GROUP_SYSTEM: ("monitor_system_reading", "", "CPU, load, memory, disk and network throughput, uptime by sensor"),
+}
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    if math.isfinite(value):
+        return str(value)
+    return "NaN" if value != value else ("+Inf" if value > 0 else "-Inf")
+
+
+def add_family(lines: list[str], name: str, help_text: str, unit: str = "") -> None:
+    lines.append(f"# TYPE {name} gauge")
+    if unit:
+        lines.append(f"# UNIT {name} {unit}")
+    lines.append(f"# HELP {name} {help_text}")
+
+
+def encode_metrics(snapshot: Optional[SensorSnapshot], rules: RuleTable) -> bytes:
+    lines: list[str] = []
+    if snapshot is not None:
+        add_family(lines, "monitor_snapshot_timestamp_seconds", "time of the latest sensor sample")
+        lines.append(f"monitor_snapshot_timestamp_seconds {snapshot.timestamp}")
+        add_family(lines, "monitor_source_stale", "1 if the sensor source failed or missed its deadline")
+        for source in SENSOR_SOURCES:
+            lines.append(f"monitor_source_stale{{source=\"{source}\"}} {int(snapshot.is_stale(source))}")
+
+        for group, (name, unit, help_text) in SENSOR_FAMILIES.items():
+            readings = snapshot.group(group)
+            if not readings:
+                continue
+            add_family(lines, name, help_text, unit)
+            for key, info, value in readings.readings():
+                lines.append(f"{name}{{chip=\"{escape_label(info.name)}\",sensor=\"{escape_label(info.label)}\","
+                             f"key=\"{escape_label(key)}\"}} {format_value(info.convert(value))}")
+
+    if len(rules):
+        add_family(lines, "monitor_rule_failed_checks", "consecutive checks the sensor failed its rule condition, by rule index")
+        for rule_i, entry in enumerate(rules.entries):
+            lines.append(f"monitor_rule_failed_checks{{sensor=\"{escape_label(entry.name)}\",rule=\"{rule_i}\"}} "
+                         f"{entry.failed_condition_num}")
+        add_family(lines, "monitor_rule_triggered", "1 if the rule action was triggered and not yet cleared, by rule index")
+        for rule_i, entry in enumerate(rules.entries):
+            lines.append(f"monitor_rule_triggered{{sensor=\"{escape_label(entry.name)}\",rule=\"{rule_i}\"}} "
+                         f"{int(entry.triggered)}")
+
+    lines.append("# EOF\n")
+    return "\n".join(lines).encode()
+
+
+class MetricsExporter:
+    def __init__(self) -> None:
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._cache_key: Optional[tuple] = None
+        self._cache = b""
+
+    def get_body(self) -> bytes:
+        """encoded metrics, reused while the snapshot and rule states are unchanged"""
+        snapshot = sensor_sampler.snapshot
+        rules = sensor_action_config.rules
+        key = (snapshot.timestamp if snapshot else None, rules, rules.failed.tobytes(), bytes(rules.triggered))
+        if key != self._cache_key:
+            self._cache = encode_metrics(snapshot, rules)
+            self._cache_key = key
+        return self._cache
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+            for _ in range(MAX_HEADER_LINES):
+                line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2:
+                status, body, content_type = "400 Bad Request", b"", "text/plain"
+            elif parts[0] not in ("GET", "HEAD"):
+                status, body, content_type = "405 Method Not Allowed", b"", "text/plain"
+            elif parts[1].split("?")[0] != METRICS_PATH:
+                status, body, content_type = "404 Not Found", b"", "text/plain"
+            else:
+                status, body, content_type = "200 OK", self.get_body(), CONTENT_TYPE
+
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode())
+            if parts[:1] != ["HEAD"]:
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Metrics exporter failed to serve a scrape - {e}")
+        finally:
+            writer.close()
+
+    async def start(self) -> None:
+        if not config.metrics_port:
+            return
+        try:
+            self.server = await asyncio.start_server(self._handle, config.metrics_address, config.metrics_port)
+        except OSError as e:
+            logger.error(f"Metrics exporter failed to listen on {config.metrics_address}:{config.metrics_port} - {e}")
+            return
+        logger.info(f"Metrics exporter listening on {config.metrics_address}:{config.metrics_port}{METRICS_PATH}")
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+metrics_exporter = MetricsExporter()
@@ -0,0 +1,42 @@
+"""
+Post recorded Telegram updates to the local webhook listener.
+
+Usage, from the repo directory, with the bot running in webhook mode:
+    python -m monitor.post_update update.json [more_updates.json ...]
+
+Each file holds one update object or a list of them, as returned by getUpdates. Updates are
+sent to WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH with the configured WEBHOOK_SECRET, the
+way Telegram delivers them, so webhook mode can be exercised end to end without exposing
+the host.
+"""
+
+import json
+import os
+import sys
+import requests
+from monitor.bot_utils import config, DATA_PATH, CONFIG_FILE_NAME, WEBHOOK_SECRET_HEADER
+
+
+def post_updates(paths: list[str]) -> int:
+    config.load_config(os.path.join(DATA_PATH, CONFIG_FILE_NAME))
+    if not config.webhook_secret:
+        print("WEBHOOK_SECRET is not set, the listener uses a random one and rejects posted updates")
+        return 1
+
+    url = f"http://{config.webhook_listen}:{config.webhook_port}/{config.webhook_path}"
+    failed = 0
+    for path in paths:
+        with open(path) as fp:
+            updates = json.load(fp)
+        for update in updates if isinstance(updates, list) else [updates]:
+            res = requests.post(url, json=update, headers={WEBHOOK_SECRET_HEADER: config.webhook_secret}, timeout=10)
+            print(f"{path}: update {update.get('update_id')} - {res.status_code}")
+            failed += res.status_code != 200
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    sys.exit(post_updates(sys.argv[1:]))
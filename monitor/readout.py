@@ -0,0 +1,292 @@
+"""
+Readout message rendering.
+
+Readouts are rendered from a sensor snapshot through a layout compiled per sensor topology,
+long readouts are split into pages navigated with inline buttons. Each readout message
+remembers a fingerprint of the page it shows, an edit that would not change it is skipped.
+A readout of a remote host is rendered from the hub's cached snapshot of that host.
+"""
+
+from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.constants import ParseMode, MessageLimit
+from monitor.bot_utils import (
+    config,
+    QUERY_PATTERN_REFRESH,
+    QUERY_PATTERN_TOGGLE_REFRESH,
+    QUERY_PATTERN_PAGE,
+    QUERY_DATA_SEPARATOR
+)
+from monitor.sensor_registry import ReadingsView
+from monitor.hub import snapshot_hub
+from monitor.sensor_sampler import (
+    sensor_sampler,
+    SensorSnapshot,
+    SOURCE_TEMPERATURES,
+    SOURCE_FANS,
+    SOURCE_GPU,
+    SOURCE_RAID,
+    SOURCE_SYSTEM,
+    GROUP_TEMPERATURES,
+    GROUP_FANS,
+    GROUP_GPU_TEMPS,
+    GROUP_GPU_FANS,
+    GROUP_GPU_STATS,
+    GROUP_RAID,
+    GROUP_SYSTEM
+)
+import html
+import math
+import time
+from typing import Optional
+from collections import OrderedDict
+from datetime import datetime
+
+RENDER_CACHE_SIZE = 256
+LAYOUT_CACHE_SIZE = 32
+HEADER_SIZE_RESERVE = 128
+VALUE_SIZE_RESERVE = 16  # longer than str of any real reading
+PAGE_SIZE_LIMIT = MessageLimit.MAX_TEXT_LENGTH - HEADER_SIZE_RESERVE
+READOUT_GROUPS = (GROUP_TEMPERATURES, GROUP_GPU_TEMPS, GROUP_FANS, GROUP_GPU_FANS, GROUP_GPU_STATS, GROUP_RAID, GROUP_SYSTEM)
+
+
+def get_header_text(snapshot: SensorSnapshot, print_refresh_rate: bool = False, host: Optional[str] = None) -> str:
+    dt = datetime.fromtimestamp(snapshot.timestamp).strftime("%d/%m/%y %H:%M:%S")
+    header = "<b>" + dt + "</b>\n"
+    if host is not None:
+        header = f"Host: <b>{html.escape(host)}</b>\n" + get_host_stale_text(host) + header
+    if print_refresh_rate:
+        return f"<i>Auto update is enabled, refresh rate: {config.update_period_seconds}s</i>" + "\n" + header
+    else:
+        return header
+
+
+def get_host_stale_text(host: str) -> str:
+    if snapshot_hub.is_stale(host):
+        return "<i>(stale, host is not reporting)</i>\n"
+    return ""
+    
+
+class ReadoutLayout:
+    """
+    Readout text compiled once per sensor topology. Static text (section titles, chip headers,
+    padded labels, units) is precomputed into per page part lists, rendering a page only fills
+    in its own value slots and joins the parts. Pages are split to fit the message length limit.
+    """
+    def __init__(self, snapshot: SensorSnapshot) -> None:
+        self.key = get_layout_key(snapshot)
+        self.pages: list[tuple[list[str], list[tuple[int, int, bool]]]] = []  # (parts, (part index, sensor id, integral))
+        self._paginate(self._compile_items(snapshot))
+
+    def _compile_items(self, snapshot: SensorSnapshot) -> list[tuple]:
+        """flat list of (static text, sensor info or None, context to repeat on a new page)"""
+        items = []
+
+        def add_section(title: str, empty_text: str, readings: ReadingsView, chip_headers: bool):
+            if not readings:
+                items.append((empty_text, None, ""))
+                return
+            items.append((title, None, ""))
+            last_name = None
+            chip_header = ""
+            for sensor_id in readings.ids():
+                info = readings.registry.infos[sensor_id]
+                if chip_headers and last_name != info.name:
+                    last_name = info.name
+                    chip_header = f"\n    {info.name}\n"
+                    items.append((chip_header, None, title))
+                items.append(("       %-40s <b>" % (info.label or info.name), info, title + chip_header))
+                items.append((f"</b>{info.units}\n", None, None))
+
+        def add_static(text: str):
+            if text:
+                items.append((text, None, ""))
+
+        add_section("Temperatures:\n", "can't read any temperature info", snapshot.temperatures, True)
+        add_static(get_stale_text(snapshot, SOURCE_TEMPERATURES))
+        add_static("\n")
+        add_section("GPU Temperatures:\n", "can't read any GPU info", snapshot.gpu_temps, False)
+        add_static(get_stale_text(snapshot, SOURCE_GPU))
+        add_static("\n\n")
+        add_section("Fans speeds:\n", "can't read any fans info", snapshot.fans, True)
+        add_static(get_stale_text(snapshot, SOURCE_FANS))
+        if snapshot.gpu_fans:
+            add_static("\n")
+            add_section("GPU Fans:\n", "", snapshot.gpu_fans, True)
+        if snapshot.gpu_stats:
+            add_static("\n")
+            add_section("GPU Stats:\n", "", snapshot.gpu_stats, True)
+        if snapshot.raid or snapshot.is_stale(SOURCE_RAID):
+            add_static("\n\n")
+            add_section("RAID arrays:\n", "can't read any RAID info", snapshot.raid, True)
+            add_static(get_stale_text(snapshot, SOURCE_RAID))
+        if snapshot.system or snapshot.is_stale(SOURCE_SYSTEM):
+            add_static("\n\n")
+            add_section("System:\n", "can't read any system info", snapshot.system, True)
+            add_static(get_stale_text(snapshot, SOURCE_SYSTEM))
+        return items
+
+    def _paginate(self, items: list[tuple]) -> None:
+        parts: list[str] = []
+        slots: list[tuple[int, int, bool]] = []
+        size = 0
+        for text, info, context in items:
+            item_size = len(text) + (VALUE_SIZE_RESERVE if info is not None else 0)
+            # value suffixes (context None) always stay on the page of their value
+            if parts and context is not None and size + item_size > PAGE_SIZE_LIMIT:
+                self.pages.append((parts, slots))
+                parts, slots, size = [], [], 0
+                if context:
+                    parts.append(context)
+                    size += len(context)
+            parts.append(text)
+            size += item_size
+            if info is not None:
+                slots.append((len(parts), info.id, info.integral))
+                parts.append("")
+        self.pages.append((parts, slots))
+
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    def render(self, snapshot: SensorSnapshot, page: int) -> str:
+        parts, slots = self.pages[page]
+        parts = parts.copy()
+        values = snapshot.values
+        for part_i, sensor_id, integral in slots:
+            value = values[sensor_id]
+            parts[part_i] = str(int(value) if integral and math.isfinite(value) else value)
+        return "".join(parts)
+
+    def fingerprint(self, snapshot: SensorSnapshot, page: int, resolution: float) -> tuple:
+        values = snapshot.values
+        return tuple(get_fingerprint_value(values[sensor_id], resolution) for _, sensor_id, _ in self.pages[page][1])
+
+
+def get_fingerprint_value(value: float, resolution: float):
+    """value in resolution steps, non-finite values are kept as they are, NaN as None since it hashes by identity"""
+    if not math.isfinite(value):
+        return value if value == value else None
+    return round(value / resolution) if resolution > 0 else value
+
+
+def get_layout_key(snapshot: SensorSnapshot) -> tuple:
+    """sensor ids of each readout section, a snapshot keeps the same tuples while topology is unchanged"""
+    groups = snapshot.groups
+    return (snapshot.registry, snapshot.stale, *(groups.get(name, ()) for name in READOUT_GROUPS))
+
+
+layouts: OrderedDict[tuple, ReadoutLayout] = OrderedDict()
+
+
+def get_layout(snapshot: SensorSnapshot) -> ReadoutLayout:
+    """compiled layout for the snapshot topology, recompiled only when sensors appear or disappear"""
+    key = get_layout_key(snapshot)
+    layout = layouts.get(key)
+    if layout is None:
+        layout = layouts[key] = ReadoutLayout(snapshot)
+        if len(layouts) > LAYOUT_CACHE_SIZE:
+            layouts.popitem(last=False)
+    layouts.move_to_end(key)
+    return layout
+
+
+def get_stale_text(snapshot: SensorSnapshot, source: str) -> str:
+    if snapshot.is_stale(source):
+        return "\n<i>(stale, sensor source is unavailable)</i>\n"
+    return ""
+
+
+def clamp_page(layout: ReadoutLayout, page: int) -> int:
+    return min(max(page, 0), layout.page_count() - 1)
+
+
+def get_sensors_text(snapshot: SensorSnapshot, page: int = 0) -> str:
+    layout = get_layout(snapshot)
+    return layout.render(snapshot, clamp_page(layout, page))
+
+
+def get_query_target(data: str) -> tuple[int, Optional[str]]:
+    """(page, remote host) from callback data like "c_re:2" or "c_re:2:host", page 0 if missing"""
+    _, _, target = data.partition(QUERY_DATA_SEPARATOR)
+    page, _, host = target.partition(QUERY_DATA_SEPARATOR)
+    return int(page) if page.isdigit() else 0, host or None
+
+
+def get_refresh_markup(page: int = 0, page_count: int = 1, host: Optional[str] = None) -> InlineKeyboardMarkup:
+    suffix = f"{QUERY_DATA_SEPARATOR}{host}" if host is not None else ""
+    keyboard = [[InlineKeyboardButton(text="Refresh", callback_data=f"{QUERY_PATTERN_REFRESH}{QUERY_DATA_SEPARATOR}{page}{suffix}")],
+                [InlineKeyboardButton(text="Toggle auto refresh", callback_data=f"{QUERY_PATTERN_TOGGLE_REFRESH}{QUERY_DATA_SEPARATOR}{page}{suffix}")]]
+    if page_count > 1:
+        keyboard.append([InlineKeyboardButton(text="<< Prev", callback_data=f"{QUERY_PATTERN_PAGE}{QUERY_DATA_SEPARATOR}{(page - 1) % page_count}{suffix}"),
+                         InlineKeyboardButton(text=f"{page + 1}/{page_count}", callback_data=f"{QUERY_PATTERN_PAGE}{QUERY_DATA_SEPARATOR}{page}{suffix}"),
+                         InlineKeyboardButton(text="Next >>", callback_data=f"{QUERY_PATTERN_PAGE}{QUERY_DATA_SEPARATOR}{(page + 1) % page_count}{suffix}")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def get_fingerprint(snapshot: SensorSnapshot, print_refresh_rate: bool, page: int = 0, host: Optional[str] = None) -> int:
+    """readout page identity, readings are quantized so that noise doesn't count as a change"""
+    layout = get_layout(snapshot)
+    page = clamp_page(layout, page)
+    host_stale = host is not None and snapshot_hub.is_stale(host)
+    return hash((print_refresh_rate, page, host, host_stale, layout.key,
+                 layout.fingerprint(snapshot, page, config.refresh_resolution)))
+
+
+def render_readout(snapshot: SensorSnapshot, print_refresh_rate: bool = False, page: int = 0,
+                   host: Optional[str] = None) -> tuple[str, InlineKeyboardMarkup]:
+    """readout page text with its markup"""
+    layout = get_layout(snapshot)
+    page = clamp_page(layout, page)
+    text = get_header_text(snapshot, print_refresh_rate, host) + layout.render(snapshot, page)
+    return text, get_refresh_markup(page, layout.page_count(), host)
+
+
+async def get_readout_snapshot(host: Optional[str] = None) -> Optional[SensorSnapshot]:
+    """local snapshot, or the hub's latest snapshot of a remote host, None if the host never reported"""
+    if host is None:
+        return await sensor_sampler.get_snapshot()
+    return snapshot_hub.get_snapshot(host)
+
+
+class RenderState:
+    __slots__ = ("fingerprint", "edited_at")
+
+    def __init__(self, fingerprint: int, edited_at: float) -> None:
+        self.fingerprint = fingerprint
+        self.edited_at = edited_at
+
+
+rendered_messages: OrderedDict[tuple[int, int], RenderState] = OrderedDict()
+
+
+def update_render_state(message, fingerprint: int) -> bool:
+    """False if the message already shows this body and is not due for a forced edit"""
+    key = (message.chat_id, message.message_id)
+    now = time.monotonic()
+    state = rendered_messages.get(key)
+    if state and state.fingerprint == fingerprint and now - state.edited_at < config.refresh_force_interval:
+        return False
+
+    rendered_messages[key] = RenderState(fingerprint, now)
+    rendered_messages.move_to_end(key)
+    if len(rendered_messages) > RENDER_CACHE_SIZE:
+        rendered_messages.popitem(last=False)
+    return True
+
+
+def forget_render_state(message) -> None:
+    """next edit of the message is not skipped"""
+    rendered_messages.pop((message.chat_id, message.message_id), None)
+
+
+async def edit_readout(message, print_refresh_rate: bool = False, page: int = 0, host: Optional[str] = None) -> None:
+    """edit readout message page, skipped if nothing changed since its last edit"""
+    snapshot = await get_readout_snapshot(host)
+    if snapshot is None or not update_render_state(message, get_fingerprint(snapshot, print_refresh_rate, page, host)):
+        return
+    reply, markup = render_readout(snapshot, print_refresh_rate, page, host)
+    try:
+        await message.edit_text(text=reply, reply_markup=markup, parse_mode=ParseMode.HTML)
+    except Exception:
+        forget_render_state(message)  # edit didn't happen, the next press retries it
+        raise
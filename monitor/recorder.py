@@ -0,0 +1,241 @@
+"""
+Snapshot recorder and rule replay.
+
+record writes sampled snapshots to a file in the agent protocol frames: a topology frame
+when the sensor topology changes, then one sample frame per snapshot. A path ending with
+.gz is compressed, readings repeat a lot and compress well.
+
+replay feeds a recording through a sensor action rule set at recorded time, as fast as
+possible or at --speed times real time, and reports when each rule would have fired. Rules
+are evaluated like the sensor watch job does, every --watch-interval seconds of recorded
+time with its failure threshold and trigger state; system actions are never executed and
+nobody is notified.
+
+Usage, from the repo directory:
+    python -m monitor.recorder record week.rec.gz [--interval 5] [--duration 7d] [--backend psutil|hwmon]
+    python -m monitor.recorder replay week.rec.gz [--rules bot_config/sensor_actions_config] [--threshold 1]
+"""
+
+import argparse
+import asyncio
+import configparser
+import gzip
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Optional
+from monitor.agent import get_topology, encode_snapshot
+from monitor.bot_utils import (
+    config,
+    logger,
+    parse_duration,
+    DATA_PATH,
+    SENSOR_BACKEND_PSUTIL,
+    SENSOR_BACKEND_HWMON,
+    SENSOR_WATCH_REFRESH_RATE_DEFAULT,
+    SENSOR_WATCH_THRESHOLD_DEFAULT
+)
+from monitor.hub import HostState
+from monitor.sensor_sampler import sensor_sampler
+from monitor.sensor_watch import Action, Metric, RuleTable, SensorActionConfig, CONFIG_FILE_NAME
+from monitor.sensors_api import nvidia_collector, amdgpu_reader, hwmon_reader, mdstat_reader
+from monitor.snapshot_protocol import (
+    ProtocolError,
+    TruncatedFrame,
+    FRAME_TOPOLOGY,
+    FRAME_SAMPLE,
+    decode_topology,
+    decode_sample,
+    encode_topology,
+    read_file_frame
+)
+
+RECORDING_MAGIC = b"MONREC\x01\n"
+FLUSH_INTERVAL = 60
+
+
+def open_recording(path: str, mode: str):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+async def record(path: str, interval: float, duration: float) -> int:
+    """sample every interval seconds for duration seconds, 0 until interrupted, returns snapshots written"""
+    count = 0
+    topology_key = None
+    deadline = time.monotonic() + duration if duration else None
+    flushed_at = time.monotonic()
+    with open_recording(path, "wb") as fp:
+        fp.write(RECORDING_MAGIC)
+        while deadline is None or time.monotonic() < deadline:
+            snapshot = await sensor_sampler.sample()
+            key, topology = get_topology(snapshot)
+            if key != topology_key:
+                fp.write(encode_topology(topology))
+                topology_key = key
+            fp.write(encode_snapshot(snapshot))
+            count += 1
+            if time.monotonic() - flushed_at >= FLUSH_INTERVAL:
+                fp.flush()
+                flushed_at = time.monotonic()
+            await asyncio.sleep(interval)
+    return count
+
+
+class Firing:
+    __slots__ = ("timestamp", "rule_i", "value")
+
+    def __init__(self, timestamp: float, rule_i: int, value: float) -> None:
+        self.timestamp = timestamp
+        self.rule_i = rule_i
+        self.value = value
+
+
+class ReplayResult:
+    def __init__(self) -> None:
+        self.snapshots = 0
+        self.checks = 0
+        self.first_timestamp: Optional[float] = None
+        self.last_timestamp: Optional[float] = None
+        self.firings: list[Firing] = []
+        self.evaluation_time = 0.0  # seconds spent evaluating rules
+        self.wall_time = 0.0
+        self.truncated = False  # recording ends inside a frame, its recorder didn't finish
+
+
+def replay(path: str, rules: RuleTable, threshold: int, watch_interval: float, speed: float = 0.0) -> ReplayResult:
+    """evaluate rules on the recorded snapshots, speed 0 replays as fast as possible"""
+    result = ReplayResult()
+    host = HostState("replay")
+    checked_at = -watch_interval
+    started = time.perf_counter()
+    with open_recording(path, "rb") as fp:
+        if fp.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+            raise ProtocolError(f"{path} is not a snapshot recording")
+        while True:
+            try:
+                payload = read_file_frame(fp)
+            except TruncatedFrame:
+                result.truncated = True
+                break
+            if payload is None:
+                break
+            kind = payload[:1]
+            if kind == FRAME_TOPOLOGY:
+                host.set_topology(decode_topology(payload))
+                continue
+            if kind != FRAME_SAMPLE:
+                raise ProtocolError(f"unknown frame type {kind!r}")
+            timestamp, stale, fresh_mask, values = decode_sample(payload)
+            host.add_sample(timestamp, stale, fresh_mask, values)
+            if result.first_timestamp is None:
+                result.first_timestamp = timestamp
+            elif speed > 0:
+                delay = (timestamp - result.last_timestamp) / speed
+                if delay > 0:
+                    time.sleep(delay)
+            result.last_timestamp = timestamp
+            result.snapshots += 1
+            if timestamp - checked_at < watch_interval:
+                continue
+
+            checked_at = timestamp
+            result.checks += 1
+            start = time.perf_counter()
+            for rule_i, value in rules.evaluate_rules(host.snapshot, threshold):
+                if rules.fire(rule_i):  # as the sensor watch job, without running the action
+                    result.firings.append(Firing(timestamp, rule_i, value))
+            result.evaluation_time += time.perf_counter() - start
+    result.wall_time = time.perf_counter() - started
+    return result
+
+
+def format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def get_report(result: ReplayResult, rules: RuleTable) -> str:
+    if not result.snapshots:
+        return "recording is truncated before its first snapshot" if result.truncated else "recording has no snapshots"
+    span = result.last_timestamp - result.first_timestamp
+    lines = ["recording is truncated, replayed up to its last complete snapshot"] if result.truncated else []
+    lines.append(f"{result.snapshots} snapshots from {format_time(result.first_timestamp)} to "
+                 f"{format_time(result.last_timestamp)} ({span / 3600:.1f}h) replayed in {result.wall_time:.2f}s, "
+                 f"{span / max(result.wall_time, 1e-9):.0f}x real time")
+    lines.append(f"{result.checks} checks of {len(rules)} rules, "
+                 f"{result.checks / max(result.evaluation_time, 1e-9):.0f} checks/s, "
+                 f"{result.checks * len(rules) / max(result.evaluation_time, 1e-9):.0f} rule evaluations/s")
+    if not result.firings:
+        lines.append("no rule would have fired")
+        return "\n".join(lines)
+
+    lines.append("")
+    for firing in result.firings:
+        entry = rules.entries[firing.rule_i]
+        actions = "|".join(action.name for action in Action if entry.action & action)
+        lines.append(f"{format_time(firing.timestamp)}  {entry.name}: {Metric(entry.metric).name.lower()} {firing.value} "
+                     f"outside {entry.get_condition_str()} {entry.value} -> {actions}")
+    counts: dict[int, int] = {}
+    for firing in result.firings:
+        counts[firing.rule_i] = counts.get(firing.rule_i, 0) + 1
+    lines.append("")
+    lines.extend(f"{rules.entries[rule_i].name}: fired {count} times" for rule_i, count in counts.items())
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="record snapshots of this host")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--interval", type=float, default=5.0, help="seconds between snapshots")
+    record_parser.add_argument("--duration", default="0", help="how long to record, like 30m or 7d, 0 until interrupted")
+    record_parser.add_argument("--backend", choices=[SENSOR_BACKEND_PSUTIL, SENSOR_BACKEND_HWMON], default=SENSOR_BACKEND_PSUTIL)
+    replay_parser = commands.add_parser("replay", help="replay a recording through sensor action rules")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--rules", default=os.path.join(DATA_PATH, CONFIG_FILE_NAME), help="sensor action config file")
+    replay_parser.add_argument("--threshold", type=int, default=SENSOR_WATCH_THRESHOLD_DEFAULT,
+                               help="failed checks before a rule fires, SENSOR_WATCH_THRESHOLD")
+    replay_parser.add_argument("--watch-interval", type=float, default=SENSOR_WATCH_REFRESH_RATE_DEFAULT,
+                               help="seconds of recorded time between checks, SENSOR_WATCH_REFRESH_RATE")
+    replay_parser.add_argument("--stats-window", default=str(config.sensor_stats_window), help="SENSOR_STATS_WINDOW")
+    replay_parser.add_argument("--speed", type=float, default=0.0, help="times real time, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        config.sensor_backend = args.backend
+        try:
+            count = asyncio.run(record(args.path, args.interval, parse_duration(args.duration)))
+            logger.info(f"Recorded {count} snapshots to {args.path}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sensor_sampler.shutdown()
+            nvidia_collector.shutdown()
+            amdgpu_reader.close()
+            hwmon_reader.close()
+            mdstat_reader.close()
+        return 0
+
+    if not os.path.exists(args.rules):
+        print(f"no sensor action config at {args.rules}")
+        return 1
+    config.sensor_stats_window = parse_duration(args.stats_window)
+    action_config = SensorActionConfig()
+    try:
+        action_config.load_config(args.rules)
+    except configparser.Error as e:
+        print(f"failed to load {args.rules} - {e}")
+        return 1
+    rules = RuleTable(list(action_config.configEntries.values()), bind=False)
+    try:
+        result = replay(args.path, rules, max(args.threshold, 1), args.watch_interval, args.speed)
+    except (OSError, EOFError, ProtocolError) as e:
+        print(f"failed to replay {args.path} - {e}")
+        return 1
+    print(get_report(result, rules))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
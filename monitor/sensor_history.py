@@ -0,0 +1,142 @@
+"""
+In-memory sensor history.
+
+Readings are kept per sensor config name in float32 ring buffers, one set of buffers per
+downsampling tier. Every tier has a single timestamp ring shared by all of its sensors.
+A tier slot covers one resolution bucket and stores avg, min and max of the readings that
+fell into it, so spikes between refreshes survive downsampling and memory stays bounded
+regardless of uptime.
+"""
+
+import math
+from array import array
+from typing import NamedTuple, Optional
+from monitor.sensor_registry import ReadingsView
+
+# (resolution in seconds, number of slots): 1s for 10 min, 10s for 6 h, 1 min for 7 days
+HISTORY_TIERS = ((1, 600), (10, 2160), (60, 10080))
+
+
+class HistoryStats(NamedTuple):
+    min: float
+    avg: float
+    max: float
+    last: float
+    units: str
+    samples: int
+
+
+class HistoryTier:
+    def __init__(self, resolution: int, size: int) -> None:
+        self.resolution = resolution
+        self.size = size
+        self.timestamps = array('d', [math.nan]) * size
+        self.avg: dict[str, array] = {}
+        self.min: dict[str, array] = {}
+        self.max: dict[str, array] = {}
+        self.bucket_counts: dict[str, int] = {}
+        self.head = -1
+        self.bucket = -math.inf
+
+    def span(self) -> int:
+        return self.resolution * self.size
+
+    def _new_buffer(self) -> array:
+        return array('f', [math.nan]) * self.size
+
+    def _advance(self, bucket: float) -> None:
+        self.head = (self.head + 1) % self.size
+        self.bucket = bucket
+        self.timestamps[self.head] = bucket
+        for buffers in (self.avg, self.min, self.max):
+            for buffer in buffers.values():
+                buffer[self.head] = math.nan
+        self.bucket_counts.clear()
+
+    def add(self, name: str, value: float) -> None:
+        if name not in self.avg:
+            self.avg[name] = self._new_buffer()
+            self.min[name] = self._new_buffer()
+            self.max[name] = self._new_buffer()
+        head = self.head
+        count = self.bucket_counts.get(name, 0)
+        if count == 0:
+            self.avg[name][head] = self.min[name][head] = self.max[name][head] = value
+        else:
+            avg = self.avg[name]
+            avg[head] += (value - avg[head]) / (count + 1)
+            self.min[name][head] = min(self.min[name][head], value)
+            self.max[name][head] = max(self.max[name][head], value)
+        self.bucket_counts[name] = count + 1
+
+    def update(self, timestamp: float, sensors: ReadingsView) -> None:
+        bucket = timestamp - timestamp % self.resolution
+        if bucket > self.bucket:
+            self._advance(bucket)
+        for name, _, value in sensors.readings():
+            self.add(name, value)
+
+    def stats(self, name: str, since: float) -> Optional[tuple[float, float, float, int]]:
+        """min, avg, max and number of buckets newer than since, iterating the ring in place"""
+        avg_buf = self.avg.get(name)
+        if avg_buf is None or self.head < 0:
+            return None
+        min_buf = self.min[name]
+        max_buf = self.max[name]
+        lo, hi, total, num = math.inf, -math.inf, 0.0, 0
+        slot = self.head
+        for _ in range(self.size):
+            ts = self.timestamps[slot]
+            if not ts >= since - self.resolution:  # nan for never written slots
+                break
+            avg = avg_buf[slot]
+            if avg == avg:  # nan if the sensor had no reading in this bucket
+                lo = min(lo, min_buf[slot])
+                hi = max(hi, max_buf[slot])
+                total += avg
+                num += 1
+            slot = (slot - 1) % self.size
+        if num == 0:
+            return None
+        return lo, total / num, hi, num
+
+
+class SensorHistory:
+    def __init__(self, tiers: tuple = HISTORY_TIERS) -> None:
+        self.tiers = [HistoryTier(resolution, size) for resolution, size in tiers]
+        self.last: dict[str, tuple[float, float, str]] = {}  # name: (timestamp, value, units)
+        self.timestamp = 0.0
+        self.first_timestamp = math.inf
+
+    def covers(self, window: float) -> bool:
+        """True if the window is within what was recorded since start and what the tiers keep"""
+        return self.timestamp - window >= self.first_timestamp and window <= self.tiers[-1].span()
+
+    def add(self, timestamp: float, sensors: ReadingsView) -> None:
+        if timestamp <= self.timestamp or not sensors:  # same snapshot seen twice
+            return
+        self.timestamp = timestamp
+        self.first_timestamp = min(self.first_timestamp, timestamp)
+        for tier in self.tiers:
+            tier.update(timestamp, sensors)
+        for name, info, value in sensors.readings():
+            self.last[name] = (timestamp, info.convert(value), info.units)
+
+    def names(self) -> list[str]:
+        return list(self.last)
+
+    def stats(self, name: str, window: float) -> Optional[HistoryStats]:
+        """stats over the last window seconds from the finest tier that covers it"""
+        last = self.last.get(name)
+        if last is None:
+            return None
+        timestamp, value, units = last
+        tier = next((tier for tier in self.tiers if tier.span() >= window), self.tiers[-1])
+        res = tier.stats(name, timestamp - window)
+        if res is None:
+            return None
+        lo, avg, hi, num = res
+        return HistoryStats(lo, avg, hi, value, units, num)
+
+
+sensor_history = SensorHistory()
@@ -0,0 +1,159 @@
+"""
+Interned sensor registry.
+
+Every sensor gets a stable integer id on first sight, its name, label, units and config name
+are kept once in a SensorInfo. Collectors report readings as (ids, values) pairs and a
+snapshot is a packed array of values indexed by id, Sensor objects are only created as
+lightweight views when a handler asks for them.
+"""
+
+import math
+import threading
+from array import array
+from collections.abc import Mapping
+from typing import Iterator, Optional
+
+INDEX_CACHE_SIZE = 64
+
+Readings = tuple[tuple[int, ...], list]  # (sensor ids, values)
+
+
+class SensorInfo:
+    __slots__ = ("id", "name", "label", "units", "key", "integral")
+
+    def __init__(self, sensor_id: int, name: str, label: str, units: str, key: str, integral: bool) -> None:
+        self.id = sensor_id
+        self.name = name
+        self.label = label
+        self.units = units
+        self.key = key  # config name, used by sensor action rules
+        self.integral = integral  # reported as int by its collector
+
+    def convert(self, value: float) -> float:
+        """packed value back as its collector reported it"""
+        return int(value) if self.integral and math.isfinite(value) else value
+
+
+class Sensor:
+    """sensor reading, a view over its interned SensorInfo"""
+    __slots__ = ("info", "value")
+
+    def __init__(self, name: str, label: str, value: float, units: str, key: Optional[str] = None) -> None:
+        self.info: SensorInfo = sensor_registry.infos[sensor_registry.intern(name, label, units, key, isinstance(value, int))]
+        self.value: float = value
+
+    @classmethod
+    def view(cls, info: SensorInfo, value: float) -> "Sensor":
+        sensor = cls.__new__(cls)
+        sensor.info = info
+        sensor.value = info.convert(value)
+        return sensor
+
+    @property
+    def name(self) -> str:
+        return self.info.name
+
+    @property
+    def label(self) -> str:
+        return self.info.label
+
+    @property
+    def units(self) -> str:
+        return self.info.units
+
+    def __str__(self) -> str:
+        info = self.info
+        return "       %-40s <b>%s</b>%s\n" % (
+                    info.label or info.name,
+                    self.value,
+                    info.units
+                )
+
+    def config_name(self) -> str:
+        return self.info.key
+
+
+class SensorRegistry:
+    def __init__(self) -> None:
+        self.infos: list[SensorInfo] = []
+        self.by_key: dict[str, int] = {}
+        self._ids: dict[tuple, int] = {}
+        self._indexes: dict[tuple, dict[str, int]] = {}
+        self._lock = threading.Lock()  # collectors intern from sampler worker threads
+
+    def __len__(self) -> int:
+        return len(self.infos)
+
+    def intern(self, name: str, label: str, units: str, key: Optional[str] = None, integral: bool = False) -> int:
+        """id of the sensor, registered on first call"""
+        ident = (name, label, units, key)
+        sensor_id = self._ids.get(ident)
+        if sensor_id is not None:
+            return sensor_id
+
+        if key is None:
+            key = f"{name}.{label}".lower()
+        with self._lock:
+            sensor_id = self.by_key.get(key)
+            if sensor_id is None:
+                sensor_id = len(self.infos)
+                self.infos.append(SensorInfo(sensor_id, name, label, units, key, integral))
+                self.by_key[key] = sensor_id
+            self._ids[ident] = sensor_id
+        return sensor_id
+
+    def index(self, *ids_groups: tuple[int, ...]) -> dict[str, int]:
+        """{config name: id} over groups of ids in order, cached since topology rarely changes"""
+        index = self._indexes.get(ids_groups)
+        if index is None:
+            if len(self._indexes) >= INDEX_CACHE_SIZE:
+                self._indexes.clear()
+            index = {self.infos[sensor_id].key: sensor_id for ids in ids_groups for sensor_id in ids}
+            self._indexes[ids_groups] = index
+        return index
+
+
+def pack_values(size: int) -> array:
+    return array('d', bytes(8 * size))
+
+
+class ReadingsView(Mapping):
+    """read only {config name: Sensor} mapping over packed snapshot values"""
+    __slots__ = ("registry", "packed", "index")
+
+    def __init__(self, registry: SensorRegistry, packed: array, index: dict[str, int]) -> None:
+        self.registry = registry
+        self.packed = packed
+        self.index = index
+
+    def __getitem__(self, key: str) -> Sensor:
+        info = self.registry.infos[self.index[key]]
+        return Sensor.view(info, self.packed[info.id])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key) -> bool:
+        return key in self.index
+
+    def ids(self) -> Iterator[int]:
+        return iter(self.index.values())
+
+    def readings(self) -> Iterator[tuple[str, SensorInfo, float]]:
+        """(config name, info, value) without creating Sensor views"""
+        infos, packed = self.registry.infos, self.packed
+        return ((key, infos[sensor_id], packed[sensor_id]) for key, sensor_id in self.index.items())
+
+    def values(self) -> Iterator[Sensor]:
+        view = Sensor.view
+        return (view(info, value) for _, info, value in self.readings())
+
+    def items(self) -> Iterator[tuple[str, Sensor]]:
+        view = Sensor.view
+        return ((key, view(info, value)) for key, info, value in self.readings())
+
+
+sensor_registry = SensorRegistry()
@@ -0,0 +1,220 @@
+"""
+Shared sensor sampling.
+
+A single repeating job collects every sensor source on a configured cadence and publishes
+an immutable timestamped snapshot. Command handlers, buttons, auto refresh and the sensor
+watcher read that snapshot instead of querying psutil/NVML on their own; a caller can pass
+max_age to force a fresh read when the cached snapshot is too old for it.
+
+Collectors are blocking (sysfs reads, NVML calls), so each source runs in a worker thread
+in parallel with its own deadline. A source that misses its deadline is marked stale in the
+snapshot and keeps its previous readings for display, the event loop is never blocked on it.
+
+A collection may read only some sources, e.g. those the adaptive watch scheduler finds due or
+those older than max_age, the others keep their previous readings but are not fresh.
+"""
+
+import asyncio
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Callable, Iterable, Mapping, Optional
+from monitor.bot_utils import config, logger
+from monitor.instrumentation import stats
+from monitor.sensor_registry import SensorRegistry, ReadingsView, sensor_registry, pack_values
+from monitor.sensors_api import (
+    read_temperatures,
+    read_fan_speeds,
+    read_gpu_sensors,
+    read_raid_arrays,
+    read_system_stats
+)
+
+if TYPE_CHECKING:  # the agent samples sensors without telegram
+    from telegram.ext import CallbackContext
+
+SENSOR_SAMPLER_JOB_NAME = "sensor_sampler_job"
+SOURCE_TEMPERATURES = "temperatures"
+SOURCE_FANS = "fans"
+SOURCE_GPU = "gpu"
+SOURCE_RAID = "raid"
+SOURCE_SYSTEM = "system"
+GROUP_TEMPERATURES = "temperatures"
+GROUP_FANS = "fans"
+GROUP_GPU_TEMPS = "gpu_temps"
+GROUP_GPU_FANS = "gpu_fans"
+GROUP_GPU_STATS = "gpu_stats"
+GROUP_RAID = "raid"
+GROUP_SYSTEM = "system"
+# source: (reader, groups of sensors it reads), a reader of several groups returns readings of each
+SENSOR_SOURCES: dict[str, tuple[Callable, tuple[str, ...]]] = {
+    SOURCE_TEMPERATURES: (read_temperatures, (GROUP_TEMPERATURES,)),
+    SOURCE_FANS: (read_fan_speeds, (GROUP_FANS,)),
+    SOURCE_GPU: (read_gpu_sensors, (GROUP_GPU_TEMPS, GROUP_GPU_FANS, GROUP_GPU_STATS)),
+    SOURCE_RAID: (read_raid_arrays, (GROUP_RAID,)),
+    SOURCE_SYSTEM: (read_system_stats, (GROUP_SYSTEM,))
+}
+# same merge order as get_all_sensors
+SENSOR_GROUPS = (GROUP_FANS, GROUP_TEMPERATURES, GROUP_GPU_TEMPS, GROUP_GPU_FANS, GROUP_GPU_STATS, GROUP_RAID, GROUP_SYSTEM)
+
+
+@dataclass(frozen=True)
+class SensorSnapshot:
+    """timestamp and packed values indexed by sensor id, groups list the ids each group reported"""
+    timestamp: float
+    values: array = field(default_factory=lambda: array('d'))
+    groups: Mapping[str, tuple[int, ...]] = field(default_factory=dict)
+    stale: frozenset = frozenset()  # sources that failed or missed their deadline
+    fresh_groups: tuple[str, ...] = ()  # groups read by the collection of this snapshot
+    registry: SensorRegistry = sensor_registry
+
+    def age(self) -> float:
+        return time.time() - self.timestamp
+
+    def is_stale(self, source: str) -> bool:
+        return source in self.stale
+
+    def group(self, name: str) -> ReadingsView:
+        return ReadingsView(self.registry, self.values, self.registry.index(self.groups.get(name, ())))
+
+    @property
+    def temperatures(self) -> ReadingsView:
+        return self.group(GROUP_TEMPERATURES)
+
+    @property
+    def fans(self) -> ReadingsView:
+        return self.group(GROUP_FANS)
+
+    @property
+    def gpu_temps(self) -> ReadingsView:
+        return self.group(GROUP_GPU_TEMPS)
+
+    @property
+    def gpu_fans(self) -> ReadingsView:
+        return self.group(GROUP_GPU_FANS)
+
+    @property
+    def gpu_stats(self) -> ReadingsView:
+        return self.group(GROUP_GPU_STATS)
+
+    @property
+    def raid(self) -> ReadingsView:
+        return self.group(GROUP_RAID)
+
+    @property
+    def system(self) -> ReadingsView:
+        return self.group(GROUP_SYSTEM)
+
+    @property
+    def sensors(self) -> ReadingsView:
+        """fresh readings only"""
+        ids_groups = tuple(self.groups[name] for name in SENSOR_GROUPS if name in self.fresh_groups)
+        return ReadingsView(self.registry, self.values, self.registry.index(*ids_groups))
+
+
+def _consume_result(future: asyncio.Future) -> None:
+    """late results of timed out reads are dropped, retrieve them to keep asyncio quiet"""
+    if not future.cancelled():
+        future.exception()
+
+
+class SensorSampler:
+    def __init__(self) -> None:
+        self.snapshot: Optional[SensorSnapshot] = None
+        self._lock = asyncio.Lock()
+        # one worker per source, a wedged source can't starve the others
+        self._executor = ThreadPoolExecutor(max_workers=len(SENSOR_SOURCES), thread_name_prefix="sensor_source")
+        self._pending: dict[str, asyncio.Future] = {}
+        self.read_at: dict[str, float] = {}  # source: time of its last read
+
+    def _outdated_sources(self, max_age: float) -> list[str]:
+        now = time.time()
+        return [source for source in SENSOR_SOURCES if now - self.read_at.get(source, 0) > max_age]
+
+    async def _read_source(self, source: str):
+        """source readings, None if it failed or missed its deadline"""
+        future = self._pending.get(source)
+        if future is None or future.done():
+            future = asyncio.get_running_loop().run_in_executor(self._executor, stats.timed, f"collector.{source}",
+                                                                SENSOR_SOURCES[source][0])
+            future.add_done_callback(_consume_result)
+            self._pending[source] = future
+        # a read still running from an earlier tick is awaited again instead of piling up threads
+
+        timeout = config.get_read_timeout(source)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Sensor source {source} did not respond in {timeout}s, using stale readings")
+        except Exception as e:
+            logger.error(f"Sensor source {source} failed - {e}")
+        return None
+
+    async def _collect(self, sources: Optional[Iterable[str]] = None) -> SensorSnapshot:
+        sources = list(SENSOR_SOURCES if sources is None else sources)
+        results = dict(zip(sources, await asyncio.gather(*(self._read_source(source) for source in sources))))
+        timestamp = time.time()
+        previous = self.snapshot or SensorSnapshot(timestamp=0)
+        values = pack_values(len(sensor_registry))
+        groups = {}
+        fresh_groups = []
+        stale = []
+        for source, (_, group_names) in SENSOR_SOURCES.items():
+            if source in results:
+                self.read_at[source] = timestamp
+            res = results.get(source)
+            if res is None:
+                # failed or not read this time, keep previous readings of the source for display
+                if source in results or previous.is_stale(source):
+                    stale.append(source)
+                for name in group_names:
+                    ids = groups[name] = previous.groups.get(name, ())
+                    for sensor_id in ids:
+                        values[sensor_id] = previous.values[sensor_id]
+                continue
+
+            for name, (ids, readings) in zip(group_names, res if len(group_names) > 1 else (res,)):
+                groups[name] = ids
+                fresh_groups.append(name)
+                for sensor_id, value in zip(ids, readings):
+                    values[sensor_id] = value
+
+        return SensorSnapshot(timestamp=timestamp,
+                              values=values,
+                              groups=MappingProxyType(groups),
+                              stale=frozenset(stale),
+                              fresh_groups=tuple(fresh_groups))
+
+    async def sample(self, sources: Optional[Iterable[str]] = None) -> SensorSnapshot:
+        """collect a new snapshot of all or the given sources and publish it"""
+        async with self._lock:
+            self.snapshot = await self._collect(sources)
+            return self.snapshot
+
+    async def get_snapshot(self, max_age: Optional[float] = None) -> SensorSnapshot:
+        """latest snapshot, sources read more than max_age seconds ago are collected anew"""
+        if max_age is None:
+            max_age = config.sensor_sample_max_age
+        if self.snapshot is not None and not self._outdated_sources(max_age):
+            return self.snapshot
+
+        async with self._lock:
+            # a concurrent caller may have refreshed it while we waited
+            outdated = self._outdated_sources(max_age)
+            if self.snapshot is None:
+                self.snapshot = await self._collect()
+            elif outdated:
+                self.snapshot = await self._collect(outdated)
+            return self.snapshot
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def on_sample_sensors(context: "CallbackContext"):
+    await sensor_sampler.sample()
+
+
+sensor_sampler = SensorSampler()
@@ -19,6 +19,10 @@ Action Conditions:
     more
     less
     in exclusive range
+    rate per minute less than, alerts on a reading rising faster
+    deviation from baseline less than, in standard deviations
+    sustained mean less than, checked once readings span SENSOR_STATS_WINDOW
+    streaming stats are kept over SENSOR_STATS_WINDOW, see streaming_stats
 
 Actions:
     Notify
@@ -29,11 +33,22 @@ Actions:
 from enum import IntFlag, IntEnum
 from pathlib import Path
 import os
-import requests
+import html
+import math
+import time
+import asyncio
 import configparser
+from array import array
+from typing import Optional
+from telegram import Bot
+from telegram.constants import ParseMode, MessageLimit
 from telegram.ext import CallbackContext
 from monitor.bot_utils import logger, DATA_PATH, config
-from monitor.sensors_api import get_all_sensors
+from monitor.sensor_sampler import sensor_sampler, SensorSnapshot
+from monitor.sensor_history import sensor_history
+from monitor.history_log import history_log
+from monitor.instrumentation import stats
+from monitor.streaming_stats import StreamingStats
 
 CONFIG_FILE_NAME = "sensor_actions_config"
 SENSOR_WATCH_JOB_NAME = "sensor_watch_job"
@@ -49,54 +64,115 @@ class Condition(IntEnum):
     More = 0
     Less = 1
     ExclusiveRange = 2
+    RateLess = 3
+    DeviationLess = 4
+    MeanLess = 5
+
+
+class Metric(IntEnum):
+    """what a condition is checked against"""
+    Reading = 0
+    Rate = 1  # per minute
+    Deviation = 2  # standard deviations from the mean
+    Mean = 3
+
+
+CONDITION_METRICS = {
+    Condition.RateLess: Metric.Rate,
+    Condition.DeviationLess: Metric.Deviation,
+    Condition.MeanLess: Metric.Mean
+}
 
 
 class ConfigEntry:
     def __init__(self, name: str, action: Action, condition: Condition, value) -> None:
         self.name: str = name
         self.action: Action = action
-        self.condition: Condition = condition
+        self.condition: Condition = Condition(condition)
         self.value = value
-        self.failed_condition_num = 0
-        self.triggered = False
-        if condition == Condition.ExclusiveRange:
-            ConfigEntry.parse_range_value(value)
+        self._failed_condition_num = 0
+        self._triggered = False
+        self._rules: Optional["RuleTable"] = None
+        self._rule_i = 0
+        self.metric = CONDITION_METRICS.get(self.condition, Metric.Reading)
+        if self.condition == Condition.ExclusiveRange:
+            self.low, self.high = ConfigEntry.parse_range_value(value)
         else:
             self.value = float(value)
+            if self.condition == Condition.DeviationLess and self.value <= 0:
+                raise ValueError("deviation must be positive")
+            self.low, self.high = (self.value, math.inf) if self.condition == Condition.More else (-math.inf, self.value)
 
     def parse_range_value(value: str) -> tuple:
         min, max = map(float, value.split(':'))
         if min >= max:
             raise ValueError("invalid range")
         return min, max
-    
+
+    def bind(self, rules: "RuleTable", rule_i: int) -> None:
+        """move rule state into a compiled rule table slot"""
+        failed_condition_num, triggered = self.failed_condition_num, self.triggered
+        self._rules, self._rule_i = rules, rule_i
+        self.failed_condition_num, self.triggered = failed_condition_num, triggered
+
+    @property
+    def failed_condition_num(self) -> int:
+        return self._rules.failed[self._rule_i] if self._rules is not None else self._failed_condition_num
+
+    @failed_condition_num.setter
+    def failed_condition_num(self, num: int) -> None:
+        if self._rules is not None:
+            self._rules.failed[self._rule_i] = num
+        else:
+            self._failed_condition_num = num
+
+    @property
+    def triggered(self) -> bool:
+        return bool(self._rules.triggered[self._rule_i]) if self._rules is not None else self._triggered
+
+    @triggered.setter
+    def triggered(self, triggered: bool) -> None:
+        if self._rules is not None:
+            self._rules.triggered[self._rule_i] = triggered
+        else:
+            self._triggered = triggered
+
     def check_condition(self, value) -> bool:
         """True if satisfied"""
-        if self.condition == Condition.ExclusiveRange:
-            try:
-                min, max = ConfigEntry.parse_range_value(self.value)
-                return min < value and value < max
-            except:
-                return True
-            
-        elif self.condition == Condition.More:
-            return self.value < value
-        else:
-            return self.value > value
-        
+        return self.low < value < self.high
+
     def get_condition_str(self) -> str:
         if self.condition == Condition.ExclusiveRange:
             return "in range"
         elif self.condition == Condition.Less:
             return "less than"
+        elif self.condition == Condition.RateLess:
+            return "rate per minute less than"
+        elif self.condition == Condition.DeviationLess:
+            return "deviation from baseline in sigma less than"
+        elif self.condition == Condition.MeanLess:
+            return "sustained mean less than"
         else:
             return "more than"
-        
-    def trigger_action(self, value: float) -> None:
-        self.failed_condition_num = 0
-        if self.triggered:
-            return
-                    
+
+    def get_reading_str(self, value: float) -> str:
+        if self.metric == Metric.Rate:
+            return f"rate <b>{value:+.2f}</b>/min"
+        elif self.metric == Metric.Deviation:
+            return f"deviation <b>{value:.1f}</b> sigma"
+        elif self.metric == Metric.Mean:
+            return f"mean reading <b>{value:.1f}</b>"
+        return f"reading <b>{value}</b>"
+
+    def get_alert_text(self, value: float, host: Optional[str] = None) -> str:
+        where = f" on host <b>{html.escape(host)}</b>" if host is not None else ""
+        return f"Sensor Watcher Warning: sensor <b>\"{self.name}\"</b>{where} with {self.get_reading_str(value)} is outside configured: {self.get_condition_str()} <b>{self.value}</b>"
+
+    def trigger_action(self, value: float) -> Optional[str]:
+        """execute configured system action, returns notification text if users have to be notified"""
+        if not self._rules.fire(self._rule_i):  # entries are bound when their rule table is compiled
+            return None
+
         postfix = ""
         if self.action & (Action.Reboot | Action.Shutdown):
             cmd = "shutdown "
@@ -110,21 +186,106 @@ class ConfigEntry:
             else:
                 postfix = "The system is going to {}".format("reboot" if self.action & Action.Reboot else "shutdown")
 
-        if self.action & Action.Notify:
-            if config.is_user_specified():
-                for user_id in config.user_id_set:
-                    msg =f"Sensor Watcher Warning: sensor <b>\"{self.name}\"</b> with reading <b>{value}</b> is outside configured: {self.get_condition_str()} <b>{self.value}</b>"
-                    if postfix:
-                        msg += f"\n{postfix}"
-                    payload = {
-                        'chat_id': user_id,
-                        'text': msg,
-                        'parse_mode': 'HTML'
-                    }
-                    requests.post("https://api.telegram.org/bot{token}/sendMessage".format(token=config.token),
-                                        data=payload).content
+        if not self.action & Action.Notify:
+            return None
+
+        msg = self.get_alert_text(value)
+        if postfix:
+            msg += f"\n{postfix}"
+        return msg
+
+
+class RuleTable:
+    """
+    Rules compiled into flat arrays: watched sensor index, checked metric, exclusive low/high bounds
+    and per rule failure counters. Every condition reduces to low < metric < high, so a whole
+    snapshot is evaluated in a single pass without per rule dispatch. Streaming stats of watched
+    sensors are kept only if a rule checks one of them.
+    """
+    def __init__(self, entries: list[ConfigEntry], bind: bool = True) -> None:
+        self.entries = entries
+        self.sensor_names: list[str] = list(dict.fromkeys(entry.name for entry in entries))
+        sensor_ids = {name: i for i, name in enumerate(self.sensor_names)}
+        self.sensor_index = array('l', (sensor_ids[entry.name] for entry in entries))
+        self.metric = array('b', (entry.metric for entry in entries))
+        self.low = array('d', (entry.low for entry in entries))
+        self.high = array('d', (entry.high for entry in entries))
+        self.failed = array('l', bytes(array('l').itemsize * len(entries)))
+        self.triggered = bytearray(len(entries))
+        self.metrics = array('d', [math.nan]) * len(entries)  # last checked metric of each rule
+        self.checked_at = 0.0  # timestamp of the last snapshot evaluated, a cached snapshot counts once
+        self._index: Optional[dict[str, int]] = None
+        self._ids: list[Optional[int]] = []  # snapshot sensor id of each watched sensor
+        self.stats: Optional[StreamingStats] = None
+        if any(self.metric):
+            self.stats = StreamingStats(len(self.sensor_names), config.sensor_stats_window)
+        if bind:  # an unbound table keeps its own rule states, e.g. per remote host
+            for rule_i, entry in enumerate(entries):
+                entry.bind(self, rule_i)
+
+    def __len__(self) -> int:
+        return len(self.entries)
 
-        self.triggered = True
+    def fire(self, rule_i: int) -> bool:
+        """rule reached the failure threshold, resets its count, True only once until its value recovers"""
+        self.failed[rule_i] = 0
+        if self.triggered[rule_i]:
+            return False
+        self.triggered[rule_i] = True
+        return True
+
+    def resolve(self, index: dict[str, int]) -> list[Optional[int]]:
+        """sensor ids of watched sensors, resolved again only when the snapshot topology changes"""
+        if index is not self._index:
+            self._index = index
+            self._ids = [index.get(name) for name in self.sensor_names]
+        return self._ids
+
+    def evaluate(self, snapshot: SensorSnapshot, threshold: int) -> list[tuple[ConfigEntry, float]]:
+        """update failure counters, returns rules that reached threshold with their readings"""
+        return [(self.entries[rule_i], value) for rule_i, value in self.evaluate_rules(snapshot, threshold)]
+
+    def evaluate_rules(self, snapshot: SensorSnapshot, threshold: int) -> list[tuple[int, float]]:
+        """same as evaluate, rules are returned by index"""
+        readings = snapshot.values
+        infos = snapshot.registry.infos
+        values = [infos[sensor_id].convert(readings[sensor_id]) if sensor_id is not None else None
+                  for sensor_id in self.resolve(snapshot.sensors.index)]
+        metrics = self.update_stats(snapshot.timestamp, values) if self.stats is not None else (values,)
+        failed = self.failed
+        checked = self.metrics
+        fired = []
+        for rule_i, (sensor_i, metric, low, high) in enumerate(zip(self.sensor_index, self.metric, self.low, self.high)):
+            value = metrics[metric][sensor_i]
+            if value is None:  # sensor is missing, its source is stale or its stats have no baseline yet
+                continue
+            checked[rule_i] = value
+            if low < value < high:
+                failed[rule_i] = 0
+                self.triggered[rule_i] = False
+            else:
+                failed[rule_i] += 1
+                if failed[rule_i] >= threshold:
+                    fired.append((rule_i, value))
+        return fired
+
+
+    def update_stats(self, timestamp: float, values: list[Optional[float]]) -> tuple[list[Optional[float]], ...]:
+        """feed readings of watched sensors to their streaming stats, returns each sensor metric indexed by Metric"""
+        stats = self.stats
+        rates, deviations, means = [], [], []
+        for sensor_i, value in enumerate(values):
+            if value is None:
+                rates.append(None)
+                deviations.append(None)
+                means.append(None)
+                continue
+            deviations.append(stats.deviation(sensor_i, value))  # against the baseline before this reading
+            stats.update(sensor_i, timestamp, value)
+            slope = stats.slope(sensor_i)
+            rates.append(slope * 60 if slope is not None else None)
+            means.append(stats.sustained_mean(sensor_i))
+        return values, rates, deviations, means
 
 
 class SensorActionConfig:
@@ -132,10 +293,17 @@ class SensorActionConfig:
         self.configEntries: dict[str, ConfigEntry] = {}
         self.config = configparser.ConfigParser()
         self.num_values_in_entry = 3
+        self.rules = RuleTable([])
 
-    def load_config(self) -> None:
+    def compile(self) -> None:
+        """rebuild rule table after config entries change, rule states are kept"""
+        checked_at = self.rules.checked_at
+        self.rules = RuleTable(list(self.configEntries.values()))
+        self.rules.checked_at = checked_at
+
+    def load_config(self, file_path: Optional[str] = None) -> None:
         """open or create config file, load config from file"""
-        file_path = Path(os.path.join(DATA_PATH, CONFIG_FILE_NAME))
+        file_path = Path(file_path or os.path.join(DATA_PATH, CONFIG_FILE_NAME))
         if file_path.exists():
             with open(file_path) as config_file:
                 self.config.read_file(config_file)
@@ -154,31 +322,83 @@ class SensorActionConfig:
         else:
             fp = open(file_path, mode="x")
             fp.close()
+        self.compile()
 
     def update_config(self, entry: ConfigEntry) -> None:
         """rewrite file with new config"""
         self.configEntries[entry.name] = entry
+        self.compile()
         file_path = Path(os.path.join(DATA_PATH, CONFIG_FILE_NAME))
         with open(file_path, mode="w") as fp:
-            self.config["DEFAULT"][entry.name] = f"{entry.action}, {entry.condition}, {entry.value}"
+            self.config["DEFAULT"][entry.name] = f"{int(entry.action)}, {int(entry.condition)}, {entry.value}"
             self.config.write(fp)
 
 
-async def on_check_sensors(context: CallbackContext):
-    if len(sensor_action_config.configEntries) == 0:
+def batch_messages(alerts: list[str]) -> list[str]:
+    """join alerts into as few messages as the message length limit allows"""
+    messages = []
+    current = ""
+    for alert in alerts:
+        if current and len(current) + len(alert) + 2 > MessageLimit.MAX_TEXT_LENGTH:
+            messages.append(current)
+            current = ""
+        current = current + "\n\n" + alert if current else alert
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def notify_users(bot: Bot, alerts: list[str]) -> None:
+    """send alerts of one watch tick to all users concurrently, one message per user if it fits"""
+    if not config.is_user_specified() or not alerts:
         return
-    
-    sensors = get_all_sensors()
-    for name, action_item in sensor_action_config.configEntries.items():
-        sensor = sensors.get(name, None)
-        if sensor:
-            if action_item.check_condition(sensor.value):
-                action_item.triggered = False
-                action_item.failed_condition_num = 0
-            else:
-                action_item.failed_condition_num += 1
-                if action_item.failed_condition_num >= config.sensor_watch_threshold:
-                    action_item.trigger_action(sensor.value)                
-    
+
+    async def send(user_id: int, messages: list[str]) -> None:
+        for msg in messages:
+            await bot.send_message(chat_id=user_id, text=msg, parse_mode=ParseMode.HTML)
+
+    messages = batch_messages(alerts)
+    user_ids = list(config.user_id_set)
+    results = await asyncio.gather(*(send(user_id, messages) for user_id in user_ids), return_exceptions=True)
+    for user_id, res in zip(user_ids, results):
+        if isinstance(res, Exception):
+            logger.error(f"Failed to deliver sensor watcher alert to user: {user_id} - {res}")
+
+
+async def check_sensors(bot: Bot, snapshot: Optional[SensorSnapshot] = None) -> bool:
+    """
+    record fresh readings and evaluate rules on them, the latest shared snapshot if none is given,
+    False if no rules were evaluated
+    """
+    if snapshot is None:
+        snapshot = await sensor_sampler.get_snapshot()
+    if snapshot.timestamp > sensor_history.timestamp:
+        history_log.append(snapshot)
+    sensor_history.add(snapshot.timestamp, snapshot.sensors)
+
+    rules = sensor_action_config.rules
+    if len(rules) == 0 or snapshot.timestamp <= rules.checked_at:
+        return False
+    rules.checked_at = snapshot.timestamp
+
+    alerts = []
+    for action_item, value in rules.evaluate(snapshot, config.sensor_watch_threshold):
+        alert = action_item.trigger_action(value)
+        if alert:
+            alerts.append(alert)
+
+    await notify_users(bot, alerts)
+    return True
+
+
+async def on_check_sensors(context: CallbackContext):
+    stats.tick("job.sensor_watch", config.sensor_watch_time)
+    start = time.perf_counter()
+    checked = True  # a failed check still counts as one
+    try:
+        checked = await check_sensors(context.bot)
+    finally:
+        stats.observe("job.sensor_watch" if checked else "job.sensor_watch.idle", time.perf_counter() - start)
+
 
 sensor_action_config = SensorActionConfig()
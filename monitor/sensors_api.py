@@ -1,44 +1,155 @@
+import time
 import psutil
-import pynvml
-from monitor.bot_utils import logger
+from monitor.bot_utils import logger, config, SENSOR_BACKEND_HWMON
+from monitor.amdgpu import AmdGpuReader
+from monitor.hwmon import HwmonReader
+from monitor.mdstat import MdstatReader
+from monitor.sensor_registry import Sensor, Readings, sensor_registry
+from monitor.system_stats import SystemCollector, ProcessTable
 
 
-class Sensor:
-    def __init__(self, name: str, label: str, value: float, units: str) -> None:
-        self.name: str = name
-        self.label: str = label
-        self.value: float = value
-        self.units: str = units
+class NvidiaCollector:
+    """
+    Long lived NVML session, device handles, names and fan counts are cached between readouts.
+    pynvml is imported on the first readout, off the startup path and only where it's read.
+    """
+    def __init__(self, nvml=None) -> None:
+        self.nvml = nvml
+        self.initialized = False
+        self.devices: list[tuple] = []  # (handle, temperature sensor id, fan sensor ids)
+        self.device_count = 0
+        self.scanned_at = 0.0
+        self.init_failed = False
 
-    def __str__(self) -> str:
-        return "       %-40s <b>%s</b>%s\n" % (
-                    self.label or self.name,
-                    self.value,
-                    self.units
-                )
+    def _init(self) -> None:
+        if self.nvml is None:
+            import pynvml
+            self.nvml = pynvml
+        self.nvml.nvmlInit()
+        self.initialized = True
+        self._scan_devices(self.nvml.nvmlDeviceGetCount())
+
+    def _scan_devices(self, device_count: int) -> None:
+        previous = {sensor_registry.infos[temp_id].name for _, temp_id, _ in self.devices}
+        devices = []
+        for i in range(device_count):
+            handle = self.nvml.nvmlDeviceGetHandleByIndex(i)
+            name = self.nvml.nvmlDeviceGetName(handle)
+            if name:
+                fan_num = self._read_optional(self.nvml.nvmlDeviceGetNumFans, handle) or 0
+                devices.append((handle,
+                                sensor_registry.intern(name, name, "°C", key=name, integral=True),
+                                tuple(sensor_registry.intern(name, f"fan{fan_i}", "%", integral=True) for fan_i in range(fan_num))))
+        if self.scanned_at and devices != self.devices:
+            current = {sensor_registry.infos[temp_id].name for _, temp_id, _ in devices}
+            logger.info(f"NvidiaCollector: GPU topology changed, {device_count} devices, "
+                        f"added: {sorted(current - previous)}, removed: {sorted(previous - current)}")
+        self.devices = devices
+        self.device_count = device_count
+        self.scanned_at = time.monotonic()
+
+    def _check_topology(self) -> None:
+        """rescan devices if their count changed or the rescan interval passed"""
+        device_count = self.nvml.nvmlDeviceGetCount()
+        if device_count != self.device_count or time.monotonic() - self.scanned_at >= config.topology_rescan_interval:
+            self._scan_devices(device_count)
+
+    def shutdown(self) -> None:
+        if self.initialized:
+            try:
+                self.nvml.nvmlShutdown()
+            except self.nvml.NVMLError:
+                pass
+        self.initialized = False
+        self.devices = []
+        self.device_count = 0
+        self.scanned_at = 0.0
+
+    def _read_optional(self, func, *args):
+        """None if the reading is not supported by the device, other errors propagate"""
+        try:
+            return func(*args)
+        except self.nvml.NVMLError as e:
+            if e.value == self.nvml.NVML_ERROR_NOT_SUPPORTED:
+                return None
+            raise
+
+    def read(self) -> tuple[Readings, Readings]:
+        """read temperatures and fan speeds of all devices in one pass"""
+        temp_ids, temps, fan_ids, fans = [], [], [], []
+        if not self.initialized:
+            try:
+                self._init()
+            except Exception:
+                self.shutdown()
+                if not self.init_failed:
+                    logger.warning("NvidiaCollector: NVidia library failed to initialize")
+                self.init_failed = True
+                return ((), []), ((), [])
+            self.init_failed = False
+
+        try:
+            self._check_topology()
+            for handle, temp_id, device_fan_ids in self.devices:
+                temp = self._read_optional(self.nvml.nvmlDeviceGetTemperature, handle, self.nvml.NVML_TEMPERATURE_GPU)
+                if temp is not None:
+                    temp_ids.append(temp_id)
+                    temps.append(temp)
+                for fan_i, fan_id in enumerate(device_fan_ids):
+                    speed = self._read_optional(self.nvml.nvmlDeviceGetFanSpeed_v2, handle, fan_i)
+                    if speed is not None:
+                        fan_ids.append(fan_id)
+                        fans.append(speed)
+        except self.nvml.NVMLError as e:
+            # handles are invalid after a driver reset or a lost GPU, start a new session on next readout
+            logger.warning(f"NvidiaCollector: failed to read GPU sensors - {e}, reinitializing")
+            self.shutdown()
+            return ((), []), ((), [])
+
+        return (tuple(temp_ids), temps), (tuple(fan_ids), fans)
+
+    def collect(self) -> tuple[dict[str, Sensor], dict[str, Sensor]]:
+        temps, fans = self.read()
+        return readings_to_sensors(temps), readings_to_sensors(fans)
 
-    def config_name(self) -> str:
-        return f"{self.name}.{self.label}".lower()
+
+nvidia_collector = NvidiaCollector()
+amdgpu_reader = AmdGpuReader()
 
 
 def get_nvidia_temps() -> dict[str, Sensor]:
-    temps = {}
-    try:
-        pynvml.nvmlInit()
-        deviceCount = pynvml.nvmlDeviceGetCount()
-        for i in range(deviceCount):
-            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-            name = pynvml.nvmlDeviceGetName(handle)
-            if name:
-                temps[name] = (Sensor(name, name, pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU), "°C"))
-        pynvml.nvmlShutdown()
-    except:
-        logger.warning("get_nvidia_temps: NVidia library failed to initialize")
-    return temps
+    return nvidia_collector.collect()[0]
+
+
+def merge_readings(*readings: Readings) -> Readings:
+    ids = ()
+    values = []
+    for reading_ids, reading_values in readings:
+        ids += reading_ids
+        values += reading_values
+    return ids, values
+
+
+def read_gpu_sensors() -> tuple[Readings, Readings, Readings]:
+    """GPU temperatures, GPU fans and GPU stats of NVidia and AMD cards"""
+    nvidia_temps, nvidia_fans = nvidia_collector.read()
+    amd_temps, amd_fans, amd_stats = amdgpu_reader.read()
+    return merge_readings(nvidia_temps, amd_temps), merge_readings(nvidia_fans, amd_fans), amd_stats
+
+
+def get_gpu_sensors() -> tuple[dict[str, Sensor], dict[str, Sensor]]:
+    """GPU temperatures and GPU fans"""
+    temps, fans, _ = read_gpu_sensors()
+    return readings_to_sensors(temps), readings_to_sensors(fans)
+
+
+def get_gpu_stats() -> dict[str, Sensor]:
+    """GPU power, busy percent and fan speeds in RPM"""
+    return readings_to_sensors(read_gpu_sensors()[2])
 
 
 def get_gpu_temps() -> dict:
-    return get_nvidia_temps()  # TODO add Radeon
+    return get_gpu_sensors()[0]
 
 
 def gpu_temps_to_str(data: dict[str, Sensor]) -> str:
@@ -55,18 +166,43 @@ def gpu_temps_to_str(data: dict[str, Sensor]) -> str:
     return res
 
 
-def get_sensors_temperatures() -> dict[str, Sensor]:
-    sensors_data = psutil.sensors_temperatures() if hasattr(psutil, "sensors_temperatures") else {}
-    names = set(list(sensors_data.keys()))
-    res = {}
-    for name in names:
+hwmon_reader = HwmonReader()
+
+
+def readings_to_sensors(readings: Readings) -> dict[str, Sensor]:
+    infos = sensor_registry.infos
+    return {infos[sensor_id].key: Sensor.view(infos[sensor_id], value) for sensor_id, value in zip(*readings)}
+
+
+def readings_from_entries(data: dict, units: str, fallback_suffix: str) -> Readings:
+    """psutil-like {chip: [entry(label, current)]} data to readings"""
+    ids = []
+    values = []
+    intern = sensor_registry.intern
+    for name in data:
         counter = 0
-        for entry in sensors_data[name]:
-            s = Sensor(name, entry.label or name + f"_{counter}", entry.current, "°C")
-            res[s.config_name()] = s
+        for entry in data[name]:
+            ids.append(intern(name, entry.label or name + f"_{fallback_suffix}{counter}", units,
+                              integral=isinstance(entry.current, int)))
+            values.append(entry.current)
             counter += 1
+    return tuple(ids), values
 
-    return res
+
+def sensors_from_entries(data: dict, units: str, fallback_suffix: str) -> dict[str, Sensor]:
+    """psutil-like {chip: [entry(label, current)]} data to sensors"""
+    return readings_to_sensors(readings_from_entries(data, units, fallback_suffix))
+
+
+def read_temperatures() -> Readings:
+    if config.sensor_backend == SENSOR_BACKEND_HWMON:
+        return hwmon_reader.temperature_readings()
+    sensors_data = psutil.sensors_temperatures() if hasattr(psutil, "sensors_temperatures") else {}
+    return readings_from_entries(sensors_data, "°C", "")
+
+
+def get_sensors_temperatures() -> dict[str, Sensor]:
+    return readings_to_sensors(read_temperatures())
 
 
 def temperatures_to_str(sensors_data: dict[str, Sensor]) -> str:
@@ -83,18 +219,15 @@ def temperatures_to_str(sensors_data: dict[str, Sensor]) -> str:
     return res
 
 
-def get_sensors_fan_speeds() -> dict[str, Sensor]:
+def read_fan_speeds() -> Readings:
+    if config.sensor_backend == SENSOR_BACKEND_HWMON:
+        return hwmon_reader.fan_readings()
     data = psutil.sensors_fans() if hasattr(psutil, "sensors_fans") else {}
-    res = {}
-    names = set(list(data.keys()))
-    for name in names:
-        if name in data:
-            counter = 0
-            for entry in data[name]:
-                s = Sensor(name, entry.label or name + f"_fan{counter}", entry.current, "RPM")
-                res[s.config_name()] = s
-                counter += 1
-    return res
+    return readings_from_entries(data, "RPM", "fan")
+
+
+def get_sensors_fan_speeds() -> dict[str, Sensor]:
+    return readings_to_sensors(read_fan_speeds())
 
 
 def fans_to_str(data: dict[str, Sensor]) -> str:
@@ -112,22 +245,7 @@ def fans_to_str(data: dict[str, Sensor]) -> str:
 
 
 def get_gpu_fans() -> dict[str, Sensor]:
-    data = {}
-    try:
-        pynvml.nvmlInit()
-        deviceCount = pynvml.nvmlDeviceGetCount()
-        for i in range(deviceCount):
-            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-            name = pynvml.nvmlDeviceGetName(handle)
-            if name:
-                fans = []
-                for fan_i in range(pynvml.nvmlDeviceGetNumFans(handle)):
-                    s = Sensor(name, f"fan{fan_i}", pynvml.nvmlDeviceGetFanSpeed_v2(handle, fan_i), "%")
-                    data[s.config_name()] = s
-        pynvml.nvmlShutdown()
-    except:
-        logger.warning("get_gpu_fans: NVidia library failed to initialize")
-    return data
+    return get_gpu_sensors()[1]
 
 
 def gpu_fans_to_str(data: dict[str, Sensor]) -> str:
@@ -147,9 +265,56 @@ def gpu_fans_to_str(data: dict[str, Sensor]) -> str:
 
     return res
 
+
+def gpu_stats_to_str(data: dict[str, Sensor]) -> str:
+    if not data:
+        return ""
+
+    res = "GPU Stats:\n"
+    last_name = None
+    for sensor in data.values():
+        if not last_name or last_name != sensor.name:
+            last_name = sensor.name
+            res += f"\n    {sensor.name}\n"
+        res += str(sensor)
+    return res
+
+
+mdstat_reader = MdstatReader()
+
+
+def read_raid_arrays() -> Readings:
+    return mdstat_reader.readings()
+
+
+def get_raid_sensors() -> dict[str, Sensor]:
+    return readings_to_sensors(read_raid_arrays())
+
+
+system_collector = SystemCollector()
+process_table = ProcessTable()
+
+
+def read_system_stats() -> Readings:
+    return system_collector.readings()
+
+
+def get_system_sensors() -> dict[str, Sensor]:
+    return readings_to_sensors(read_system_stats())
+
+
+def get_top_processes(count: int) -> list[tuple[int, str, float, int]]:
+    """(pid, name, CPU percent, RSS bytes) of the busiest processes since the previous call"""
+    return process_table.top(count)
+
+
 def get_all_sensors() -> dict[str, Sensor]:
     res = get_sensors_fan_speeds()
     res |= get_sensors_temperatures()
-    res |= get_gpu_temps()
-    res |= get_gpu_fans()
-    return res
\ No newline at end of file
+    gpu_temps, gpu_fans, gpu_stats = read_gpu_sensors()
+    res |= readings_to_sensors(gpu_temps)
+    res |= readings_to_sensors(gpu_fans)
+    res |= readings_to_sensors(gpu_stats)
+    res |= get_raid_sensors()
+    res |= get_system_sensors()
+    return res
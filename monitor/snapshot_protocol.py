@@ -0,0 +1,179 @@
+"""
+Agent to hub snapshot protocol.
+
+Length prefixed binary frames over a stream (TCP or Unix socket), the first payload byte
+is the frame type:
+
+    HELLO     version, secret, host name
+    TOPOLOGY  per group: group name, per sensor: integral flag, key, name, label, units
+    SAMPLE    timestamp, stale sources, fresh group mask, float64 values in topology order
+
+Topology is sent after HELLO and again only when the agent's sensor topology changes, a
+sample is then just its timestamp and packed values. Recordings (monitor.recorder) store the
+same TOPOLOGY and SAMPLE frames in a file.
+"""
+
+import asyncio
+import struct
+from array import array
+from typing import Optional
+
+PROTOCOL_VERSION = 1
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+FRAME_SIZE = struct.Struct("<I")
+STRING_SIZE = struct.Struct("<H")
+COUNT = struct.Struct("<I")
+FLAG = struct.Struct("<B")
+SAMPLE_HEADER = struct.Struct("<dI")  # timestamp, fresh group mask
+FRAME_HELLO = b"H"
+FRAME_TOPOLOGY = b"T"
+FRAME_SAMPLE = b"S"
+
+# (key, name, label, units, integral)
+SensorDescription = tuple[str, str, str, str, bool]
+# [(group name, [sensor descriptions])]
+Topology = list[tuple[str, list[SensorDescription]]]
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class TruncatedFrame(ProtocolError):
+    """recording ends inside a frame, e.g. its recorder was killed"""
+
+
+class Decoder:
+    __slots__ = ("data", "offset")
+
+    def __init__(self, data: bytes, offset: int = 0) -> None:
+        self.data = data
+        self.offset = offset
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        try:
+            res = fmt.unpack_from(self.data, self.offset)
+        except struct.error as e:
+            raise ProtocolError(f"truncated frame - {e}")
+        self.offset += fmt.size
+        return res
+
+    def string(self) -> str:
+        size, = self.unpack(STRING_SIZE)
+        if self.offset + size > len(self.data):
+            raise ProtocolError("truncated string")
+        res = self.data[self.offset:self.offset + size].decode()
+        self.offset += size
+        return res
+
+
+def encode_string(text: str) -> bytes:
+    encoded = text.encode()
+    return STRING_SIZE.pack(len(encoded)) + encoded
+
+
+def frame(payload: bytes) -> bytes:
+    return FRAME_SIZE.pack(len(payload)) + payload
+
+
+def encode_hello(host: str, secret: str) -> bytes:
+    return frame(FRAME_HELLO + FLAG.pack(PROTOCOL_VERSION) + encode_string(secret) + encode_string(host))
+
+
+def decode_hello(payload: bytes) -> tuple[str, str]:
+    """(host, secret)"""
+    decoder = Decoder(payload, 1)
+    version, = decoder.unpack(FLAG)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"unsupported protocol version {version}")
+    secret = decoder.string()
+    return decoder.string(), secret
+
+
+def encode_topology(topology: Topology) -> bytes:
+    parts = [FRAME_TOPOLOGY, COUNT.pack(len(topology))]
+    for group, sensors in topology:
+        parts.append(encode_string(group))
+        parts.append(COUNT.pack(len(sensors)))
+        for key, name, label, units, integral in sensors:
+            parts.append(FLAG.pack(integral))
+            parts.extend(encode_string(text) for text in (key, name, label, units))
+    return frame(b"".join(parts))
+
+
+def decode_topology(payload: bytes) -> Topology:
+    decoder = Decoder(payload, 1)
+    topology = []
+    for _ in range(decoder.unpack(COUNT)[0]):
+        group = decoder.string()
+        sensors = []
+        for _ in range(decoder.unpack(COUNT)[0]):
+            integral, = decoder.unpack(FLAG)
+            key, name, label, units = (decoder.string() for _ in range(4))
+            sensors.append((key, name, label, units, bool(integral)))
+        topology.append((group, sensors))
+    return topology
+
+
+def encode_sample(timestamp: float, stale: frozenset, fresh_mask: int, values: array) -> bytes:
+    parts = [FRAME_SAMPLE, SAMPLE_HEADER.pack(timestamp, fresh_mask), FLAG.pack(len(stale))]
+    parts.extend(encode_string(source) for source in sorted(stale))
+    parts.append(values.tobytes())
+    return frame(b"".join(parts))
+
+
+def decode_sample(payload: bytes) -> tuple[float, frozenset, int, array]:
+    """(timestamp, stale sources, fresh group mask, values)"""
+    decoder = Decoder(payload, 1)
+    timestamp, fresh_mask = decoder.unpack(SAMPLE_HEADER)
+    stale = frozenset(decoder.string() for _ in range(decoder.unpack(FLAG)[0]))
+    values = array('d')
+    raw = payload[decoder.offset:]
+    if len(raw) % values.itemsize:
+        raise ProtocolError("truncated values")
+    values.frombytes(raw)
+    return timestamp, stale, fresh_mask, values
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """next frame payload, None on a clean end of stream"""
+    try:
+        header = await reader.readexactly(FRAME_SIZE.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ProtocolError("truncated frame header")
+        return None
+    size, = FRAME_SIZE.unpack(header)
+    if size == 0 or size > MAX_FRAME_SIZE:
+        raise ProtocolError(f"invalid frame size {size}")
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        raise ProtocolError("truncated frame")
+
+
+def read_file_frame(fp) -> Optional[bytes]:
+    """next frame payload of a recording, None at its end, TruncatedFrame if it ends inside a frame"""
+    try:
+        header = fp.read(FRAME_SIZE.size)
+        if not header:
+            return None
+        if len(header) < FRAME_SIZE.size:
+            raise TruncatedFrame("truncated frame header")
+        size, = FRAME_SIZE.unpack(header)
+        if size == 0 or size > MAX_FRAME_SIZE:
+            raise ProtocolError(f"invalid frame size {size}")
+        payload = fp.read(size)
+    except EOFError as e:  # gzip stream without its end marker
+        raise TruncatedFrame(str(e)) from e
+    if len(payload) < size:
+        raise TruncatedFrame("truncated frame")
+    return payload
+
+
+def parse_address(address: str) -> tuple[Optional[str], Optional[str], int]:
+    """(unix socket path, host, port) from "unix:/path" or "host:port" """
+    if address.startswith("unix:"):
+        return address[len("unix:"):], None, 0
+    host, _, port = address.rpartition(":")
+    return None, host or "127.0.0.1", int(port)
@@ -0,0 +1,83 @@
+"""
+Streaming sensor statistics.
+
+Exponentially weighted mean, variance and slope of many series, each sample updates its
+series in O(1) without keeping history. Weights decay with the time between samples, a sample
+window seconds old weighs 1/e of a new one, so irregular sampling doesn't skew the stats.
+The slope is the weighted least squares fit of value over time on a shorter window, so a
+trend shows up within a fraction of the baseline window instead of being averaged away.
+"""
+
+import math
+from array import array
+from typing import Optional
+
+STATS_MIN_SAMPLES = 10  # slope, deviation and mean need a baseline before they are reported
+SLOPE_WINDOW_FRACTION = 0.25
+SIGMA_FLOOR = 0.5  # readings are quantized, a flat series would make any step look like many sigmas
+
+
+def _zeros(typecode: str, size: int) -> array:
+    return array(typecode, bytes(array(typecode).itemsize * size))
+
+
+class StreamingStats:
+    def __init__(self, size: int, window: float) -> None:
+        self.window = window
+        self.count = _zeros('l', size)
+        self.origin = _zeros('d', size)  # times are kept relative to the first sample for precision
+        self.last_time = _zeros('d', size)
+        self.mean = _zeros('d', size)
+        self.var = _zeros('d', size)
+        self.trend_mean = _zeros('d', size)  # mean over the slope window
+        self.time_mean = _zeros('d', size)
+        self.time_var = _zeros('d', size)
+        self.cov = _zeros('d', size)
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+    def deviation(self, i: int, value: float) -> Optional[float]:
+        """distance of value from the series mean in standard deviations, None until there is a baseline"""
+        if self.count[i] < STATS_MIN_SAMPLES:
+            return None
+        return abs(value - self.mean[i]) / max(math.sqrt(self.var[i]), SIGMA_FLOOR)
+
+    def sustained_mean(self, i: int) -> Optional[float]:
+        """series mean, None until there is a baseline spanning the window so one reading can't make it"""
+        if self.count[i] < STATS_MIN_SAMPLES or self.last_time[i] - self.origin[i] < self.window:
+            return None
+        return self.mean[i]
+
+    def slope(self, i: int) -> Optional[float]:
+        """value change per second, None until there is a baseline"""
+        if self.count[i] < STATS_MIN_SAMPLES or self.time_var[i] <= 0:
+            return None
+        return self.cov[i] / self.time_var[i]
+
+    def update(self, i: int, timestamp: float, value: float) -> None:
+        count = self.count[i]
+        if count == 0:
+            self.count[i] = 1
+            self.origin[i] = self.last_time[i] = timestamp
+            self.mean[i] = self.trend_mean[i] = value
+            return
+        elapsed = timestamp - self.last_time[i]
+        if elapsed <= 0:  # same snapshot seen again
+            return
+
+        alpha = 1.0 - math.exp(-elapsed / self.window)
+        diff = value - self.mean[i]
+        self.mean[i] += alpha * diff
+        self.var[i] = (1.0 - alpha) * (self.var[i] + alpha * diff * diff)
+
+        alpha = 1.0 - math.exp(-elapsed / (self.window * SLOPE_WINDOW_FRACTION))
+        time_diff = timestamp - self.origin[i] - self.time_mean[i]
+        diff = value - self.trend_mean[i]
+        self.time_mean[i] += alpha * time_diff
+        self.trend_mean[i] += alpha * diff
+        keep = 1.0 - alpha
+        self.time_var[i] = keep * (self.time_var[i] + alpha * time_diff * time_diff)
+        self.cov[i] = keep * (self.cov[i] + alpha * time_diff * diff)
+        self.last_time[i] = timestamp
+        self.count[i] = count + 1
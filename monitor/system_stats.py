@@ -0,0 +1,196 @@
+"""
+System load and resource usage.
+
+SystemCollector reports CPU usage per core, load averages, memory and swap, disk and network
+throughput and uptime as sensors of the system source. Usage and rates are computed from the
+counters cached by the previous readout, nothing sleeps to measure an interval; a counter seen
+for the first time is reported from the next readout on.
+
+ProcessTable backs the /top command. psutil.Process objects are kept between calls, so a
+process is only read through oneshot() for its CPU times and memory, its name is read once,
+and CPU percent is the share of the time since the previous call. A pid whose creation time
+changed belongs to a new process and starts over.
+"""
+
+import heapq
+import os
+import threading
+import time
+from typing import Optional
+import psutil
+from monitor.sensor_registry import Readings, sensor_registry
+
+NAME_CPU = "cpu"
+NAME_LOAD = "load"
+NAME_MEMORY = "memory"
+NAME_SYSTEM = "system"
+DISK_PREFIX = "disk "
+NIC_PREFIX = "net "
+VIRTUAL_DISKS = ("loop", "ram", "zram", "dm-")
+# container and VM interfaces come and go with their guests, each would add sensors for good
+VIRTUAL_NICS = ("lo", "veth", "br-", "docker", "virbr", "vnet", "tap", "cali", "flannel", "cni")
+SYSFS_BLOCK_ROOT = "/sys/block"
+MIB = 1024 * 1024
+KIB = 1024
+
+
+def _idle_time(times) -> float:
+    """idle and iowait count as idle, as in psutil.cpu_percent"""
+    return times.idle + getattr(times, "iowait", 0.0)
+
+
+def _total_time(times) -> float:
+    """guest time is already part of user and nice time"""
+    return sum(times) - getattr(times, "guest", 0.0) - getattr(times, "guest_nice", 0.0)
+
+
+class SystemCollector:
+    def __init__(self, block_root: str = SYSFS_BLOCK_ROOT) -> None:
+        self.block_root = block_root
+        self.cpu_times: list = []
+        self.disk_counters: dict[str, tuple[int, int]] = {}
+        self.nic_counters: dict[str, tuple[int, int]] = {}
+        self.read_at = 0.0
+        self.is_disk: dict[str, bool] = {}  # psutil reports partitions next to whole disks
+        self._lock = threading.Lock()
+
+    def _is_disk(self, name: str) -> bool:
+        is_disk = self.is_disk.get(name)
+        if is_disk is None:
+            is_disk = self.is_disk[name] = (not name.startswith(VIRTUAL_DISKS)
+                                            and os.path.exists(os.path.join(self.block_root, name)))
+        return is_disk
+
+    def _read_cpu(self, ids: list, values: list) -> None:
+        cpu_times = psutil.cpu_times(percpu=True)
+        if len(cpu_times) == len(self.cpu_times):
+            busy_total = 0.0
+            all_total = 0.0
+            for core, (times, previous) in enumerate(zip(cpu_times, self.cpu_times)):
+                idle = _idle_time(times) - _idle_time(previous)
+                total = _total_time(times) - _total_time(previous)
+                busy = max(total - idle, 0.0)
+                busy_total += busy
+                all_total += total
+                ids.append(sensor_registry.intern(NAME_CPU, f"core{core}", "%"))
+                values.append(round(100 * busy / total, 1) if total > 0 else 0.0)
+            ids.append(sensor_registry.intern(NAME_CPU, "total", "%"))
+            values.append(round(100 * busy_total / all_total, 1) if all_total > 0 else 0.0)
+        self.cpu_times = cpu_times
+
+    @staticmethod
+    def _read_rates(name_prefix: str, labels: tuple[str, str], counters: dict[str, tuple[int, int]],
+                    previous: dict[str, tuple[int, int]], elapsed: float, ids: list, values: list) -> None:
+        """KiB/s of both counters of each device since the previous readout"""
+        for device, (first, second) in counters.items():
+            last = previous.get(device)
+            if last is None or elapsed <= 0:
+                continue
+            # counters wrap or reset with the device, report 0 rather than a negative rate
+            ids.append(sensor_registry.intern(name_prefix + device, labels[0], "KiB/s"))
+            values.append(round(max(first - last[0], 0) / KIB / elapsed, 1))
+            ids.append(sensor_registry.intern(name_prefix + device, labels[1], "KiB/s"))
+            values.append(round(max(second - last[1], 0) / KIB / elapsed, 1))
+
+    def readings(self) -> Readings:
+        with self._lock:
+            ids = []
+            values = []
+            now = time.monotonic()
+            elapsed = now - self.read_at
+            self.read_at = now
+
+            self._read_cpu(ids, values)
+            for label, load in zip(("1m", "5m", "15m"), psutil.getloadavg()):
+                ids.append(sensor_registry.intern(NAME_LOAD, label, ""))
+                values.append(round(load, 2))
+
+            memory = psutil.virtual_memory()
+            swap = psutil.swap_memory()
+            for label, value, units, integral in (("used", memory.percent, "%", False),
+                                                  ("available", memory.available // MIB, "MiB", True),
+                                                  ("swap used", swap.percent, "%", False)):
+                ids.append(sensor_registry.intern(NAME_MEMORY, label, units, integral=integral))
+                values.append(value)
+
+            disks = psutil.disk_io_counters(perdisk=True) or {}
+            disk_counters = {name: (counters.read_bytes, counters.write_bytes)
+                             for name, counters in disks.items() if self._is_disk(name)}
+            self._read_rates(DISK_PREFIX, ("read", "write"), disk_counters, self.disk_counters, elapsed, ids, values)
+            self.disk_counters = disk_counters
+
+            nics = psutil.net_io_counters(pernic=True) or {}
+            nic_counters = {name: (counters.bytes_recv, counters.bytes_sent)
+                            for name, counters in nics.items() if not name.startswith(VIRTUAL_NICS)}
+            self._read_rates(NIC_PREFIX, ("rx", "tx"), nic_counters, self.nic_counters, elapsed, ids, values)
+            self.nic_counters = nic_counters
+
+            ids.append(sensor_registry.intern(NAME_SYSTEM, "uptime", "h"))
+            values.append(round((time.time() - psutil.boot_time()) / 3600, 1))
+            ids.append(sensor_registry.intern(NAME_SYSTEM, "processes", "", integral=True))
+            values.append(len(psutil.pids()))
+            return tuple(ids), values
+
+
+class ProcessInfo:
+    __slots__ = ("process", "name", "create_time", "cpu_time", "cpu_percent", "rss")
+
+    def __init__(self, process: psutil.Process, name: str) -> None:
+        self.process = process
+        self.name = name
+        self.create_time = process.create_time()
+        self.cpu_time: Optional[float] = None
+        self.cpu_percent = 0.0
+        self.rss = 0
+
+
+class ProcessTable:
+    def __init__(self) -> None:
+        self.processes: dict[int, ProcessInfo] = {}
+        self.read_at = 0.0
+        self._lock = threading.Lock()
+
+    def _get_info(self, pid: int) -> Optional[ProcessInfo]:
+        info = self.processes.get(pid)
+        try:
+            process = psutil.Process(pid)
+            if info is None or process.create_time() != info.create_time:
+                # new process, or the pid was reused by one
+                info = self.processes[pid] = ProcessInfo(process, process.name())
+        except psutil.Error:
+            self.processes.pop(pid, None)
+            return None
+        return info
+
+    def update(self) -> None:
+        """CPU percent of every process since the previous update, or over its lifetime if it is new"""
+        now = time.monotonic()
+        elapsed = now - self.read_at
+        self.read_at = now
+        pids = set(psutil.pids())
+        for pid in self.processes.keys() - pids:
+            del self.processes[pid]
+        for pid in pids:
+            info = self._get_info(pid)
+            if info is None:
+                continue
+            try:
+                with info.process.oneshot():
+                    times = info.process.cpu_times()
+                    info.rss = info.process.memory_info().rss
+                    cpu_time = times.user + times.system
+                    if info.cpu_time is None:
+                        lifetime = max(time.time() - info.create_time, 1.0)
+                        info.cpu_percent = 100 * cpu_time / lifetime
+                    else:
+                        info.cpu_percent = 100 * (cpu_time - info.cpu_time) / elapsed if elapsed > 0 else 0.0
+                    info.cpu_time = cpu_time
+            except psutil.Error:  # exited or not accessible
+                self.processes.pop(pid, None)
+
+    def top(self, count: int) -> list[tuple[int, str, float, int]]:
+        """(pid, name, CPU percent of one core, RSS bytes) of the busiest processes"""
+        with self._lock:
+            self.update()
+            busiest = heapq.nlargest(count, self.processes.items(), key=lambda item: item[1].cpu_percent)
+            return [(pid, info.name, round(info.cpu_percent, 1), info.rss) for pid, info in busiest]
@@ -0,0 +1,32 @@
+"""Bot API request and rate limiter timing, recorded in the shared latency stats."""
+
+import time
+from telegram.ext import AIORateLimiter
+from telegram.request import HTTPXRequest
+from monitor.instrumentation import stats
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """Bot API round trip latency"""
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            stats.observe(f"telegram.{url.rsplit('/', 1)[-1]}", time.perf_counter() - start)
+
+
+class InstrumentedRateLimiter(AIORateLimiter):
+    """time a request waited in the rate limiter before it was sent"""
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        start = time.perf_counter()
+        waited = False
+
+        async def timed_callback(*callback_args, **callback_kwargs):
+            nonlocal waited
+            if not waited:
+                waited = True
+                stats.observe("telegram.rate_limit_wait", time.perf_counter() - start)
+            return await callback(*callback_args, **callback_kwargs)
+
+        return await super().process_request(timed_callback, args, kwargs, endpoint, data, rate_limit_args)
@@ -0,0 +1,125 @@
+"""
+Adaptive sensor watch scheduling.
+
+With WATCH_SCHEDULE = adaptive the fixed sampler and sensor watch jobs are replaced by a single
+job that reschedules itself. Every rule gets a check interval between WATCH_INTERVAL_MIN and
+WATCH_INTERVAL_MAX: the shortest when its metric fails or is near a bound, shorter the faster
+the metric heads toward a bound, the longest when it is far away and stable. A source is read
+on the shortest interval of the rules watching its sensors, so due sensors cost one collector
+call per source. Sources no rule references are not read by the watcher, commands and auto
+refresh still read them on demand.
+"""
+
+import math
+import time
+from typing import Optional
+from telegram.ext import CallbackContext
+from monitor.bot_utils import config
+from monitor.instrumentation import stats
+from monitor.sensor_sampler import sensor_sampler, SensorSnapshot, SENSOR_SOURCES
+from monitor.sensor_watch import RuleTable, sensor_action_config, check_sensors, SENSOR_WATCH_JOB_NAME
+
+SOURCE_OF_GROUP = {group: source for source, (_, groups) in SENSOR_SOURCES.items() for group in groups}
+NEAR_BOUND_FRACTION = 0.1  # of the bound, at least 1 unit
+LEAD_FACTOR = 0.25  # checks before a trend would reach the bound
+DUE_SLACK = 0.05
+
+
+class WatchScheduler:
+    def __init__(self) -> None:
+        self.rules: Optional[RuleTable] = None
+        self.due: dict[str, float] = {}  # source: monotonic time of its next read
+        self.previous: list[tuple[float, float]] = []  # (metric, time) of each rule at its previous check
+        self._source_of: tuple[tuple, dict[int, str]] = ((), {})
+
+    def reset(self, rules: RuleTable) -> None:
+        """plan anew from a full read after rules change"""
+        self.rules = rules
+        self.previous = [(math.nan, 0.0)] * len(rules)
+        self.due = dict.fromkeys(SENSOR_SOURCES, 0.0) if len(rules) else {}
+
+    def get_source_of(self, snapshot: SensorSnapshot) -> dict[int, str]:
+        """{sensor id: source}, rebuilt only when the snapshot topology changes"""
+        key = tuple(snapshot.groups.items())
+        if key != self._source_of[0]:
+            self._source_of = (key, {sensor_id: SOURCE_OF_GROUP[group] for group, ids in key for sensor_id in ids})
+        return self._source_of[1]
+
+    def get_rule_interval(self, rules: RuleTable, rule_i: int, now: float) -> float:
+        metric = rules.metrics[rule_i]
+        previous, previous_time = self.previous[rule_i]
+        self.previous[rule_i] = (metric, now)
+        if metric != metric:  # not checked yet
+            return config.watch_interval_max
+
+        low, high = rules.low[rule_i], rules.high[rule_i]
+        margin = min(metric - low, high - metric)
+        bound = high if high - metric < metric - low else low
+        if margin <= 0 or rules.failed[rule_i] or margin <= NEAR_BOUND_FRACTION * max(abs(bound), 1.0):
+            return config.watch_interval_min
+
+        interval = config.watch_interval_max
+        if previous == previous and now > previous_time:
+            speed = (metric - previous) / (now - previous_time)
+            toward_bound = speed if bound == high else -speed
+            if toward_bound > 0:
+                interval = min(interval, LEAD_FACTOR * margin / toward_bound)
+        return max(interval, config.watch_interval_min)
+
+    def plan(self, rules: RuleTable, snapshot: SensorSnapshot, read: list[str], now: float) -> None:
+        """next read of the sources read by this check, from the rules watching their sensors"""
+        source_of = self.get_source_of(snapshot)
+        by_key = snapshot.registry.by_key
+        intervals: dict[str, float] = {}
+        for rule_i, sensor_i in enumerate(rules.sensor_index):
+            source = source_of.get(by_key.get(rules.sensor_names[sensor_i]))
+            if source is None:
+                # sensor not found yet, keep looking for it in every source
+                for source in SENSOR_SOURCES:
+                    intervals[source] = min(intervals.get(source, math.inf), config.watch_interval_max)
+            elif source in read:
+                intervals[source] = min(intervals.get(source, math.inf), self.get_rule_interval(rules, rule_i, now))
+
+        for source in read:
+            if source in intervals:
+                self.due[source] = now + intervals[source]
+            else:
+                self.due.pop(source, None)
+        for source, interval in intervals.items():
+            self.due.setdefault(source, now + interval)
+
+    def next_delay(self) -> float:
+        if not self.due:
+            return config.watch_interval_max  # only to pick up rule changes
+        return max(0.0, min(self.due.values()) - time.monotonic())
+
+    async def tick(self, context: CallbackContext) -> bool:
+        """read due sources and check rules on them, False if nothing was checked"""
+        rules = sensor_action_config.rules
+        if rules is not self.rules:
+            self.reset(rules)
+        now = time.monotonic()
+        due = [source for source, due_at in self.due.items() if due_at <= now + DUE_SLACK]
+        if not due:
+            return False
+
+        # no fixed period to drift from, drift is how late the earliest due source is read
+        stats.observe("job.sensor_watch.drift", max(0.0, now - min(self.due[source] for source in due)))
+        snapshot = await sensor_sampler.sample(due)
+        checked = await check_sensors(context.bot, snapshot)
+        self.plan(rules, snapshot, due, time.monotonic())
+        return checked
+
+
+async def on_watch_tick(context: CallbackContext):
+    start = time.perf_counter()
+    checked = True  # a failed check still counts as one
+    try:
+        checked = await watch_scheduler.tick(context)
+    finally:
+        # ticks with nothing due only look at the schedule, they are kept apart from check latencies
+        stats.observe("job.sensor_watch" if checked else "job.sensor_watch.idle", time.perf_counter() - start)
+        context.job_queue.run_once(on_watch_tick, watch_scheduler.next_delay(), name=SENSOR_WATCH_JOB_NAME)
+
+
+watch_scheduler = WatchScheduler()
@@ -0,0 +1,97 @@
+"""Fake /sys/class/hwmon, /sys/class/drm and /sys/block md trees for tests and benchmarks."""
+
+import os
+import random
+from monitor.mdstat import parse_mdstat
+
+MDSTAT_FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "mdstat")
+
+
+def build_hwmon_tree(root: str, chips: int, temps_per_chip: int, fans_per_chip: int, seed: int = 0) -> int:
+    """populate root with hwmon chips, returns number of inputs created"""
+    rnd = random.Random(seed)
+    inputs = 0
+    for chip_i in range(chips):
+        chip_dir = os.path.join(root, f"hwmon{chip_i}")
+        os.makedirs(chip_dir, exist_ok=True)
+        with open(os.path.join(chip_dir, "name"), "w") as fp:
+            fp.write(f"chip{chip_i % max(1, chips // 2)}\n")  # some chips share a name, like nvme
+        for temp_i in range(1, temps_per_chip + 1):
+            with open(os.path.join(chip_dir, f"temp{temp_i}_input"), "w") as fp:
+                fp.write(f"{rnd.randint(25000, 90000)}\n")
+            if temp_i % 2:
+                with open(os.path.join(chip_dir, f"temp{temp_i}_label"), "w") as fp:
+                    fp.write(f"Core {temp_i}\n")
+            inputs += 1
+        for fan_i in range(1, fans_per_chip + 1):
+            with open(os.path.join(chip_dir, f"fan{fan_i}_input"), "w") as fp:
+                fp.write(f"{rnd.randint(500, 3000)}\n")
+            inputs += 1
+    return inputs
+
+
+def build_amdgpu_tree(root: str, cards: int, seed: int = 0) -> dict[str, dict[str, int]]:
+    """
+    populate root like /sys/class/drm with amdgpu cards, their connectors and one card of
+    another driver, returns the raw values written by card and file
+    """
+    rnd = random.Random(seed)
+    written = {}
+
+    def write(path: str, value) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fp:
+            fp.write(f"{value}\n")
+
+    for card_i in range(cards + 1):
+        card = f"card{card_i}"
+        device = os.path.join(root, card, "device")
+        os.makedirs(os.path.join(root, f"{card}-DP-{card_i + 1}"), exist_ok=True)
+        if card_i == cards:  # integrated GPU of another vendor
+            write(os.path.join(device, "hwmon", f"hwmon{card_i + 10}", "name"), "i915")
+            write(os.path.join(device, "hwmon", f"hwmon{card_i + 10}", "temp1_input"), 45000)
+            break
+        hwmon_dir = os.path.join(device, "hwmon", f"hwmon{card_i + 10}")
+        values = {
+            "temp1_input": rnd.randint(30000, 70000),
+            "temp2_input": rnd.randint(40000, 90000),
+            "temp3_input": rnd.randint(40000, 90000),
+            "pwm1": rnd.randint(0, 255),
+            "fan1_input": rnd.randint(0, 3000),
+            "power1_average": rnd.randint(10, 300) * 1000000 + rnd.randint(0, 999999),
+            "gpu_busy_percent": rnd.randint(0, 100)
+        }
+        write(os.path.join(hwmon_dir, "name"), "amdgpu")
+        for file_name, value in values.items():
+            write(os.path.join(device if file_name == "gpu_busy_percent" else hwmon_dir, file_name), value)
+        for temp_i, label in enumerate(("edge", "junction", "mem"), 1):
+            if card_i % 2 == 0:  # older kernels have no label files
+                write(os.path.join(hwmon_dir, f"temp{temp_i}_label"), label)
+        written[card] = values
+    return written
+
+
+def build_md_tree(root: str, mdstat_text: str) -> int:
+    """populate root like /sys/block with the md arrays of an mdstat text, returns number of arrays"""
+    arrays = parse_mdstat(mdstat_text)
+    for array in arrays:
+        md_dir = os.path.join(root, array.name, "md")
+        os.makedirs(md_dir, exist_ok=True)
+        for member in array.members:
+            os.makedirs(os.path.join(md_dir, f"dev-{member}"), exist_ok=True)
+        sync_action = array.sync_action
+        if sync_action == "idle":
+            completed = "none"
+        else:
+            completed = f"{int(array.sync_progress * 10)}/1000"
+        attributes = {
+            "array_state": array.state,
+            "degraded": str(array.values()["degraded"]),
+            "sync_action": sync_action,
+            "sync_completed": completed,
+            "sync_speed": str(array.sync_speed) if sync_action != "idle" else "none"
+        }
+        for attribute, value in attributes.items():
+            with open(os.path.join(md_dir, attribute), "w") as fp:
+                fp.write(f"{value}\n")
+    return len(arrays)
@@ -0,0 +1,77 @@
+import os
+import shutil
+import pytest
+from tests.fake_sysfs import build_amdgpu_tree
+from monitor.amdgpu import AmdGpuReader
+from monitor.sensor_registry import sensor_registry
+
+CARDS = 3
+SENSORS_PER_CARD = 7
+
+
+def expected_values(raw: dict[str, int]) -> dict[str, float]:
+    return {
+        "edge": round(raw["temp1_input"] / 1000),
+        "junction": round(raw["temp2_input"] / 1000),
+        "mem": round(raw["temp3_input"] / 1000),
+        "fan1": round(raw["pwm1"] * 100 / 255),
+        "fan1 speed": raw["fan1_input"],
+        "power": round(raw["power1_average"] / 1e6, 1),
+        "busy": raw["gpu_busy_percent"]
+    }
+
+
+def read_by_key(reader: AmdGpuReader) -> dict[str, float]:
+    return {sensor_registry.infos[sensor_id].key: value
+            for ids, values in reader.read() for sensor_id, value in zip(ids, values)}
+
+
+@pytest.fixture
+def drm_root(tmp_path):
+    root = tmp_path / "drm"
+    written = build_amdgpu_tree(str(root), CARDS)
+    return str(root), written
+
+
+@pytest.fixture
+def reader(drm_root):
+    reader = AmdGpuReader(drm_root[0])
+    yield reader
+    reader.close()
+
+
+def test_only_amdgpu_cards_are_read(reader, drm_root):
+    reader.read()
+    assert reader.cards == list(drm_root[1])
+
+
+def test_readings_match_sysfs(reader, drm_root):
+    values = read_by_key(reader)
+    assert len(values) == SENSORS_PER_CARD * CARDS
+    for card, raw in drm_root[1].items():
+        for label, value in expected_values(raw).items():
+            assert values[f"amdgpu {card}.{label}"] == value
+
+
+def test_readings_go_to_gpu_groups(reader):
+    temps, fans, stats = reader.read()
+    assert {sensor_registry.infos[sensor_id].units for sensor_id in temps[0]} == {"°C"}
+    assert {sensor_registry.infos[sensor_id].units for sensor_id in fans[0]} == {"%"}
+    assert {sensor_registry.infos[sensor_id].units for sensor_id in stats[0]} == {"RPM", "W", "%"}
+
+
+def test_temperature_labels_without_label_files(reader, drm_root):
+    # odd cards have no temp*_label files, labels fall back to edge, junction and mem
+    values = read_by_key(reader)
+    card = list(drm_root[1])[1]
+    assert {f"amdgpu {card}.edge", f"amdgpu {card}.junction", f"amdgpu {card}.mem"} <= values.keys()
+
+
+def test_rescan_when_a_card_goes(reader, drm_root):
+    root, written = drm_root
+    reader.read()
+    removed = list(written)[-1]
+    shutil.rmtree(os.path.join(root, removed))
+    values = read_by_key(reader)
+    assert reader.cards == list(written)[:-1]
+    assert not any(key.startswith(f"amdgpu {removed}.") for key in values)
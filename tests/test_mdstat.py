@@ -0,0 +1,98 @@
+import os
+import shutil
+import pytest
+from tests.fake_sysfs import build_md_tree, MDSTAT_FIXTURES_DIR
+from monitor.mdstat import MdstatReader, parse_mdstat, parse_attribute, ARRAY_STATES, SYNC_ACTIONS
+from monitor.sensor_registry import sensor_registry
+
+# fixture: {array: (state, degraded, sync action, sync progress, sync speed)}
+EXPECTED = {
+    "raid1_clean.txt": {
+        "md0": ("clean", 0, "idle", 100.0, 0)
+    },
+    "raid5_recovery.txt": {
+        "md1": ("clean", 1, "recover", 21.4, 157596),
+        "md0": ("clean", 1, "idle", 100.0, 0)
+    },
+    "mixed.txt": {
+        "md127": ("inactive", 0, "idle", 100.0, 0),
+        "md3": ("read-auto", 0, "resync", 0.0, 0),
+        "md2": ("clean", 0, "check", 7.9, 161042),
+        "md1": ("clean", 0, "idle", 100.0, 0)
+    }
+}
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(MDSTAT_FIXTURES_DIR, name)) as fp:
+        return fp.read()
+
+
+@pytest.fixture
+def md_host(tmp_path):
+    """mdstat path and md sysfs root of the mixed fixture"""
+    mdstat_path = str(tmp_path / "mdstat")
+    shutil.copyfile(os.path.join(MDSTAT_FIXTURES_DIR, "mixed.txt"), mdstat_path)
+    sysfs_root = str(tmp_path / "block")
+    build_md_tree(sysfs_root, read_fixture("mixed.txt"))
+    return mdstat_path, sysfs_root
+
+
+@pytest.mark.parametrize("name", EXPECTED)
+def test_parse_mdstat_fixture(name):
+    arrays = parse_mdstat(read_fixture(name))
+    assert [array.name for array in arrays] == list(EXPECTED[name])
+    for array in arrays:
+        parsed = (array.state, array.values()["degraded"], array.sync_action, array.sync_progress, array.sync_speed)
+        assert parsed == EXPECTED[name][array.name]
+
+
+def test_parse_attribute():
+    assert parse_attribute("state", "active\n") == ARRAY_STATES.index("active")
+    assert parse_attribute("sync action", "recover\n") == SYNC_ACTIONS.index("recover")
+    assert parse_attribute("sync progress", "none\n") == 100.0
+    assert parse_attribute("sync progress", "delayed\n") == 0.0
+    assert parse_attribute("sync progress", "250/1000\n") == 25.0
+    assert parse_attribute("sync speed", "none\n") == 0
+    assert parse_attribute("degraded", "1\n") == 1
+    assert parse_attribute("state", "unknown\n") is None
+
+
+def test_sysfs_readings_match_mdstat(md_host, tmp_path):
+    mdstat_path, sysfs_root = md_host
+    reader = MdstatReader(mdstat_path, sysfs_root)
+    mdstat_reader = MdstatReader(mdstat_path, str(tmp_path / "missing"))
+    try:
+        assert reader.readings() == mdstat_reader.readings()
+    finally:
+        reader.close()
+        mdstat_reader.close()
+
+
+def test_mdstat_parsed_only_on_membership_change(md_host):
+    mdstat_path, sysfs_root = md_host
+    reader = MdstatReader(mdstat_path, sysfs_root)
+    try:
+        ids, _ = reader.readings()
+        for _ in range(3):
+            reader.readings()
+        assert reader.parse_count == 1
+
+        md_dir = os.path.join(sysfs_root, sensor_registry.infos[ids[0]].name, "md")
+        member = next(entry for entry in os.listdir(md_dir) if entry.startswith("dev-"))
+        shutil.rmtree(os.path.join(md_dir, member))
+        reader.readings()
+        assert reader.parse_count == 2
+    finally:
+        reader.close()
+
+
+def test_mdstat_only_host_is_parsed_every_readout(md_host, tmp_path):
+    mdstat_path, _ = md_host
+    reader = MdstatReader(mdstat_path, str(tmp_path / "missing"))
+    try:
+        for _ in range(3):
+            reader.readings()
+        assert reader.parse_count == 3
+    finally:
+        reader.close()
@@ -0,0 +1,30 @@
+import math
+from monitor.hub import HostState
+from monitor.metrics_exporter import encode_metrics
+from monitor.sensor_watch import Action, Condition, ConfigEntry, RuleTable
+
+SENSORS = [("chip0.core 0", "chip0", "core 0", "°C", False), ("chip0.core 1", "chip0", "core 1", "°C", False),
+           ("chip0.core 2", "chip0", "core 2", "°C", False), ("chip0.fan1", "chip0", "fan1", "RPM", True)]
+
+
+def get_lines() -> list[str]:
+    host = HostState("test")
+    host.set_topology([("temperatures", SENSORS[:3]), ("fans", SENSORS[3:])])
+    host.add_sample(1, frozenset(), 1, [math.nan, math.inf, -math.inf, math.inf])
+    rules = RuleTable([ConfigEntry("chip0.core 0", Action.Notify, Condition.Less, "80"),
+                       ConfigEntry("chip0.core 0", Action.Notify, Condition.More, "10")], bind=False)
+    return encode_metrics(host.snapshot, rules).decode().splitlines()
+
+
+def test_non_finite_readings_use_openmetrics_values():
+    values = {line.rsplit(" ", 1)[0]: line.rsplit(" ", 1)[1] for line in get_lines() if line.startswith("monitor_")}
+    assert values['monitor_temperature_celsius{chip="chip0",sensor="core 0",key="chip0.core 0"}'] == "NaN"
+    assert values['monitor_temperature_celsius{chip="chip0",sensor="core 1",key="chip0.core 1"}'] == "+Inf"
+    assert values['monitor_temperature_celsius{chip="chip0",sensor="core 2",key="chip0.core 2"}'] == "-Inf"
+    assert values['monitor_fan_speed_rpm{chip="chip0",sensor="fan1",key="chip0.fan1"}'] == "+Inf"
+
+
+def test_series_are_unique():
+    series = [line.rsplit(" ", 1)[0] for line in get_lines() if not line.startswith("#")]
+    assert len(series) == len(set(series))
+    assert 'monitor_rule_triggered{sensor="chip0.core 0",rule="1"}' in series
@@ -0,0 +1,27 @@
+import math
+import pytest
+from monitor.hub import HostState
+from monitor.readout import get_fingerprint, get_layout
+
+SENSORS = [("chip0.core 0", "chip0", "core 0", "°C", False), ("chip0.fan1", "chip0", "fan1", "RPM", True)]
+
+
+@pytest.fixture
+def host():
+    host = HostState("test")
+    host.set_topology([("temperatures", SENSORS[:1]), ("fans", SENSORS[1:])])
+    return host
+
+
+def get_snapshot(host: HostState, timestamp: float, values: list[float]):
+    host.add_sample(timestamp, frozenset(), 1, values)
+    return host.snapshot
+
+
+@pytest.mark.parametrize("value", [math.nan, math.inf, -math.inf])
+def test_non_finite_readings_render_and_fingerprint(host, value):
+    snapshot = get_snapshot(host, 1, [value, value])
+    assert str(value) in get_layout(snapshot).render(snapshot, 0)
+    fingerprint = get_fingerprint(snapshot, False)
+    assert get_fingerprint(get_snapshot(host, 2, [value, value]), False) == fingerprint
+    assert get_fingerprint(get_snapshot(host, 3, [50.0, 1000.0]), False) != fingerprint
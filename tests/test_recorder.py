@@ -0,0 +1,51 @@
+import gzip
+from array import array
+import pytest
+from monitor.recorder import RECORDING_MAGIC, get_report, replay
+from monitor.sensor_watch import Action, Condition, ConfigEntry, RuleTable
+from monitor.snapshot_protocol import encode_sample, encode_topology
+
+SENSOR = "chip0.core 0"
+SNAPSHOTS = 20
+HOT_FROM = 10  # readings reach 90 from this snapshot on
+
+
+def write_recording(path: str) -> None:
+    data = RECORDING_MAGIC + encode_topology([("temperatures", [(SENSOR, "chip0", "core 0", "°C", False)])])
+    for snapshot_i in range(SNAPSHOTS):
+        data += encode_sample(1000.0 + snapshot_i, frozenset(), 1, array('d', [90.0 if snapshot_i >= HOT_FROM else 50.0]))
+    with (gzip.open(path, "wb") if path.endswith(".gz") else open(path, "wb")) as fp:
+        fp.write(data)
+
+
+def get_rules() -> RuleTable:
+    return RuleTable([ConfigEntry(SENSOR, Action.Notify, Condition.Less, "80")], bind=False)
+
+
+@pytest.mark.parametrize("name", ["recording.rec", "recording.rec.gz"])
+def test_replay_reports_firing(tmp_path, name):
+    path = str(tmp_path / name)
+    write_recording(path)
+    result = replay(path, get_rules(), threshold=2, watch_interval=1)
+    assert result.snapshots == SNAPSHOTS and not result.truncated
+    assert [(firing.timestamp, firing.value) for firing in result.firings] == [(1000.0 + HOT_FROM + 1, 90.0)]
+
+
+@pytest.mark.parametrize("name", ["cut.rec", "cut.rec.gz"])
+def test_truncated_recording_replays_complete_snapshots(tmp_path, name):
+    path = str(tmp_path / name)
+    write_recording(path)
+    if name.endswith(".gz"):
+        with open(path, "rb") as fp:
+            data = fp.read()
+        with open(path, "wb") as fp:
+            fp.write(data[:-12])  # killed recorder, gzip stream without its end
+    else:
+        with open(path, "r+b") as fp:
+            fp.truncate(fp.seek(0, 2) - 5)  # last frame half written
+
+    rules = get_rules()
+    result = replay(path, rules, threshold=2, watch_interval=1)
+    assert result.truncated
+    assert 0 < result.snapshots < SNAPSHOTS
+    assert get_report(result, rules).startswith("recording is truncated")
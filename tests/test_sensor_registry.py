@@ -0,0 +1,31 @@
+import sys
+import threading
+from monitor.sensor_registry import SensorRegistry
+
+THREADS = 8
+SENSORS = 2000
+
+
+def test_concurrent_intern_gives_unique_ids():
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible
+    registry = SensorRegistry()
+    ids = [[] for _ in range(THREADS)]
+
+    def intern(thread_i: int) -> None:
+        for sensor_i in range(SENSORS):
+            ids[thread_i].append(registry.intern(f"chip{sensor_i % 100}", f"input{sensor_i}", "°C"))
+
+    try:
+        threads = [threading.Thread(target=intern, args=(thread_i,)) for thread_i in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert len(registry) == SENSORS
+    assert all(thread_ids == ids[0] for thread_ids in ids)
+    assert [info.id for info in registry.infos] == list(range(SENSORS))
+    assert all(registry.by_key[info.key] == info.id for info in registry.infos)
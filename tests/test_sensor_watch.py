@@ -0,0 +1,39 @@
+import pytest
+from monitor.hub import HostState
+from monitor.sensor_watch import Action, Condition, ConfigEntry, RuleTable
+
+SENSOR = "chip0.core 0"
+THRESHOLD = 2
+
+
+@pytest.fixture
+def host():
+    host = HostState("test")
+    host.set_topology([("temperatures", [(SENSOR, "chip0", "core 0", "°C", False)])])
+    return host
+
+
+def check(rules: RuleTable, host: HostState, timestamp: float, value: float) -> list[int]:
+    """rules that fire on a reading, as the watch job, hub and replay see it"""
+    host.add_sample(timestamp, frozenset(), 1, [value])
+    return [rule_i for rule_i, _ in rules.evaluate_rules(host.snapshot, THRESHOLD) if rules.fire(rule_i)]
+
+
+def test_rule_fires_once_until_value_recovers(host):
+    rules = RuleTable([ConfigEntry(SENSOR, Action.Notify, Condition.Less, "80")], bind=False)
+    assert check(rules, host, 1, 85) == []  # below threshold
+    assert check(rules, host, 2, 85) == [0]
+    assert check(rules, host, 3, 90) == []
+    assert check(rules, host, 4, 90) == []
+    assert check(rules, host, 5, 60) == []  # recovered
+    assert check(rules, host, 6, 85) == []
+    assert check(rules, host, 7, 85) == [0]
+
+
+def test_bound_entry_triggers_through_its_rule_table():
+    entry = ConfigEntry(SENSOR, Action.Notify, Condition.Less, "80")
+    rules = RuleTable([entry])
+    assert entry.trigger_action(85) is not None
+    assert entry.triggered and entry.failed_condition_num == 0
+    assert entry.trigger_action(85) is None
+    assert not rules.fire(0)
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import signal
+import socket
+import httpx
+import pytest
+from telegram import Bot, Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest
+from monitor import __main__ as bot_main
+from monitor.bot_utils import config, UPDATE_MODE_WEBHOOK, WEBHOOK_SECRET_HEADER
+
+TOKEN = "123456:TEST"
+SECRET = "test-secret"
+WEBHOOK_PATH = "webhook"
+STARTUP_TIMEOUT = 10
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "monitor", "username": "monitor_test_bot"}
+UPDATE = {"update_id": 1001,
+          "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "/start"}}
+
+
+class FakeBotApi(BaseRequest):
+    """answers Bot API calls locally, setWebhook fails if asked to"""
+    def __init__(self, fail_set_webhook: bool = False) -> None:
+        self.fail_set_webhook = fail_set_webhook
+        self.methods: list[str] = []
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        self.methods.append(api_method)
+        if api_method == "setWebhook" and self.fail_set_webhook:
+            return 400, json.dumps({"ok": False, "error_code": 400, "description": "Bad Request: bad webhook"}).encode()
+        if api_method == "getUpdates":
+            await asyncio.sleep(0.05)  # a long poll that timed out
+            return 200, json.dumps({"ok": True, "result": []}).encode()
+        result = BOT_USER if api_method == "getMe" else True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def webhook_config(monkeypatch):
+    port = get_free_port()
+    monkeypatch.setattr(config, "update_mode", UPDATE_MODE_WEBHOOK)
+    monkeypatch.setattr(config, "webhook_url", f"https://monitor.invalid/{WEBHOOK_PATH}")
+    monkeypatch.setattr(config, "webhook_path", WEBHOOK_PATH)
+    monkeypatch.setattr(config, "webhook_listen", "127.0.0.1")
+    monkeypatch.setattr(config, "webhook_port", port)
+    monkeypatch.setattr(config, "webhook_secret", SECRET)
+    return f"http://127.0.0.1:{port}/{WEBHOOK_PATH}"
+
+
+def build_application(api: FakeBotApi, post_init=None, post_shutdown=None) -> Application:
+    builder = Application.builder().bot(Bot(TOKEN, request=api, get_updates_request=api))
+    if post_init is not None:
+        builder = builder.post_init(post_init)
+    if post_shutdown is not None:
+        builder = builder.post_shutdown(post_shutdown)
+    return builder.build()
+
+
+def test_webhook_checks_secret_token(webhook_config):
+    received = []
+    statuses = {}
+
+    async def post_updates(application: Application) -> None:
+        """once the listener is up, post as Telegram does, then stop the bot like SIGINT does"""
+        try:
+            async with httpx.AsyncClient() as client:
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + STARTUP_TIMEOUT
+                while True:
+                    try:
+                        res = await client.post(webhook_config, json=UPDATE, headers={WEBHOOK_SECRET_HEADER: SECRET})
+                        break
+                    except httpx.TransportError:
+                        if loop.time() > deadline:
+                            raise
+                        await asyncio.sleep(0.05)
+                statuses["right"] = res.status_code
+                res = await client.post(webhook_config, json=dict(UPDATE, update_id=1002),
+                                        headers={WEBHOOK_SECRET_HEADER: "wrong"})
+                statuses["wrong"] = res.status_code
+                res = await client.post(webhook_config, json=dict(UPDATE, update_id=1003))
+                statuses["missing"] = res.status_code
+            while not received and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            signal.raise_signal(signal.SIGINT)
+
+    async def on_post_init(application: Application) -> None:
+        asyncio.get_running_loop().create_task(post_updates(application))
+
+    async def on_update(update: Update, context) -> None:
+        received.append(update.update_id)
+
+    api = FakeBotApi()
+    application = build_application(api, on_post_init)
+    application.add_handler(TypeHandler(Update, on_update))
+    bot_main.run_updates(application)
+
+    assert "setWebhook" in api.methods
+    assert statuses == {"right": 200, "wrong": 403, "missing": 403}
+    assert received == [UPDATE["update_id"]]
+
+
+def test_webhook_failure_falls_back_to_polling(webhook_config):
+    hooks = []
+
+    async def stop_when_polled(api: FakeBotApi) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + STARTUP_TIMEOUT
+            while "getUpdates" not in api.methods and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            signal.raise_signal(signal.SIGINT)
+
+    async def on_post_init(application: Application) -> None:
+        hooks.append("post_init")
+        asyncio.get_running_loop().create_task(stop_when_polled(api))
+
+    async def on_post_shutdown(application: Application) -> None:
+        hooks.append("post_shutdown")
+
+    api = FakeBotApi(fail_set_webhook=True)
+    bot_main.run_updates(build_application(api, on_post_init, on_post_shutdown))
+
+    assert "setWebhook" in api.methods and "getUpdates" in api.methods
+    assert hooks == ["post_init", "post_shutdown"]